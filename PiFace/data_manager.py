@@ -1,6 +1,7 @@
 import cv2
 import os
 import shutil
+import numpy as np
 import face_utils
 
 DATASET_DIR = "dataset"
@@ -24,30 +25,34 @@ def add_new_person():
 
     cap = cv2.VideoCapture(0)
     count = 0
+    frame = None     # Buffer frame kamera, dipakai ulang oleh cap.read
+    tampilan = None  # Buffer tampilan untuk overlay, supaya frame tetap bersih untuk disimpan
 
     while count < SAMPLES_PER_PERSON:
-        ret, frame = cap.read()
+        ret, frame = cap.read(frame)
         if not ret:
             print("Gagal membaca frame dari kamera.")
             break
 
-        frame_copy = frame.copy()
-        detections = face_utils.detect_faces(frame_copy)
+        detections = face_utils.detect_faces(frame)
 
         # Tampilan visual di layar
+        if tampilan is None or tampilan.shape != frame.shape:
+            tampilan = np.empty_like(frame)
+        np.copyto(tampilan, frame)
         status_text = f"Gambar {count}/{SAMPLES_PER_PERSON}"
-        cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        cv2.putText(tampilan, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         if detections:
-            box = face_utils.get_bounding_box(frame_copy, detections[0])
+            box = face_utils.get_bounding_box(frame, detections[0])
             if box:
                 x, y, w, h = box['xmin'], box['ymin'], box['width'], box['height']
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        cv2.imshow(f"Tambah Wajah: {person_name} - Tekan 's' untuk simpan", frame)
+                cv2.rectangle(tampilan, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.imshow(f"Tambah Wajah: {person_name} - Tekan 's' untuk simpan", tampilan)
 
         key = cv2.waitKey(1) & 0xFF
         if key == ord('s') and detections:
             img_path = os.path.join(person_path, f"{count}.jpg")
-            cv2.imwrite(img_path, frame_copy)
+            cv2.imwrite(img_path, frame)
             print(f"Gambar {count+1} disimpan.")
             count += 1
         elif key == ord('q'):
@@ -1,45 +1,226 @@
 import os
 import cv2
+import time
 import pickle
+import hashlib
+import tempfile
+import multiprocessing
+import numpy as np
 import face_utils
 
 DATASET_DIR = "dataset"
 ENCODINGS_FILE = "encodings.pkl"
+# Cache encoding per gambar, supaya menambah/menghapus satu orang tidak memproses ulang seluruh dataset
+CACHE_FILE = "encodings_cache.pkl"
+CACHE_VERSION = 1
+# Jumlah proses encoding paralel (0 = jumlah core CPU, 1 = tanpa pool)
+ENCODER_WORKERS = 0
+# Pool baru dipakai jika gambar yang perlu diproses minimal sebanyak ini (start-up worker tidak gratis)
+POOL_MIN_IMAGES = 32
 
-def regenerate_encodings():
-    """Memproses ulang semua gambar di dataset dan menyimpan ke file .pkl."""
-    print("Memulai proses encoding ulang...")
+def _atomic_pickle_dump(data, path):
+    """Tulis pickle ke file sementara di folder yang sama lalu os.replace (atomik)."""
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=folder)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
-    known_encodings = []
-    known_names = []
+def _cache_params():
+    # Encoding bergantung pada resolusi deteksi; cache lama tidak berlaku jika berubah
+    return {"version": CACHE_VERSION, "processing_width": face_utils.PROCESSING_WIDTH}
+
+def _load_cache():
+    """Cache {'params', 'people': {nama: {'signature', 'images': {file: entry}}}} atau cache kosong."""
+    empty = {"params": _cache_params(), "people": {}}
+    if not os.path.exists(CACHE_FILE):
+        return empty
+    try:
+        with open(CACHE_FILE, "rb") as f:
+            cache = pickle.load(f)
+    except Exception as e:
+        print(f"  [WARNING] Cache encoding tidak terbaca ({e}), semua gambar diproses ulang.")
+        return empty
+    if not isinstance(cache, dict) or cache.get("params") != _cache_params():
+        print("  [INFO] Pengaturan encoding berubah, cache lama diabaikan.")
+        return empty
+    return cache
+
+def _scan_person(person_path):
+    """Daftar gambar di folder orang: {nama file: (ukuran, mtime_ns)}, terurut."""
+    files = {}
+    for entry in sorted(os.scandir(person_path), key=lambda e: e.name):
+        if entry.is_file():
+            stat = entry.stat()
+            files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+def _file_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+def encode_image(image_path):
+    """
+    Deteksi wajah pertama di satu gambar dan kembalikan (encoding atau None, sha1 isi file).
+    File dibaca sekali: bytes yang sama dipakai untuk hash dan decode.
+    """
+    with open(image_path, "rb") as f:
+        data = f.read()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return None, _file_hash(data)
+    detections = face_utils.detect_faces(image)
+    encoding = face_utils.get_face_encoding(image, detections[0]) if detections else None
+    if encoding is not None:
+        encoding = np.asarray(encoding, dtype=np.float32)
+    return encoding, _file_hash(data)
+
+def _init_worker():
+    # Setiap worker punya detector MediaPipe sendiri; OpenCV satu thread per proses
+    cv2.setNumThreads(1)
+    face_utils.init_detector()
+
+def _encode_shard(shard):
+    start, paths = shard
+    return start, [encode_image(path) for path in paths]
+
+def _print_progress(done, total, t0):
+    elapsed = time.perf_counter() - t0
+    rate = done / elapsed if elapsed > 0 else 0.0
+    print(f"  [{done}/{total}] {rate:.1f} gambar/detik")
+
+def encode_images(paths, workers=ENCODER_WORKERS):
+    """
+    Encode daftar gambar, serial atau dengan pool proses. Dataset dibagi ke
+    shard berurutan; hasil digabung per posisi shard sehingga urutannya
+    selalu sama dengan `paths`, berapa pun jumlah worker.
+    Mengembalikan list (encoding atau None, sha1) sejajar dengan `paths`.
+    """
+    total = len(paths)
+    if not total:
+        return []
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, total)
+    t0 = time.perf_counter()
+
+    if workers <= 1 or total < POOL_MIN_IMAGES:
+        results = []
+        for path in paths:
+            results.append(encode_image(path))
+            if len(results) % 50 == 0:
+                _print_progress(len(results), total, t0)
+    else:
+        # Beberapa shard per worker supaya beban tetap rata jika ada folder yang lambat
+        shard_size = max(1, -(-total // (workers * 4)))
+        # Path absolut: worker spawn tidak harus berbagi direktori kerja dengan proses induk
+        abs_paths = [os.path.abspath(path) for path in paths]
+        shards = [(start, abs_paths[start:start + shard_size]) for start in range(0, total, shard_size)]
+        results = [None] * total
+        done = 0
+        print(f"  Encoding {total} gambar dengan {workers} proses ({len(shards)} shard)...")
+        # spawn: worker tidak mewarisi graph MediaPipe/thread milik proses induk
+        with multiprocessing.get_context("spawn").Pool(workers, initializer=_init_worker) as pool:
+            for start, shard_results in pool.imap_unordered(_encode_shard, shards):
+                results[start:start + len(shard_results)] = shard_results
+                done += len(shard_results)
+                _print_progress(done, total, t0)
+
+    elapsed = time.perf_counter() - t0
+    print(f"  {total} gambar di-encode dalam {elapsed:.1f} detik "
+          f"({total / elapsed if elapsed > 0 else 0.0:.1f} gambar/detik, {workers} proses).")
+    return results
+
+def _reuse_entry(image_path, stat, cached):
+    """
+    Entry cache masih berlaku jika ukuran & mtime sama, atau (mis. setelah
+    disalin ulang) ukuran sama dan isi file identik menurut hash.
+    """
+    if cached is None:
+        return None
+    size, mtime_ns = stat
+    if cached["size"] == size and cached["mtime_ns"] == mtime_ns:
+        return cached
+    if cached["size"] == size:
+        with open(image_path, "rb") as f:
+            if _file_hash(f.read()) == cached["sha1"]:
+                return {**cached, "mtime_ns": mtime_ns}
+    return None
+
+def regenerate_encodings(workers=ENCODER_WORKERS):
+    """
+    Memperbarui file .pkl dari dataset secara inkremental.
+    Folder yang isinya tidak berubah (nama file, ukuran, mtime) dipakai
+    langsung dari cache; di folder yang berubah hanya gambar baru/berubah
+    yang dideteksi ulang; folder yang dihapus ikut hilang dari cache.
+    Gambar yang perlu diproses di-encode sekaligus lewat encode_images
+    (pool proses jika `workers` > 1). File encoding dan cache ditulis secara atomik.
+    """
+    print("Memulai proses encoding ulang...")
 
     if not os.path.exists(DATASET_DIR) or not os.listdir(DATASET_DIR):
         print("Dataset kosong. File encoding tidak dibuat/dihapus.")
-        if os.path.exists(ENCODINGS_FILE):
-            os.remove(ENCODINGS_FILE)
+        for path in (ENCODINGS_FILE, CACHE_FILE):
+            if os.path.exists(path):
+                os.remove(path)
         return
 
-    for person_name in os.listdir(DATASET_DIR):
+    cache = _load_cache()
+    people = {}
+    pending = []  # (nama orang, nama file, path, (ukuran, mtime_ns)) yang perlu di-encode
+    reused = 0
+
+    for person_name in sorted(os.listdir(DATASET_DIR)):
         person_path = os.path.join(DATASET_DIR, person_name)
         if not os.path.isdir(person_path):
             continue
 
+        signature = _scan_person(person_path)
+        cached_person = cache["people"].get(person_name)
+        if cached_person and cached_person["signature"] == signature:
+            people[person_name] = cached_person
+            reused += len(signature)
+            continue
+
         print(f"  - Memproses wajah: {person_name}")
-        for filename in os.listdir(person_path):
+        cached_images = cached_person["images"] if cached_person else {}
+        images = {}
+        for filename, stat in signature.items():
             image_path = os.path.join(person_path, filename)
-            image = cv2.imread(image_path)
-            
-            if image is None: continue
-
-            detections = face_utils.detect_faces(image)
-            if detections:
-                encoding = face_utils.get_face_encoding(image, detections[0])
-                if encoding is not None:
-                    known_encodings.append(encoding)
-                    known_names.append(person_name)
-
-    data = {"encodings": known_encodings, "names": known_names}
-    with open(ENCODINGS_FILE, "wb") as f:
-        pickle.dump(data, f)
-
-    print(f"Proses encoding selesai. Data disimpan di '{ENCODINGS_FILE}'.")
\ No newline at end of file
+            entry = _reuse_entry(image_path, stat, cached_images.get(filename))
+            if entry is None:
+                pending.append((person_name, filename, image_path, stat))
+            else:
+                reused += 1
+            images[filename] = entry
+        people[person_name] = {"signature": signature, "images": images}
+
+    results = encode_images([image_path for _, _, image_path, _ in pending], workers=workers)
+    for (person_name, filename, _, stat), (encoding, sha1) in zip(pending, results):
+        people[person_name]["images"][filename] = {"size": stat[0], "mtime_ns": stat[1], "sha1": sha1, "encoding": encoding}
+
+    removed = sorted(set(cache["people"]) - set(people))
+    for person_name in removed:
+        print(f"  - Dihapus dari cache: {person_name}")
+
+    known_encodings = []
+    known_names = []
+    for person_name, person in people.items():
+        for filename in sorted(person["images"]):
+            encoding = person["images"][filename]["encoding"]
+            if encoding is not None:
+                known_encodings.append(encoding)
+                known_names.append(person_name)
+
+    # Disimpan sebagai satu matriks float32 (n x 12), sejajar dengan daftar nama
+    data = {"encodings": np.asarray(known_encodings, dtype=np.float32), "names": known_names}
+    _atomic_pickle_dump(data, ENCODINGS_FILE)
+    _atomic_pickle_dump({"params": _cache_params(), "people": people}, CACHE_FILE)
+
+    print(f"Proses encoding selesai: {len(pending)} gambar diproses, {reused} dari cache, "
+          f"{len(removed)} folder dihapus. Data disimpan di '{ENCODINGS_FILE}'.")
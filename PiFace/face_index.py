@@ -0,0 +1,109 @@
+import pickle
+import numpy as np
+
+# KD-tree opsional: scipy atau scikit-learn, jika terpasang
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+try:
+    from sklearn.neighbors import KDTree, BallTree
+except ImportError:
+    KDTree = BallTree = None
+
+# Galeri sebesar ini ke atas memakai tree (jika tersedia) saat backend="auto"
+TREE_MIN_SIZE = 5000
+
+
+class FaceIndex:
+    """
+    Galeri encoding wajah lokal berbentuk matriks float32 kontigu, ditambah
+    label (int32) per baris yang menunjuk ke daftar nama unik.
+
+    Semua wajah dalam satu frame dicocokkan sekaligus: jarak Euclidean dihitung
+    dengan satu perkalian matriks (||q||^2 + ||x||^2 - 2 q.x). Untuk galeri
+    besar tersedia backend KD-tree / ball-tree dari scipy atau scikit-learn.
+    """
+
+    def __init__(self, matrix, labels, names, backend="auto"):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.names = [str(name) for name in names]
+        self._sq_norms = np.einsum('ij,ij->i', self.matrix, self.matrix)
+        self.backend = self._choose_backend(backend)
+        self._tree = self._build_tree(self.backend)
+
+    @classmethod
+    def from_encodings(cls, encodings, names, backend="auto"):
+        """Bangun indeks dari list encoding dan list nama yang sejajar."""
+        matrix = np.asarray(encodings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(names), -1) if len(names) else np.zeros((0, 0), dtype=np.float32)
+        unique_names, labels = np.unique(np.asarray(names, dtype=object).astype(str), return_inverse=True)
+        return cls(matrix, labels, unique_names, backend=backend)
+
+    @classmethod
+    def load(cls, path, backend="auto"):
+        """Muat encodings.pkl ({'encodings': [...], 'names': [...]}) sekali saja."""
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        return cls.from_encodings(data["encodings"], data["names"], backend=backend)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def _choose_backend(self, backend):
+        if backend == "auto":
+            if len(self) < TREE_MIN_SIZE:
+                return "brute"
+            backend = "kdtree"
+        if backend == "kdtree" and cKDTree is None and KDTree is None:
+            print("[WARNING] scipy/scikit-learn tidak terpasang, KD-tree tidak tersedia. Memakai brute force.")
+            return "brute"
+        if backend == "balltree" and BallTree is None:
+            print("[WARNING] scikit-learn tidak terpasang, ball-tree tidak tersedia. Memakai brute force.")
+            return "brute"
+        if backend not in ("brute", "kdtree", "balltree"):
+            raise ValueError(f"Backend indeks tidak dikenal: {backend}")
+        return backend
+
+    def _build_tree(self, backend):
+        if backend == "brute" or not len(self):
+            return None
+        if backend == "kdtree" and cKDTree is not None:
+            return cKDTree(self.matrix)
+        if backend == "kdtree":
+            return KDTree(self.matrix)
+        return BallTree(self.matrix)
+
+    def nearest(self, queries):
+        """
+        Tetangga terdekat untuk setiap baris `queries` (n x d).
+        Mengembalikan (indeks baris, jarak), masing-masing array panjang n.
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.matrix.shape[1])
+        if self._tree is None:
+            # (n x N) jarak kuadrat dalam satu perkalian matriks
+            d2 = np.einsum('ij,ij->i', queries, queries)[:, None] + self._sq_norms[None, :] - 2.0 * (queries @ self.matrix.T)
+            rows = np.argmin(d2, axis=1)
+            distances = np.sqrt(np.maximum(d2[np.arange(len(queries)), rows], 0.0))
+            return rows, distances
+        if cKDTree is not None and isinstance(self._tree, cKDTree):
+            distances, rows = self._tree.query(queries, k=1)
+            return np.asarray(rows), np.asarray(distances)
+        distances, rows = self._tree.query(queries, k=1)
+        return rows[:, 0], distances[:, 0]
+
+    def match_batch(self, encodings, threshold):
+        """
+        Cocokkan semua encoding wajah dari satu frame sekaligus.
+        Mengembalikan list (nama atau None, jarak) sejajar dengan `encodings`.
+        """
+        if not len(encodings) or not len(self):
+            return [(None, float('inf'))] * len(encodings)
+        rows, distances = self.nearest(np.stack(encodings))
+        return [
+            (self.names[self.labels[row]] if distance < threshold else None, float(distance))
+            for row, distance in zip(rows, distances)
+        ]
@@ -2,14 +2,81 @@ import cv2
 import mediapipe as mp
 import numpy as np
 
-# Inisialisasi model MediaPipe Face Detection
+# Model MediaPipe Face Detection, dibuat saat pertama dipakai (satu per proses)
 mp_face_detection = mp.solutions.face_detection
-face_detector = mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+face_detector = None
 
-def detect_faces(image):
-    """Mendeteksi wajah dalam sebuah gambar dan mengembalikan hasilnya."""
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    results = face_detector.process(image_rgb)
+def init_detector():
+    """
+    Buat detector MediaPipe baru untuk proses ini. Dipanggil otomatis saat
+    deteksi pertama; worker encoder memanggilnya sendiri supaya tidak memakai
+    graph milik proses induk.
+    """
+    global face_detector
+    face_detector = mp_face_detection.FaceDetection(model_selection=0, min_detection_confidence=0.5)
+    return face_detector
+
+# Lebar gambar yang diproses MediaPipe (None = resolusi penuh). Model short-range
+# bekerja di input 128x128, jadi mengecilkan frame tidak mengurangi akurasi tapi
+# memangkas biaya resize & konversi warna di setiap frame.
+PROCESSING_WIDTH = 320
+
+# Buffer konversi yang dipakai ulang antar-frame (per ukuran). Seperti face_detector,
+# detect_faces tidak boleh dipanggil dari beberapa thread sekaligus.
+_buffers = {}
+
+def _buffer(name, shape):
+    buf = _buffers.get(name)
+    if buf is None or buf.shape != shape:
+        buf = _buffers[name] = np.empty(shape, dtype=np.uint8)
+    return buf
+
+def _remap_to_frame(detection, roi, frame_shape):
+    """Ubah koordinat relatif ROI pada deteksi menjadi relatif terhadap frame penuh."""
+    x, y, w, h = roi
+    frame_h, frame_w = frame_shape[:2]
+    box = detection.location_data.relative_bounding_box
+    box.xmin = (x + box.xmin * w) / frame_w
+    box.ymin = (y + box.ymin * h) / frame_h
+    box.width = box.width * w / frame_w
+    box.height = box.height * h / frame_h
+    for keypoint in detection.location_data.relative_keypoints:
+        keypoint.x = (x + keypoint.x * w) / frame_w
+        keypoint.y = (y + keypoint.y * h) / frame_h
+
+def detect_faces(image, processing_width=PROCESSING_WIDTH, roi=None):
+    """
+    Mendeteksi wajah dalam sebuah gambar dan mengembalikan hasilnya.
+    Gambar (atau hanya ROI (x, y, w, h) jika diberikan) diperkecil ke
+    `processing_width` di buffer yang dipakai ulang; koordinat relatif hasil
+    deteksi selalu terhadap gambar penuh, jadi get_bounding_box dan
+    get_face_encoding tetap dipanggil dengan gambar aslinya.
+    """
+    source = image
+    if roi is not None:
+        x, y, w, h = roi
+        frame_h, frame_w = image.shape[:2]
+        x, y = max(0, int(x)), max(0, int(y))
+        w, h = min(int(w), frame_w - x), min(int(h), frame_h - y)
+        if w <= 0 or h <= 0:
+            return None
+        roi = (x, y, w, h)
+        source = image[y:y + h, x:x + w]  # view, tanpa salinan
+
+    src_h, src_w = source.shape[:2]
+    if processing_width and src_w > processing_width:
+        size = (processing_width, max(1, round(src_h * processing_width / src_w)))
+        resized = _buffer('resize', (size[1], size[0], 3))
+        cv2.resize(source, size, dst=resized, interpolation=cv2.INTER_AREA)
+        source = resized
+
+    image_rgb = _buffer('rgb', source.shape)
+    cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=image_rgb)
+    results = (face_detector or init_detector()).process(image_rgb)
+
+    if roi is not None and results.detections:
+        for detection in results.detections:
+            _remap_to_frame(detection, roi, image.shape)
     return results.detections
 
 def get_face_encoding(image, detection):
@@ -42,4 +109,36 @@ def get_bounding_box(image, detection):
         'width': int(box_data.width * w),
         'height': int(box_data.height * h)
     }
-    return box
\ No newline at end of file
+    return box
+
+def crop_aligned_face(image, detection, size=160, margin=0.2):
+    """
+    Potong wajah yang sudah disejajarkan (garis mata horizontal) langsung ke
+    ukuran `size` x `size` dengan satu warpAffine, ditambah metadata deteksi
+    (kotak & keypoint dalam piksel frame asli) untuk dikirim ke server.
+    Mengembalikan (crop BGR, metadata) atau (None, None).
+    """
+    if not detection:
+        return None, None
+    h, w = image.shape[:2]
+    box = get_bounding_box(image, detection)
+    keypoints = [[kp.x * w, kp.y * h] for kp in detection.location_data.relative_keypoints]
+    if box['width'] <= 0 or box['height'] <= 0 or len(keypoints) < 2:
+        return None, None
+
+    # Sudut garis mata kanan (keypoint 0) -> mata kiri (keypoint 1)
+    (rx, ry), (lx, ly) = keypoints[0], keypoints[1]
+    angle = np.degrees(np.arctan2(ly - ry, lx - rx))
+    cx, cy = box['xmin'] + box['width'] / 2, box['ymin'] + box['height'] / 2
+    scale = size / (max(box['width'], box['height']) * (1 + 2 * margin))
+    matrix = cv2.getRotationMatrix2D((cx, cy), angle, scale)
+    matrix[0, 2] += size / 2 - cx
+    matrix[1, 2] += size / 2 - cy
+    crop = cv2.warpAffine(image, matrix, (size, size), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    metadata = {
+        "box": [box['xmin'], box['ymin'], box['width'], box['height']],
+        "keypoints": [[round(x, 1), round(y, 1)] for x, y in keypoints],
+        "frame_size": [w, h],
+    }
+    return crop, metadata
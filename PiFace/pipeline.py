@@ -0,0 +1,77 @@
+import collections
+import threading
+import time
+
+
+class DropOldestQueue:
+    """
+    Antrean terbatas antar-thread. Jika penuh, item paling lama dibuang
+    supaya tahap berikutnya selalu mendapat data terbaru.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """Masukkan item. Mengembalikan item yang dibuang (atau None)."""
+        dropped = None
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+        return dropped
+
+    def get(self, timeout=None):
+        """Ambil item tertua; None jika timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: len(self._items) > 0, timeout):
+                return None
+            return self._items.popleft()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class PipelineStats:
+    """
+    Statistik pipeline untuk overlay: FPS per tahap dan latensi per tahap
+    (rata-rata bergerak eksponensial, dalam milidetik).
+    """
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._fps = {}
+        self._last_tick = {}
+
+    def record(self, stage, seconds):
+        ms = seconds * 1000
+        with self._lock:
+            prev = self._latency.get(stage)
+            self._latency[stage] = ms if prev is None else prev + self.alpha * (ms - prev)
+
+    def tick(self, stage):
+        now = time.perf_counter()
+        with self._lock:
+            last = self._last_tick.get(stage)
+            self._last_tick[stage] = now
+            if last is None or now <= last:
+                return
+            fps = 1.0 / (now - last)
+            prev = self._fps.get(stage)
+            self._fps[stage] = fps if prev is None else prev + self.alpha * (fps - prev)
+
+    def fps(self, stage):
+        with self._lock:
+            return self._fps.get(stage, 0.0)
+
+    def latency(self, stage):
+        with self._lock:
+            return self._latency.get(stage)
@@ -2,123 +2,416 @@
 
 import cv2
 import time
+import json
+import threading
 import requests
 import os
-import pickle
-import numpy as np
+import random
 import face_utils # Pastikan file face_utils.py ada di folder yang sama
+from pipeline import DropOldestQueue, PipelineStats
+from spool import AttendanceSpool
+from face_index import FaceIndex
+from tracker import FaceTracker
 
 # --- PENGATURAN ---
 SERVER_IP = "10.0.0.64"  # GANTI DENGAN IP SERVER ANDA JIKA BERBEDA MESIN
 SERVER_PORT = 5000
 ENCODINGS_FILE = "encodings.pkl"
 RECOGNITION_THRESHOLD = 0.5
-POLLING_INTERVAL = 10  # Detik, seberapa sering bertanya status ke server
+RECOGNITION_MODE = "lokal"  # "lokal": cocokkan keypoint dengan encodings.pkl; "server": unggah crop wajah ke server (VGG-Face)
+CROP_SIZE = 160  # Piksel, sisi crop wajah yang diunggah pada mode server
+CROP_JPEG_QUALITY = 80  # Kualitas JPEG crop wajah (0-100); lebih rendah = upload lebih kecil
+INDEX_BACKEND = "auto"  # "brute", "kdtree", "balltree", atau "auto" (tree untuk galeri besar jika scipy/sklearn ada)
+POLLING_INTERVAL = 10  # Detik, jeda polling jika server tidak mendukung long-poll atau sedang tidak bisa dihubungi
+LONG_POLL_WAIT = 50  # Detik, server menahan permintaan status sampai sesi berubah (maks. 55 di server)
+RUANGAN = "default"  # Ruangan/perangkat ini; harus sama dengan ruangan saat dosen memulai sesi
+DEVICE_TOKEN = os.environ.get("PIFACE_DEVICE_TOKEN", "")  # Token ruangan ini di PIFACE_DEVICE_TOKENS server
 
 # --- URL API ---
 URL_STATUS_SESI = f"http://{SERVER_IP}:{SERVER_PORT}/api/status_sesi"
-URL_ABSEN = f"http://{SERVER_IP}:{SERVER_PORT}/api/absen"
+URL_ABSEN_BATCH = f"http://{SERVER_IP}:{SERVER_PORT}/api/absen_batch"
+URL_RECOGNIZE = f"http://{SERVER_IP}:{SERVER_PORT}/api/recognize_and_attend"
+
+# --- PENGATURAN PIPELINE ---
+FRAME_QUEUE_SIZE = 2      # Frame menunggu deteksi; frame tertua dibuang jika deteksi tertinggal
+DISPLAY_QUEUE_SIZE = 2    # Frame hasil proses yang menunggu ditampilkan
+UPLOAD_QUEUE_SIZE = 8     # Crop wajah yang menunggu diunggah (mode server)
+DETECT_EVERY_N = 10       # Deteksi penuh setiap N frame (atau saat track hilang); di antaranya wajah diikuti tracker
+USE_OPTICAL_FLOW = True   # False: kotak wajah diam di antara deteksi (lebih hemat CPU)
+DETECTION_ROI = None      # (x, y, w, h) dalam piksel untuk membatasi deteksi ke area pintu/meja; None = seluruh frame
+
+# --- PENGATURAN SPOOL ABSENSI ---
+SPOOL_FILE = "absen_spool.db"  # Absensi dicatat di sini dulu, lalu dikirim ke server per batch
+SPOOL_BATCH_SIZE = 50          # Rekaman per permintaan ke server
+BACKOFF_MIN = 1                # Detik, jeda awal setelah pengiriman gagal
+BACKOFF_MAX = 60               # Detik, jeda maksimal (naik dua kali lipat setiap gagal)
+SPOOL_MAX_PERCOBAAN = 100      # Rekaman yang gagal terkirim sebanyak ini dipindah ke karantina (~1,5 jam server mati)
 
 # --- Variabel untuk menyimpan status dari klien ---
 sesi_aktif_id = None
-mahasiswa_sudah_absen = set()  # "Buku catatan" untuk sesi yang sedang berjalan
-waktu_polling_terakhir = 0
+mahasiswa_sudah_absen = set()  # "Buku catatan" untuk sesi yang sedang berjalan (sudah masuk spool)
+state_lock = threading.Lock()   # Dipakai bersama oleh thread status, deteksi, dan pengirim
+etag_status_sesi = None  # ETag jawaban status sesi terakhir (If-None-Match)
+
+def gagal_kirim(spool, client_ids):
+    dikarantina = spool.mark_failed(client_ids, SPOOL_MAX_PERCOBAAN)
+    if dikarantina:
+        print(f"[KIRIM] {dikarantina} absensi gagal terkirim {SPOOL_MAX_PERCOBAAN} kali, dipindah ke karantina spool.")
 
-def kirim_absen_tunggal(nama):
-    """Mengirim satu data absen ke server."""
-    payload = {'nama': nama}
-    print(f"\n[KIRIM] Sesi aktif. Mengirim absen untuk: {nama}")
+def kirim_batch_spool(spool):
+    """
+    Mengirim satu batch rekaman spool ke server dalam satu permintaan.
+    Rekaman yang tersimpan atau duplikat dihapus dari spool; rekaman yang
+    ditolak server dipindah ke karantina. Seluruh batch hanya dikarantina
+    jika server menjawab 400/413 (isi permintaan memang tidak bisa diterima).
+    401/403 berarti token perangkat salah: batch tetap di spool tanpa
+    menambah hitungan percobaan dan diulang dengan backoff sampai token
+    diperbaiki. Jawaban lain (5xx, 4xx lain) dan gangguan jaringan diulang.
+    Mengembalikan False jika perlu diulang.
+    """
+    records = spool.pending(SPOOL_BATCH_SIZE)
+    if not records:
+        return True
+    client_ids = [r['client_id'] for r in records]
+    print(f"\n[KIRIM] Mengirim {len(records)} absensi ke server...")
     try:
-        response = requests.post(URL_ABSEN, json=payload, timeout=5)
-        if response.status_code == 200:
-            print(f"✅ Absen '{nama}' berhasil terkirim. Ditambahkan ke catatan lokal.")
-            # Tambahkan nama ke "buku catatan" HANYA JIKA berhasil
-            mahasiswa_sudah_absen.add(nama)
-        else:
+        response = requests.post(URL_ABSEN_BATCH, json={'ruangan': RUANGAN, 'records': records},
+                                 headers={'X-Device-Token': DEVICE_TOKEN}, timeout=10)
+        if response.status_code != 200:
             # Cetak pesan error dari server jika ada
-            pesan_error = response.json().get('message', response.text)
-            print(f"⚠️ Gagal mengirim absen. Server: {pesan_error}")
-    except requests.exceptions.RequestException as e:
-        print(f"❌ KONEKSI KE SERVER GAGAL: {e}")
+            try:
+                pesan_error = response.json().get('message', response.text)
+            except ValueError:
+                pesan_error = response.text
+            print(f"⚠️ Gagal mengirim absen. Server ({response.status_code}): {pesan_error}")
+            if response.status_code in (401, 403):
+                # Masalah konfigurasi perangkat, bukan rekamannya: jangan dikarantina
+                print(f"🔒 [KIRIM] TOKEN PERANGKAT DITOLAK SERVER! Periksa PIFACE_DEVICE_TOKEN untuk ruangan "
+                      f"'{RUANGAN}'. {len(spool)} absensi tertahan di spool sampai token diperbaiki.")
+                return False
+            if response.status_code in (400, 413):
+                spool.quarantine(client_ids, f"HTTP {response.status_code}: {pesan_error}")
+                print(f"[KIRIM] {len(client_ids)} absensi dipindah ke karantina spool.")
+                return True
+            gagal_kirim(spool, client_ids)
+            return False
+        results = response.json().get('results', [])
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"❌ KONEKSI KE SERVER GAGAL: {e}. Absensi tetap tersimpan di spool.")
+        gagal_kirim(spool, client_ids)
+        return False
 
-def run_continuous_recognition():
-    """Fungsi utama yang berjalan dalam loop tak terbatas."""
-    global sesi_aktif_id, mahasiswa_sudah_absen, waktu_polling_terakhir
+    for result in results:
+        if result.get('status') == 'tersimpan':
+            print(f"✅ Absen '{result.get('nama_mahasiswa')}' berhasil tersimpan.")
+        elif result.get('status') == 'ditolak':
+            print(f"⚠️ Absen ditolak server: {result.get('message')}")
+    ditolak = [r for r in results if r.get('client_id') and r.get('status') == 'ditolak']
+    for result in ditolak:
+        spool.quarantine([result['client_id']], f"ditolak server: {result.get('message')}")
+    if ditolak:
+        print(f"[KIRIM] {len(ditolak)} absensi yang ditolak dipindah ke karantina spool.")
+    spool.remove([r['client_id'] for r in results if r.get('client_id') and r.get('status') != 'ditolak'])
+    return True
+
+def perbarui_status_sesi(wait=0):
+    """
+    Bertanya status sesi ke server dan memperbarui status lokal.
+    Dengan ETag terakhir, server menahan permintaan hingga `wait` detik dan
+    baru menjawab saat sesi dimulai/diakhiri (304 jika tidak ada perubahan).
+    Mengembalikan True jika status sesi berubah, None jika server gagal dihubungi.
+    """
+    global sesi_aktif_id, etag_status_sesi
+    headers = {'If-None-Match': etag_status_sesi} if etag_status_sesi else {}
+    try:
+        response = requests.get(URL_STATUS_SESI, params={'ruangan': RUANGAN, 'wait': wait},
+                                headers=headers, timeout=wait + 10)
+        if response.status_code == 304:
+            return False
+        data_sesi = response.json()
+    except (requests.exceptions.RequestException, ValueError):
+        print(f"[STATUS] Gagal terhubung ke server.")
+        return None
+    etag_status_sesi = response.headers.get('ETag')
+    status_server = data_sesi.get('status')
+    id_sesi_server = data_sesi.get('sesi_id')
+
+    # Logika jika ada perubahan status sesi
+    with state_lock:
+        if status_server == 'aktif' and sesi_aktif_id != id_sesi_server:
+            print(f"====== SESI BARU AKTIF (ID: {id_sesi_server}) ======")
+            sesi_aktif_id = id_sesi_server
+            mahasiswa_sudah_absen.clear()  # Siapkan "buku catatan" baru yang kosong
+            return True
+        elif status_server == 'tidak_aktif' and sesi_aktif_id is not None:
+            print("====== SESI TELAH BERAKHIR ======")
+            sesi_aktif_id = None
+            mahasiswa_sudah_absen.clear()  # Hapus "buku catatan" lama
+            return True
+    return False
+
+def thread_status(stop_event):
+    """
+    Thread status sesi: long-poll ke server sehingga sesi baru terlihat
+    seketika. Jika server tidak menahan permintaan (server lama) atau gagal
+    dihubungi, kembali ke polling bersyarat (ETag) setiap POLLING_INTERVAL.
+    """
+    print(f"[STATUS] Menunggu perubahan status sesi ruangan '{RUANGAN}'...")
+    while not stop_event.is_set():
+        t0 = time.monotonic()
+        etag_sebelum = etag_status_sesi
+        berubah = perbarui_status_sesi(wait=LONG_POLL_WAIT)
+        if berubah:
+            continue
+        # Jawaban cepat tanpa perubahan berarti permintaan tidak ditahan server
+        ditahan = time.monotonic() - t0 >= LONG_POLL_WAIT / 2 or etag_sebelum != etag_status_sesi
+        if berubah is None or etag_status_sesi is None or not ditahan:
+            stop_event.wait(POLLING_INTERVAL)
 
-    # 1. Muat data encoding wajah dari file
-    print("[INFO] Memuat data encoding wajah...")
-    if not os.path.exists(ENCODINGS_FILE):
-        print(f"[ERROR] File '{ENCODINGS_FILE}' tidak ditemukan.")
+def thread_kamera(cap, frame_queue, stats, stop_event):
+    """Thread capture: membaca frame secepat kamera dan memasukkannya ke antrean."""
+    while not stop_event.is_set():
+        t0 = time.perf_counter()
+        ret, frame = cap.read()
+        if not ret:
+            print("[WARNING] Gagal membaca frame dari kamera. Mencoba lagi...")
+            stop_event.wait(1)
+            continue
+        stats.record('capture', time.perf_counter() - t0)
+        stats.tick('kamera')
+        frame_queue.put((t0, frame))
+
+def catat_absen(name, sesi_aktif, spool, spool_event):
+    """Catat nama yang dikenali ke spool, sekali per sesi."""
+    # Logika Cerdas: Cek "buku catatan" lokal sebelum mencatat
+    with state_lock:
+        perlu_catat = name not in mahasiswa_sudah_absen
+        mahasiswa_sudah_absen.add(name)
+    if perlu_catat:
+        spool.add(name, sesi_aktif)
+        print(f"\n[SPOOL] {name} dikenali, dicatat untuk dikirim.")
+        spool_event.set()
+
+def antrekan_crop(frame, track, detection, upload_queue):
+    """Mode server: potong & sejajarkan wajah, encode JPEG, lalu antrekan untuk diunggah."""
+    crop, metadata = face_utils.crop_aligned_face(frame, detection, size=CROP_SIZE)
+    if crop is None:
         return
-    with open(ENCODINGS_FILE, 'rb') as f:
-        data = pickle.load(f)
-    known_encodings, known_names = data["encodings"], data["names"]
-    print("[INFO] Data encoding berhasil dimuat.")
+    ok, jpeg = cv2.imencode('.jpg', crop, [cv2.IMWRITE_JPEG_QUALITY, CROP_JPEG_QUALITY])
+    if not ok:
+        return
+    track.pending = True
+    dibuang = upload_queue.put((track, jpeg.tobytes(), metadata))
+    if dibuang is not None:
+        dibuang[0].pending = False  # Dicoba lagi pada deteksi berikutnya
+
+def thread_deteksi(face_index, frame_queue, display_queue, spool, spool_event, upload_queue, stats, stop_event):
+    """
+    Thread deteksi & pencocokan: frame terbaru -> tracker -> nama yang dikenali -> spool absensi.
+    Deteksi MediaPipe hanya setiap DETECT_EVERY_N frame atau saat track hilang, dan
+    pengenalan hanya untuk track yang belum punya nama. Pada mode server, crop
+    wajah track baru diantrekan untuk diunggah alih-alih dicocokkan secara lokal.
+    """
+    tracker = FaceTracker(detect_every=DETECT_EVERY_N, use_flow=USE_OPTICAL_FLOW)
+    sesi_terakhir = None
+    while not stop_event.is_set():
+        item = frame_queue.get(timeout=0.5)
+        if item is None:
+            continue
+        t_capture, frame = item
+
+        with state_lock:
+            sesi_aktif = sesi_aktif_id
+
+        if sesi_aktif != sesi_terakhir:
+            # Sesi berganti (bisa langsung A -> B tanpa jeda tidak aktif): nama
+            # pada track milik sesi lama, jadi semua wajah harus dikenali ulang
+            tracker.reset()
+            sesi_terakhir = sesi_aktif
+
+        # Deteksi wajah dan catat absen HANYA jika sesi aktif
+        if sesi_aktif is None:
+            tracker.reset()
+        elif tracker.needs_detection():
+            t0 = time.perf_counter()
+            detections = face_utils.detect_faces(frame, roi=DETECTION_ROI) or []
+            t1 = time.perf_counter()
+            stats.record('deteksi', t1 - t0)
+            boxes = [face_utils.get_bounding_box(frame, d) for d in detections]
+            baru = tracker.update(frame, [(b['xmin'], b['ymin'], b['width'], b['height']) for b in boxes])
+
+            if RECOGNITION_MODE == "server":
+                for track, i in baru:
+                    if not track.pending:
+                        antrekan_crop(frame, track, detections[i], upload_queue)
+            else:
+                # Hanya track baru yang dikenali; semuanya dicocokkan dalam satu perhitungan jarak
+                kandidat = [(track, face_utils.get_face_encoding(frame, detections[i])) for track, i in baru]
+                kandidat = [(track, encoding) for track, encoding in kandidat if encoding is not None]
+                matches = face_index.match_batch([encoding for _, encoding in kandidat], RECOGNITION_THRESHOLD)
+                for (track, _), (name, _) in zip(kandidat, matches):
+                    if name is None: continue
+                    track.name = name
+                    catat_absen(name, sesi_aktif, spool, spool_event)
+            stats.record('matching', time.perf_counter() - t1)
+        else:
+            t0 = time.perf_counter()
+            tracker.propagate(frame)
+            stats.record('tracking', time.perf_counter() - t0)
+
+        stats.tick('proses')
+        wajah = [(track.box, track.name) for track in tracker.tracks]
+        display_queue.put((t_capture, frame, wajah))
+
+def thread_unggah(upload_queue, stats, stop_event):
+    """
+    Mode server: unggah crop wajah ke server (deteksi di server dilewati).
+    Server langsung mencatat absensi; nama hasilnya dipasang ke track.
+    """
+    while not stop_event.is_set():
+        item = upload_queue.get(timeout=0.5)
+        if item is None:
+            continue
+        track, jpeg, metadata = item
+        t0 = time.perf_counter()
+        try:
+            response = requests.post(
+                URL_RECOGNIZE,
+                data={'ruangan': RUANGAN, 'face_meta': json.dumps(metadata)},
+                files={'image': ('wajah.jpg', jpeg, 'image/jpeg')},
+                timeout=10
+            )
+            hasil = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"❌ KONEKSI KE SERVER GAGAL: {e}")
+            hasil = {}
+        stats.record('unggah', time.perf_counter() - t0)
+
+        if hasil.get('recognized') and hasil.get('name'):
+            track.name = hasil['name']
+            with state_lock:
+                mahasiswa_sudah_absen.add(track.name)
+            print(f"✅ {hasil.get('message')}")
+        elif hasil:
+            print(f"[SERVER] {hasil.get('message')}")
+        track.pending = False
+
+def thread_pengirim(spool, spool_event, stats, stop_event):
+    """
+    Thread pengirim: mengosongkan spool per batch. Jika server gagal
+    dihubungi, jeda dinaikkan dua kali lipat (maks. BACKOFF_MAX) dan
+    rekaman tetap aman di spool sampai berhasil terkirim.
+    """
+    if not DEVICE_TOKEN:
+        print("🔒 [KIRIM] PIFACE_DEVICE_TOKEN belum diisi; server akan menolak pengiriman absensi "
+              "dan semua absensi tertahan di spool.")
+    backoff = BACKOFF_MIN
+    while not stop_event.is_set():
+        if not len(spool):
+            spool_event.wait(timeout=1)
+            spool_event.clear()
+            continue
+        t0 = time.perf_counter()
+        berhasil = kirim_batch_spool(spool)
+        stats.record('kirim', time.perf_counter() - t0)
+        if berhasil:
+            backoff = BACKOFF_MIN
+            continue
+        print(f"[KIRIM] Mencoba lagi dalam {backoff} detik ({len(spool)} absensi di spool).")
+        stop_event.wait(backoff + random.uniform(0, backoff / 2))
+        backoff = min(backoff * 2, BACKOFF_MAX)
+
+def gambar_overlay(frame, wajah, stats, frame_queue, spool):
+    """Menampilkan kotak wajah yang diikuti, status sesi, FPS, dan latensi per tahap di layar kamera."""
+    for (x, y, w, h), name in wajah:
+        warna = (0, 255, 0) if name else (0, 165, 255)
+        cv2.rectangle(frame, (x, y), (x + w, y + h), warna, 2)
+        cv2.putText(frame, name or "?", (x, max(15, y - 8)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, warna, 2)
+
+    with state_lock:
+        sesi = sesi_aktif_id
+    status_text = f"Sesi: {'AKTIF (ID: '+str(sesi)+')' if sesi else 'TIDAK AKTIF'}"
+    color = (0, 255, 0) if sesi else (0, 0, 255)
+    cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+
+    def ms(stage):
+        value = stats.latency(stage)
+        return '-' if value is None else f"{value:.0f}ms"
+
+    lines = [
+        f"FPS kamera {stats.fps('kamera'):.1f} | proses {stats.fps('proses'):.1f} | tampil {stats.fps('tampil'):.1f}",
+        f"capture {ms('capture')} deteksi {ms('deteksi')} tracking {ms('tracking')} match {ms('matching')} kirim {ms('kirim')} unggah {ms('unggah')} total {ms('total')}",
+        f"wajah {len(wajah)} | drop frame {frame_queue.dropped} | spool {len(spool)}",
+    ]
+    for i, line in enumerate(lines):
+        cv2.putText(frame, line, (10, 55 + i * 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+
+def run_continuous_recognition():
+    """
+    Fungsi utama pengenalan wajah dengan pipeline:
+    kamera -> deteksi/pencocokan -> spool -> pengirim. Kamera dan deteksi
+    dihubungkan antrean terbatas yang membuang frame tertua; thread utama
+    hanya menampilkan frame.
+    """
+    # 1. Muat data encoding wajah dari file (mode server tidak memerlukannya)
+    face_index = None
+    if RECOGNITION_MODE == "server":
+        print(f"[INFO] Mode server: crop wajah diunggah ke {URL_RECOGNIZE} (JPEG {CROP_SIZE}px, kualitas {CROP_JPEG_QUALITY}).")
+    else:
+        print("[INFO] Memuat data encoding wajah...")
+        if not os.path.exists(ENCODINGS_FILE):
+            print(f"[ERROR] File '{ENCODINGS_FILE}' tidak ditemukan.")
+            return
+        face_index = FaceIndex.load(ENCODINGS_FILE, backend=INDEX_BACKEND)
+        print(f"[INFO] Data encoding berhasil dimuat ({len(face_index)} encoding, {len(face_index.names)} orang, backend {face_index.backend}).")
 
     # 2. Mulai kamera
     print("[INFO] Memulai kamera... Tekan 'q' untuk keluar.")
     cap = cv2.VideoCapture(0)
     time.sleep(2.0)
 
-    # 3. Loop utama
+    # 3. Siapkan antrean & thread pipeline
+    stats = PipelineStats()
+    stop_event = threading.Event()
+    frame_queue = DropOldestQueue(FRAME_QUEUE_SIZE)
+    display_queue = DropOldestQueue(DISPLAY_QUEUE_SIZE)
+    spool = AttendanceSpool(SPOOL_FILE)
+    spool_event = threading.Event()
+    upload_queue = DropOldestQueue(UPLOAD_QUEUE_SIZE)
+    if len(spool):
+        print(f"[INFO] {len(spool)} absensi dari sebelumnya masih di spool, akan dikirim.")
+    threads = [
+        threading.Thread(target=thread_status, args=(stop_event,), name="status-sesi", daemon=True),
+        threading.Thread(target=thread_kamera, args=(cap, frame_queue, stats, stop_event), name="kamera", daemon=True),
+        threading.Thread(target=thread_deteksi,
+                         args=(face_index, frame_queue, display_queue, spool, spool_event, upload_queue, stats, stop_event),
+                         name="deteksi", daemon=True),
+        threading.Thread(target=thread_pengirim, args=(spool, spool_event, stats, stop_event), name="pengirim", daemon=True),
+    ]
+    if RECOGNITION_MODE == "server":
+        threads.append(threading.Thread(target=thread_unggah, args=(upload_queue, stats, stop_event), name="unggah", daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # 4. Loop tampilan (cv2.imshow harus tetap di thread utama)
     while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("[WARNING] Gagal membaca frame dari kamera. Mencoba lagi...")
-            time.sleep(1)
-            continue
+        item = display_queue.get(timeout=0.1)
+        if item is not None:
+            t_capture, frame, wajah = item
+            stats.record('total', time.perf_counter() - t_capture)
+            stats.tick('tampil')
+            gambar_overlay(frame, wajah, stats, frame_queue, spool)
+            cv2.imshow("Kamera Absensi", frame)
 
-        # 4. Cek status sesi ke server secara berkala (polling)
-        waktu_sekarang = time.time()
-        if (waktu_sekarang - waktu_polling_terakhir) > POLLING_INTERVAL:
-            waktu_polling_terakhir = waktu_sekarang
-            print(f"\n[POLLING] Memeriksa status sesi...")
-            try:
-                response = requests.get(URL_STATUS_SESI, timeout=5)
-                data_sesi = response.json()
-                status_server = data_sesi.get('status')
-                id_sesi_server = data_sesi.get('sesi_id')
-
-                # Logika jika ada perubahan status sesi
-                if status_server == 'aktif' and sesi_aktif_id != id_sesi_server:
-                    print(f"====== SESI BARU AKTIF (ID: {id_sesi_server}) ======")
-                    sesi_aktif_id = id_sesi_server
-                    mahasiswa_sudah_absen.clear()  # Siapkan "buku catatan" baru yang kosong
-                elif status_server == 'tidak_aktif' and sesi_aktif_id is not None:
-                    print("====== SESI TELAH BERAKHIR ======")
-                    sesi_aktif_id = None
-                    mahasiswa_sudah_absen.clear()  # Hapus "buku catatan" lama
-            except requests.exceptions.RequestException:
-                print(f"[POLLING] Gagal terhubung ke server.")
-        
-        # 5. Deteksi wajah dan kirim absen HANYA jika sesi aktif
-        if sesi_aktif_id is not None:
-            detections = face_utils.detect_faces(frame)
-            if detections:
-                for detection in detections:
-                    encoding = face_utils.get_face_encoding(frame, detection)
-                    if encoding is None: continue
-
-                    distances = np.linalg.norm(known_encodings - encoding, axis=1)
-                    min_distance_index = np.argmin(distances)
-
-                    if distances[min_distance_index] < RECOGNITION_THRESHOLD:
-                        name = known_names[min_distance_index]
-                        
-                        # Logika Cerdas: Cek "buku catatan" lokal sebelum mengirim
-                        if name not in mahasiswa_sudah_absen:
-                            kirim_absen_tunggal(name)
-
-        # Tampilkan status di layar kamera
-        status_text = f"Sesi: {'AKTIF (ID: '+str(sesi_aktif_id)+')' if sesi_aktif_id else 'TIDAK AKTIF'}"
-        color = (0, 255, 0) if sesi_aktif_id else (0, 0, 255)
-        cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-        cv2.imshow("Kamera Absensi", frame)
-        
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
     print("[INFO] Menutup program.")
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=6)
+    if len(spool):
+        print(f"[INFO] {len(spool)} absensi belum terkirim; akan dikirim saat program dijalankan lagi.")
     cap.release()
     cv2.destroyAllWindows()
 
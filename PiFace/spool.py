@@ -0,0 +1,120 @@
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+
+
+class AttendanceSpool:
+    """
+    Antrean absensi lokal (SQLite) di perangkat kamera.
+
+    Setiap wajah yang dikenali dicatat dulu di sini beserta waktu dan sesi_id,
+    lalu thread pengirim mengirimnya ke server per batch. Rekaman baru dihapus
+    setelah server menjawab, jadi tidak ada yang hilang saat server tidak bisa
+    dihubungi atau program dimatikan. Rekaman yang ditolak permanen atau sudah
+    terlalu sering gagal dipindah ke tabel `karantina` supaya tidak menyumbat
+    antrean; isinya tetap ada untuk diperiksa atau dikirim ulang manual.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id TEXT NOT NULL UNIQUE,
+                nama TEXT NOT NULL,
+                sesi_id INTEGER NOT NULL,
+                waktu TEXT NOT NULL,
+                percobaan INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS karantina (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id TEXT NOT NULL UNIQUE,
+                nama TEXT NOT NULL,
+                sesi_id INTEGER NOT NULL,
+                waktu TEXT NOT NULL,
+                percobaan INTEGER NOT NULL,
+                alasan TEXT NOT NULL,
+                waktu_karantina TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def add(self, nama, sesi_id, waktu=None):
+        """Catat satu absensi. Mengembalikan client_id rekaman."""
+        client_id = uuid.uuid4().hex
+        waktu = (waktu or datetime.now()).isoformat(timespec='seconds')
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO spool (client_id, nama, sesi_id, waktu) VALUES (?, ?, ?, ?)",
+                (client_id, nama, sesi_id, waktu)
+            )
+            self._conn.commit()
+            self._count += 1
+        return client_id
+
+    def pending(self, limit):
+        """Rekaman tertua yang belum terkirim, maksimal `limit`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT client_id, nama, sesi_id, waktu FROM spool ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [{"client_id": c, "nama": n, "sesi_id": s, "waktu": w} for c, n, s, w in rows]
+
+    def remove(self, client_ids):
+        """Hapus rekaman yang sudah dijawab server."""
+        if not client_ids:
+            return
+        with self._lock:
+            cursor = self._conn.executemany("DELETE FROM spool WHERE client_id = ?", [(c,) for c in client_ids])
+            self._conn.commit()
+            self._count -= cursor.rowcount
+
+    def mark_failed(self, client_ids, max_attempts):
+        """
+        Catat satu kegagalan kirim (sementara) untuk rekaman ini. Rekaman yang
+        sudah gagal `max_attempts` kali dikarantina. Mengembalikan jumlah
+        rekaman yang dikarantina.
+        """
+        with self._lock:
+            self._conn.executemany("UPDATE spool SET percobaan = percobaan + 1 WHERE client_id = ?",
+                                   [(c,) for c in client_ids])
+            exhausted = [c for (c,) in self._conn.execute(
+                f"SELECT client_id FROM spool WHERE percobaan >= ? AND client_id IN ({','.join('?' * len(client_ids))})",
+                (max_attempts, *client_ids)
+            )] if client_ids else []
+            self._quarantine(exhausted, f"gagal terkirim {max_attempts} kali")
+            self._conn.commit()
+        return len(exhausted)
+
+    def quarantine(self, client_ids, alasan):
+        """Pindahkan rekaman yang ditolak permanen oleh server ke karantina."""
+        with self._lock:
+            self._quarantine(client_ids, alasan)
+            self._conn.commit()
+
+    def _quarantine(self, client_ids, alasan):
+        # Dipanggil dengan lock dipegang; commit oleh pemanggil
+        if not client_ids:
+            return
+        now = datetime.now().isoformat(timespec='seconds')
+        self._conn.executemany("""
+            INSERT OR REPLACE INTO karantina (client_id, nama, sesi_id, waktu, percobaan, alasan, waktu_karantina)
+            SELECT client_id, nama, sesi_id, waktu, percobaan, ?, ? FROM spool WHERE client_id = ?
+        """, [(alasan, now, c) for c in client_ids])
+        cursor = self._conn.executemany("DELETE FROM spool WHERE client_id = ?", [(c,) for c in client_ids])
+        self._count -= cursor.rowcount
+
+    def __len__(self):
+        with self._lock:
+            return self._count
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,150 @@
+import itertools
+import cv2
+import numpy as np
+
+
+def iou(a, b):
+    """Intersection-over-union dua kotak (x, y, w, h)."""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class Track:
+    """Satu wajah yang diikuti antar-frame."""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.name = None      # None = belum dikenali (pengenalan dicoba lagi saat deteksi berikutnya)
+        self.misses = 0       # Jumlah deteksi berturut-turut yang tidak menemukan track ini
+        self.points = None    # Titik fitur untuk optical flow (koordinat frame penuh)
+        self.pending = False  # Crop wajah sedang diunggah ke server untuk dikenali
+
+
+class FaceTracker:
+    """
+    Tracker wajah ringan: deteksi penuh hanya setiap `detect_every` frame
+    atau saat ada track yang hilang. Di antara deteksi, posisi wajah digeser
+    dengan optical flow Lucas-Kanade; saat deteksi, kotak baru dipasangkan ke
+    track lama berdasarkan IOU sehingga identitas terbawa antar-frame dan
+    pengenalan hanya perlu dijalankan untuk track baru.
+    """
+
+    def __init__(self, detect_every=10, iou_threshold=0.3, max_misses=2, use_flow=True, min_points=4):
+        self.detect_every = detect_every
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.use_flow = use_flow
+        self.min_points = min_points
+        self.tracks = []
+        self._ids = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        self.tracks = []
+        self._frames_since_detection = 0
+        self._force_detection = True
+        self._prev_gray = None
+        self._spare_gray = None
+
+    def _to_gray(self, frame):
+        # Dua buffer grayscale bergantian (frame sebelumnya & sekarang), tanpa alokasi per frame
+        gray = self._spare_gray
+        if gray is None or gray.shape != frame.shape[:2]:
+            gray = np.empty(frame.shape[:2], dtype=np.uint8)
+        cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+        self._spare_gray = self._prev_gray
+        return gray
+
+    def needs_detection(self):
+        return self._force_detection or self._frames_since_detection >= self.detect_every
+
+    def update(self, frame, boxes):
+        """
+        Pasangkan kotak hasil deteksi (x, y, w, h) ke track yang ada.
+        Mengembalikan list (track, indeks kotak) untuk track yang belum
+        punya nama, yaitu yang perlu dikenali.
+        """
+        pairs = sorted(
+            ((iou(track.box, box), t, b) for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+            reverse=True
+        )
+        matched_tracks = set()
+        box_owner = {}
+        for score, t, b in pairs:
+            if score < self.iou_threshold:
+                break
+            if t in matched_tracks or b in box_owner:
+                continue
+            matched_tracks.add(t)
+            box_owner[b] = self.tracks[t]
+            self.tracks[t].box = boxes[b]
+            self.tracks[t].misses = 0
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    continue
+            survivors.append(track)
+        for b, box in enumerate(boxes):
+            if b not in box_owner:
+                box_owner[b] = Track(next(self._ids), box)
+                survivors.append(box_owner[b])
+        self.tracks = survivors
+
+        self._frames_since_detection = 0
+        self._force_detection = False
+        if self.use_flow:
+            self._prev_gray = self._to_gray(frame)
+            for track in self.tracks:
+                track.points = self._find_points(self._prev_gray, track.box)
+        return [(track, b) for b, track in sorted(box_owner.items()) if track.name is None]
+
+    def propagate(self, frame):
+        """
+        Frame tanpa deteksi: geser kotak setiap track dengan optical flow.
+        Track yang kehilangan terlalu banyak titik memicu deteksi penuh di frame
+        berikutnya; track tanpa titik fitur tetap diam sampai deteksi terjadwal.
+        """
+        self._frames_since_detection += 1
+        if not self.use_flow or not self.tracks or self._prev_gray is None:
+            return
+        gray = self._to_gray(frame)
+        tracked = [track for track in self.tracks if track.points is not None and len(track.points)]
+        if tracked:
+            prev_points = np.concatenate([track.points for track in tracked]).astype(np.float32)
+            next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, prev_points, None)
+            offset = 0
+            for track in tracked:
+                n = len(track.points)
+                ok = status[offset:offset + n, 0] == 1
+                moved = next_points[offset:offset + n][ok]
+                if len(moved) < self.min_points:
+                    track.points = None
+                    self._force_detection = True
+                else:
+                    dx, dy = np.median(moved - track.points[ok], axis=0)
+                    x, y, w, h = track.box
+                    track.box = (int(round(x + dx)), int(round(y + dy)), w, h)
+                    track.points = moved
+                offset += n
+        self._prev_gray = gray
+
+    @staticmethod
+    def _find_points(gray, box, max_points=20):
+        x, y, w, h = box
+        x0, y0 = max(0, x), max(0, y)
+        roi = gray[y0:max(y0, y + h), x0:max(x0, x + w)]
+        if roi.size == 0:
+            return None
+        points = cv2.goodFeaturesToTrack(roi, maxCorners=max_points, qualityLevel=0.01, minDistance=3)
+        if points is None:
+            return None
+        return points.reshape(-1, 2) + np.array([x0, y0], dtype=np.float32)
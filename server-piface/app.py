@@ -1,19 +1,35 @@
 # app.py (ENHANCED VERSION - Improved Error Handling & Robustness)
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session as flask_session, abort
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, session as flask_session, abort, stream_with_context, g
 from config import Config
-from models import db, Dosen, Mahasiswa, Matakuliah, Jadwal, SesiPerkuliahan, LogAbsensi
+from models import db, Dosen, Mahasiswa, Jadwal, SesiPerkuliahan, LogAbsensi
 from datetime import datetime, timedelta
+from sqlalchemy import func
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_migrate import Migrate
 from functools import wraps
 import os
+import hashlib
+import hmac
+import json
 import pickle
-from werkzeug.utils import secure_filename
-from deepface import DeepFace
 import time
-import numpy as np
+import threading
+import itertools
+from embedding_index import EmbeddingIndex
+from embedding_store import load_store
+from embedding_reloader import EmbeddingReloader
+from image_io import decode_image_bytes
+from app_logging import get_logger
+from metrics import registry as metrics_registry, STAGE_DURATION, RECOGNITIONS, PROMETHEUS_CONTENT_TYPE
+from face_engine import DetectorCascade, FaceNotDetectedError, warm_up
+from attendance_recap import build_recap, build_student_recap
+from live_feed import AttendanceFeed, feed_entry
+from attendance_store import insert_attendance, insert_attendance_rows
+from recognition_jobs import RecognitionJobQueue, DatabaseJobStore, QueueFullError
+from session_registry import SessionRegistry, SessionConflictError, DEFAULT_RUANGAN
 
 app = Flask(__name__)
+log = get_logger("app")
 app.config.from_object(Config)
 app.permanent_session_lifetime = timedelta(hours=8)
 db.init_app(app)
@@ -23,44 +39,189 @@ migrate = Migrate(app, db)
 MODEL_NAME = "VGG-Face"
 DETECTOR_BACKEND = "opencv"
 SIMILARITY_THRESHOLD = 0.55 # Threshold untuk Cosine SIMILARITY (lebih TINGGI lebih mirip)
-MASTER_EMBEDDINGS_FILE = "master_embeddings.pkl"
+MASTER_EMBEDDINGS_MANIFEST = "master_embeddings.json"  # + master_embeddings.npy (mmap)
+LEGACY_EMBEDDINGS_FILE = "master_embeddings.pkl"  # format lama, masih bisa dibaca
+# Verifikasi checksum membaca seluruh matriks; matikan jika store sangat besar
+VERIFY_EMBEDDINGS_CHECKSUM = False
+# Interval (detik) pengecekan perubahan file embedding oleh loader background
+EMBEDDINGS_WATCH_INTERVAL = 5.0
 
 # Alternative detector backends untuk fallback
 FALLBACK_DETECTORS = ["retinaface", "mtcnn", "ssd"]
 
-known_embeddings_data = []
+# Budget waktu (detik) untuk seluruh cascade deteksi wajah per permintaan
+DETECTION_BUDGET = 2.0
+
+face_cascade = DetectorCascade(MODEL_NAME, [DETECTOR_BACKEND] + FALLBACK_DETECTORS, budget=DETECTION_BUDGET)
+
+# Frame yang sisi terpanjangnya jauh di atas nilai ini didecode pada resolusi tereduksi
+MAX_DECODE_SIDE = 1280
+
+TOP_K = 3  # Jumlah kandidat teratas yang dikembalikan ke klien
+
+MIN_IMAGE_BYTES = 1000  # Upload frame lebih kecil dari ini dianggap rusak
+MIN_CROP_BYTES = 300  # Crop wajah JPEG dari klien jauh lebih kecil dari frame penuh
+
+MAX_BATCH_IMAGES = 32  # Batas jumlah gambar per permintaan batch
+MAX_INGEST_RECORDS = 500  # Batas jumlah rekaman absensi per permintaan /api/absen_batch
+INGEST_CLOCK_SKEW = timedelta(minutes=5)  # Toleransi jam perangkat terhadap waktu mulai/selesai sesi
+
+embedding_index = EmbeddingIndex.empty()
+
+_index_sequence = itertools.count(1)
+
+def build_embedding_index():
+    """
+    Bangun indeks baru dari file tanpa menyentuh indeks yang sedang dipakai.
+    Melempar exception jika file tidak ada atau tidak valid.
+    """
+    sequence = next(_index_sequence)
+    if os.path.exists(MASTER_EMBEDDINGS_MANIFEST):
+        log.info(f"Memuat store master embedding dari '{MASTER_EMBEDDINGS_MANIFEST}' (mmap)...")
+        index, manifest = load_store(
+            MASTER_EMBEDDINGS_MANIFEST,
+            model_name=MODEL_NAME,
+            verify_checksum=VERIFY_EMBEDDINGS_CHECKSUM
+        )
+        index.version = f"{sequence}-{manifest['checksum'].split(':')[-1][:8]}"
+    elif os.path.exists(LEGACY_EMBEDDINGS_FILE):
+        log.warning(f"Memuat format lama '{LEGACY_EMBEDDINGS_FILE}'. Konversi dengan: python embedding_store.py convert")
+        with open(LEGACY_EMBEDDINGS_FILE, 'rb') as f:
+            records = pickle.load(f)
+        index = EmbeddingIndex.from_records(records)
+        index.version = f"{sequence}-pkl"
+    else:
+        raise FileNotFoundError(f"File '{MASTER_EMBEDDINGS_MANIFEST}' tidak ditemukan. Jalankan create_master_embeddings.py terlebih dahulu.")
+    resolve_index_students(index)
+    return index
+
+def resolve_index_students(index):
+    """
+    Petakan setiap nama di indeks ke id mahasiswa dengan satu query saat
+    indeks dimuat, supaya jalur pengenalan tidak perlu lookup mahasiswa lagi.
+    Jika database tidak bisa diakses, id dari manifest tetap dipakai.
+    """
+    try:
+        with app.app_context():
+            rows = db.session.query(Mahasiswa.id, Mahasiswa.nama_mahasiswa).all()
+    except Exception as e:
+        log.warning(f"Gagal memetakan nama ke id mahasiswa, memakai id dari manifest: {e}")
+        return
+    resolved = index.resolve_student_ids({nama.lower(): mahasiswa_id for mahasiswa_id, nama in rows})
+    if resolved < len(index):
+        unresolved = [name for name, student_id in zip(index.names, index.student_ids) if student_id is None]
+        log.warning(f"{len(unresolved)} nama di master embedding tidak terdaftar di database: {unresolved[:10]}")
+
+def swap_embedding_index(new_index):
+    """
+    Pasang indeks baru. Assignment referensi bersifat atomik; request yang
+    sudah mengambil snapshot indeks lama tetap selesai dengan indeks lama.
+    """
+    global embedding_index
+    embedding_index = new_index
+    log.info(f"{len(new_index)} master embedding aktif (dimensi {new_index.dimension}, versi {new_index.version}).")
 
 # Muat data master embedding saat server pertama kali dimulai
 def load_master_embeddings():
-    global known_embeddings_data
-    if os.path.exists(MASTER_EMBEDDINGS_FILE):
-        try:
-            print(f"[INFO] Memuat data master embedding dari '{MASTER_EMBEDDINGS_FILE}'...")
-            with open(MASTER_EMBEDDINGS_FILE, 'rb') as f:
-                known_embeddings_data = pickle.load(f)
-            print(f"✅ {len(known_embeddings_data)} master embedding berhasil dimuat.")
-            
-            # Validasi data yang dimuat
-            for i, data in enumerate(known_embeddings_data):
-                if not isinstance(data, dict) or 'name' not in data or 'embedding' not in data:
-                    print(f"[WARNING] Data embedding ke-{i} tidak valid, dilewati.")
-                    continue
-                if not isinstance(data['embedding'], (list, np.ndarray)):
-                    print(f"[WARNING] Embedding untuk {data['name']} tidak valid.")
-                    
-        except Exception as e:
-            print(f"[ERROR] Gagal memuat master embedding: {e}")
-            known_embeddings_data = []
-    else:
-        print(f"[WARNING] File '{MASTER_EMBEDDINGS_FILE}' tidak ditemukan. Jalankan create_master_embeddings.py terlebih dahulu.")
+    try:
+        swap_embedding_index(build_embedding_index())
+    except FileNotFoundError as e:
+        log.warning("%s", e)
+    except Exception as e:
+        log.error(f"Gagal memuat master embedding: {e}")
+
+embedding_reloader = EmbeddingReloader(
+    build_embedding_index,
+    swap_embedding_index,
+    watch_paths=[MASTER_EMBEDDINGS_MANIFEST, LEGACY_EMBEDDINGS_FILE],
+    interval=EMBEDDINGS_WATCH_INTERVAL
+)
+
+# Status startup: tiap tahap dicatat durasinya (ms) dan dilaporkan di /api/system_info
+startup_status = {"ready": False, "error": None, "timings": {}}
+
+def _timed_startup_stage(stage, fn):
+    t0 = time.perf_counter()
+    result = fn()
+    startup_status["timings"][stage] = round((time.perf_counter() - t0) * 1000, 1)
+    return result
+
+def warm_up_models():
+    """
+    Bangun model + semua detector dan jalankan inferensi warm-up,
+    supaya permintaan pertama tidak menanggung biaya build graph TensorFlow.
+    """
+    try:
+        log.info("Memulai preload model dan warm-up...")
+        t0 = time.perf_counter()
+        dimension = warm_up(MODEL_NAME, [DETECTOR_BACKEND] + FALLBACK_DETECTORS, startup_status["timings"])
+        if len(embedding_index) and dimension != embedding_index.dimension:
+            log.warning(f"Dimensi model ({dimension}) berbeda dengan master embedding ({embedding_index.dimension}).")
+        startup_status["timings"]["warmup_total"] = round((time.perf_counter() - t0) * 1000, 1)
+        startup_status["ready"] = True
+        log.info(f"Warm-up selesai dalam {startup_status['timings']['warmup_total']} ms.")
+    except Exception as e:
+        startup_status["error"] = str(e)
+        log.error(f"Warm-up model gagal: {e}")
 
 # Load embeddings saat startup
-load_master_embeddings()
+_timed_startup_stage("load_embeddings", load_master_embeddings)
+
+if app.config['WATCH_EMBEDDINGS']:
+    embedding_reloader.start()
+
+if app.config['PRELOAD_MODELS']:
+    threading.Thread(target=warm_up_models, name="model-warmup", daemon=True).start()
+else:
+    # Tanpa preload, model dibangun lazy pada permintaan pertama
+    startup_status["ready"] = True
 
 # ===============================================
-# Variabel global untuk state sesi
-sesi_aktif = None
-mahasiswa_sudah_absen_server = set()
+# State sesi disimpan di database (per ruangan/perangkat) supaya aman untuk banyak worker;
+# tiap worker memakai cache read-through dengan TTL pendek
+SESSION_CACHE_TTL = 2.0  # detik
+session_registry = SessionRegistry(ttl=SESSION_CACHE_TTL)
+
+# Sinyal log absensi baru untuk dashboard (SSE); datanya selalu dibaca dari database
+attendance_feed = AttendanceFeed()
+LIVE_FEED_HEARTBEAT = 15  # detik, komentar keep-alive SSE saat tidak ada absensi baru
+LIVE_FEED_POLL_INTERVAL = 1.0  # detik, interval baca database untuk log yang di-commit worker lain
+
+# Job pengenalan asinkron (?async=1): hasil disimpan sebentar untuk polling/stream
+JOB_RESULT_TTL = 300  # detik
+JOB_MAX_WAIT = 30  # detik, batas long-poll ?wait=N
+JOB_POLL_INTERVAL = 0.5  # detik, interval baca database untuk job yang diterima worker lain
+STATUS_SESI_MAX_WAIT = 55  # detik, batas long-poll /api/status_sesi?wait=N
+
+# Long-poll dan SSE menahan satu thread per klien selama menunggu. Di worker
+# gunicorn "sync" (satu permintaan per proses) itu berarti satu worker penuh,
+# jadi long-poll langsung dijawab dan stream SSE ditutup setelah mengirim data
+# yang ada; EventSource tersambung ulang sendiri setelah `retry`.
+# Jalankan dengan gunicorn.conf.py (worker gthread) supaya long-poll tetap aktif.
+BLOCKING_WORKER_CLASSES = {"SyncWorker"}
+BLOCKING_WORKER_SSE_RETRY_MS = 5000
+
+def worker_is_blocking():
+    """
+    True jika permintaan dilayani worker yang hanya bisa memproses satu
+    permintaan sekaligus. Kelas worker diisi gunicorn.conf.py (PIFACE_WORKER_CLASS).
+    """
+    return os.environ.get('PIFACE_WORKER_CLASS') in BLOCKING_WORKER_CLASSES
+
+def long_poll_wait(max_wait):
+    """Nilai ?wait=N dibatasi max_wait; 0 (tanpa menahan) di worker sync"""
+    if worker_is_blocking():
+        return 0
+    return min(request.args.get('wait', 0, type=float), max_wait)
+
+def request_ruangan():
+    """
+    Ruangan/perangkat asal permintaan: field `ruangan` (JSON, form, atau query
+    string) atau header X-Ruangan. Klien lama tanpa ruangan memakai ruangan default.
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    ruangan = (data or {}).get('ruangan') or request.values.get('ruangan') or request.headers.get('X-Ruangan')
+    return str(ruangan or DEFAULT_RUANGAN).strip()[:50] or DEFAULT_RUANGAN
 
 # Decorator untuk memeriksa login dan peran secara konsisten
 def role_required(role):
@@ -75,10 +236,32 @@ def role_required(role):
         return decorated_function
     return decorator
 
+def device_token_required(f):
+    """
+    Endpoint khusus perangkat kamera: wajib header X-Device-Token (atau
+    Authorization: Bearer) yang cocok dengan salah satu token di DEVICE_TOKENS.
+    Ruangan pemilik token disimpan di g.device_ruangan.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.headers.get('X-Device-Token', '')
+        if not token and request.headers.get('Authorization', '').startswith('Bearer '):
+            token = request.headers['Authorization'][len('Bearer '):]
+        ruangan = None
+        if token:
+            # Bandingkan dengan semua token (waktu konstan) supaya tidak bocor lewat timing
+            for device_ruangan, device_token in app.config['DEVICE_TOKENS'].items():
+                if hmac.compare_digest(token.encode(), device_token.encode()):
+                    ruangan = device_ruangan
+        if ruangan is None:
+            log.warning("Token perangkat tidak valid untuk %s dari %s", request.path, request.remote_addr)
+            return jsonify({"message": "Token perangkat tidak valid."}), 401
+        g.device_ruangan = ruangan
+        return f(*args, **kwargs)
+    return decorated_function
+
 @app.route('/', methods=['GET', 'POST'])
 def login():
-    global sesi_aktif
-    sesi_aktif = None
     flask_session.clear()
     if request.method == 'POST':
         role = request.form.get('role')
@@ -112,6 +295,8 @@ def dashboard():
     dosen_id = flask_session.get('user_id')
     dosen = db.session.get(Dosen, dosen_id)
     jadwal_list = Jadwal.query.filter_by(dosen_id=dosen_id).order_by(Jadwal.id).all()
+    sesi_dosen = session_registry.active_sessions(dosen_id=dosen_id)
+    sesi_aktif = sesi_dosen[0] if sesi_dosen else None
     return render_template('dashboard.html', jadwal_list=jadwal_list, nama_dosen=dosen.nama_dosen, sesi_aktif=sesi_aktif)
 
 @app.route('/rekap')
@@ -119,300 +304,636 @@ def dashboard():
 def rekap():
     mahasiswa_id = flask_session.get('user_id')
     mahasiswa_terpilih = db.session.get(Mahasiswa, mahasiswa_id)
-    rekap_data = {}
-    semua_matakuliah = Matakuliah.query.order_by(Matakuliah.nama_mk).all()
-    for mk in semua_matakuliah:
-        rekap_data[mk.nama_mk] = ['Belum Diadakan'] * 16
-        sesi_terselenggara = SesiPerkuliahan.query.join(Jadwal).filter(Jadwal.mk_id == mk.id).filter(SesiPerkuliahan.waktu_selesai != None).all()
-        for sesi in sesi_terselenggara:
-            pertemuan_ke = sesi.pertemuan_ke
-            if pertemuan_ke and 1 <= pertemuan_ke <= 16:
-                log = LogAbsensi.query.filter_by(sesi_id=sesi.id, mahasiswa_id=mahasiswa_id).first()
-                if log: rekap_data[mk.nama_mk][pertemuan_ke - 1] = 'Hadir'
-                else: rekap_data[mk.nama_mk][pertemuan_ke - 1] = 'Tidak Hadir'
+    rekap_data = build_student_recap(mahasiswa_id)
     return render_template('rekap.html', rekap_data=rekap_data, mahasiswa_terpilih=mahasiswa_terpilih)
 
 # --- API ENDPOINTS DENGAN OTORISASI YANG BENAR ---
+@app.route('/api/rekap')
+@role_required('dosen')
+def rekap_bulk():
+    """
+    Rekap absensi banyak mahasiswa sekaligus (satu query).
+    Parameter opsional: mk_id=<id mata kuliah>, mahasiswa_id=<id>,<id>,...
+    """
+    try:
+        mk_id = request.args.get('mk_id', type=int)
+        mahasiswa_param = request.args.get('mahasiswa_id', '').strip()
+        mahasiswa_ids = [int(i) for i in mahasiswa_param.split(',') if i.strip()] if mahasiswa_param else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "Parameter mahasiswa_id harus berupa daftar angka."}), 400
+
+    recap = build_recap(mahasiswa_ids=mahasiswa_ids, mk_id=mk_id)
+    return jsonify({
+        "mk_id": mk_id,
+        "jumlah_mahasiswa": len(recap),
+        "rekap": [
+            {"mahasiswa_id": mhs_id, "nama_mahasiswa": entry["nama_mahasiswa"], "matakuliah": entry["rekap"]}
+            for mhs_id, entry in recap.items()
+        ]
+    })
+
 @app.route('/api/mulai_sesi', methods=['POST'])
 @role_required('dosen')
 def mulai_sesi():
-    global sesi_aktif, mahasiswa_sudah_absen_server
-    if sesi_aktif: return jsonify({"status": "error", "message": "Sesi lain masih aktif."}), 400
-    mahasiswa_sudah_absen_server.clear()
-    sesi_baru = SesiPerkuliahan(
-        jadwal_id=request.json.get('jadwal_id'), 
-        dosen_pengajar_id=flask_session['user_id'],
-        pertemuan_ke=request.json.get('pertemuan_ke'),
-        waktu_mulai=datetime.now()
-    )
-    db.session.add(sesi_baru)
-    db.session.commit()
-    sesi_aktif = {"sesi_db_id": sesi_baru.id, "jadwal_id": request.json.get('jadwal_id')}
-    print(f"Sesi Dimulai: {sesi_aktif}")
-    return jsonify({"status": "sukses", "message": f"Sesi untuk pertemuan ke-{sesi_baru.pertemuan_ke} berhasil dimulai"})
+    ruangan = request_ruangan()
+    try:
+        sesi_aktif = session_registry.start(
+            ruangan,
+            jadwal_id=request.json.get('jadwal_id'),
+            dosen_id=flask_session['user_id'],
+            pertemuan_ke=request.json.get('pertemuan_ke')
+        )
+    except SessionConflictError:
+        return jsonify({"status": "error", "message": f"Sesi lain masih aktif di ruangan {ruangan}."}), 400
+    log.info(f"Sesi Dimulai: {sesi_aktif}")
+    return jsonify({
+        "status": "sukses",
+        "message": f"Sesi untuk pertemuan ke-{sesi_aktif['pertemuan_ke']} berhasil dimulai",
+        "sesi_id": sesi_aktif['sesi_db_id'],
+        "ruangan": ruangan
+    })
 
 @app.route('/api/selesai_sesi', methods=['POST'])
 @role_required('dosen')
 def selesai_sesi():
-    global sesi_aktif, mahasiswa_sudah_absen_server
-    if not sesi_aktif: return jsonify({"status": "error", "message": "Tidak ada sesi aktif."}), 400
-    sesi_id = sesi_aktif['sesi_db_id']
-    sesi_db = db.session.get(SesiPerkuliahan, sesi_id)
-    if sesi_db:
-        sesi_db.waktu_selesai = datetime.now()
-        db.session.commit()
-    mahasiswa_sudah_absen_server.clear()
-    print(f"Sesi Selesai, ID: {sesi_id}")
-    sesi_aktif = None
+    ruangan = request_ruangan()
+    sesi_selesai = session_registry.finish(ruangan)
+    if not sesi_selesai: return jsonify({"status": "error", "message": "Tidak ada sesi aktif."}), 400
+    sesi_id = sesi_selesai['sesi_db_id']
+    attendance_feed.close(sesi_id)
+    log.info(f"Sesi Selesai, ID: {sesi_id}, ruangan: {ruangan}")
     return jsonify({"status": "sukses", "message": "Sesi telah berakhir"})
 
-def cosine_similarity(source_embedding, target_embedding):
+def detector_label(report):
+    """Nama backend detector untuk label metrik (tanpa keterangan enforce_detection)"""
+    return report.get("backend") or "none"
+
+def public_detection_report(report):
+    """Report deteksi untuk respons JSON: tanpa durasi mentah (detik) yang hanya dipakai metrik"""
+    return {key: value for key, value in report.items() if key != "elapsed_s"}
+
+def create_embedding_with_fallback(image, client_detection=None):
     """
-    Hitung cosine similarity antara dua embedding
+    Buat embedding dengan cascade detector adaptif.
+    `image` boleh berupa path file atau array BGR hasil decode.
+    Jika `client_detection` diisi, `image` sudah berupa crop wajah yang
+    disejajarkan klien sehingga deteksi dilewati (detector_backend="skip").
+    Mengembalikan (embedding, report deteksi).
     """
     try:
-        a = np.asarray(source_embedding)
-        b = np.asarray(target_embedding)
-        
-        # Pastikan tidak ada pembagian dengan nol
-        norm_a = np.linalg.norm(a)
-        norm_b = np.linalg.norm(b)
-        
-        if norm_a == 0 or norm_b == 0:
-            return 0.0
-            
-        return np.dot(a, b) / (norm_a * norm_b)
-    except Exception as e:
-        print(f"[ERROR] Gagal menghitung cosine similarity: {e}")
-        return 0.0
+        if client_detection is not None:
+            face, report = face_cascade.skip(image, client_detection)
+        else:
+            face, report = face_cascade.detect(image)
+    except FaceNotDetectedError as e:
+        STAGE_DURATION.observe(e.report["elapsed_s"], stage="detection", detector="none", outcome="no_face")
+        raise
+    detector = detector_label(report)
+    STAGE_DURATION.observe(report["elapsed_s"], stage="detection", detector=detector, outcome="ok")
+
+    with STAGE_DURATION.time(stage="embedding", detector=detector, outcome="ok"):
+        embedding = face_cascade.embed_fn([face], MODEL_NAME)[0]
+    log.debug("Embedding dibuat dengan %s (%s ms, budget terpakai: %s)", report['detector'], report['elapsed_ms'], report['budget_used'])
+    return embedding, report
 
-def create_embedding_with_fallback(image_path):
+def build_recognition_info(match, detection_report):
     """
-    Buat embedding dengan fallback ke detector lain jika gagal
+    Field tambahan respons pengenalan: detector, budget, margin, dan top-k
     """
-    # Coba detector utama dulu
-    try:
-        embedding = DeepFace.represent(
-            img_path=image_path,
-            model_name=MODEL_NAME,
-            enforce_detection=True,
-            detector_backend=DETECTOR_BACKEND,
-            align=True
-        )[0]["embedding"]
-        print(f"[SUCCESS] Embedding berhasil dibuat dengan {DETECTOR_BACKEND}")
-        return embedding
-    except Exception as e:
-        print(f"[WARNING] Detector {DETECTOR_BACKEND} gagal: {e}")
-    
-    # Coba detector fallback
-    for detector in FALLBACK_DETECTORS:
-        try:
-            embedding = DeepFace.represent(
-                img_path=image_path,
-                model_name=MODEL_NAME,
-                enforce_detection=True,
-                detector_backend=detector,
-                align=True
-            )[0]["embedding"]
-            print(f"[SUCCESS] Embedding berhasil dibuat dengan {detector}")
-            return embedding
-        except Exception as e:
-            print(f"[WARNING] Detector {detector} gagal: {e}")
-            continue
-    
-    # Terakhir, coba dengan enforce_detection=False
-    try:
-        embedding = DeepFace.represent(
-            img_path=image_path,
-            model_name=MODEL_NAME,
-            enforce_detection=False,  # Lebih permisif
-            detector_backend=DETECTOR_BACKEND,
-            align=True
-        )[0]["embedding"]
-        print(f"[SUCCESS] Embedding berhasil dibuat dengan enforce_detection=False")
-        return embedding
-    except Exception as e:
-        print(f"[ERROR] Semua metode gagal: {e}")
-        raise e
+    return {
+        "detector": detection_report["detector"],
+        "budget_used": detection_report["budget_used"],
+        "margin": round(match["margin"], 3),
+        "top_k": [{"name": c["name"], "similarity": round(c["similarity"], 3)} for c in match["top_k"]]
+    }
 
 # === FUNGSI INTI YANG DITINGKATKAN ===
-# Perbaikan untuk fungsi recognize_and_attend dengan debugging yang lebih baik
+
+def wants_async():
+    """
+    Mode asinkron diminta lewat ?async=1 atau header "Prefer: respond-async"
+    """
+    return request.args.get('async') == '1' or 'respond-async' in request.headers.get('Prefer', '')
 
 @app.route('/api/recognize_and_attend', methods=['POST'])
 def recognize_and_attend():
-    if not sesi_aktif: 
-        print("[DEBUG] Sesi tidak aktif")
-        return jsonify({"message": "Sesi tidak aktif, absensi ditolak."}), 400
+    # Snapshot indeks: reload di background tidak memengaruhi permintaan yang sedang berjalan
+    index = embedding_index
+    ruangan = request_ruangan()
+    upload, error = _read_recognition_upload(index, ruangan)
+    if error:
+        payload, status, outcome = error
+    elif wants_async():
+        return submit_recognition_job(ruangan, **upload)
+    else:
+        payload, status, outcome = process_recognition(index, ruangan, **upload)
+    RECOGNITIONS.inc(endpoint="single", outcome=outcome)
+    payload["index_version"] = index.version
+    return jsonify(payload), status
+
+def parse_face_meta(raw):
+    """
+    Metadata crop wajah dari klien (field form `face_meta`, JSON):
+    {"box": [x, y, w, h], "keypoints": [[x, y], ...], "frame_size": [w, h]}
+    dalam piksel frame asli klien. Melempar ValueError jika tidak valid.
+    """
+    try:
+        meta = json.loads(raw)
+    except ValueError:
+        raise ValueError("face_meta harus JSON.")
+    if not isinstance(meta, dict):
+        raise ValueError("face_meta harus berupa objek.")
+    box = meta.get('box')
+    if not isinstance(box, list) or len(box) != 4 or not all(isinstance(v, (int, float)) for v in box):
+        raise ValueError("face_meta.box harus [x, y, w, h].")
+    keypoints = meta.get('keypoints') or []
+    if not isinstance(keypoints, list) or not all(
+            isinstance(p, list) and len(p) == 2 and all(isinstance(v, (int, float)) for v in p) for p in keypoints):
+        raise ValueError("face_meta.keypoints harus list [x, y].")
+    frame_size = meta.get('frame_size')
+    return {"box": box, "keypoints": keypoints, "frame_size": frame_size if isinstance(frame_size, list) else None}
+
+def _read_recognition_upload(index, ruangan):
+    """
+    Validasi murah sebelum pipeline DeepFace: sesi, indeks, dan file upload.
+    Field form `face_meta` menandai upload sebagai crop wajah dari klien.
+    Mengembalikan ({"image_bytes", "client_detection"}, None) atau (None, (payload, status, outcome)).
+    """
+    if not session_registry.get(ruangan):
+        log.debug("Sesi tidak aktif")
+        return None, ({"message": "Sesi tidak aktif, absensi ditolak."}, 400, "no_session")
     
-    if not known_embeddings_data:
-        print("[DEBUG] Master embedding belum dimuat")
-        return jsonify({"message": "Master embedding belum dimuat. Hubungi administrator."}), 500
+    if not len(index):
+        log.warning("Master embedding belum dimuat")
+        return None, ({"message": "Master embedding belum dimuat. Hubungi administrator."}, 500, "no_index")
     
     if 'image' not in request.files: 
-        print("[DEBUG] Tidak ada file gambar")
-        return jsonify({"message": "Tidak ada file gambar."}), 400
+        log.debug("Tidak ada file gambar")
+        return None, ({"message": "Tidak ada file gambar."}, 400, "bad_request")
     
     file = request.files['image']
     if not file or file.filename == '': 
-        print("[DEBUG] File gambar tidak valid")
-        return jsonify({"message": "File gambar tidak valid."}), 400
-    
-    filename = secure_filename(f"{int(time.time())}_capture.jpg")
-    temp_path = os.path.join("/tmp", filename)
-    
+        log.debug("File gambar tidak valid")
+        return None, ({"message": "File gambar tidak valid."}, 400, "bad_request")
+
+    client_detection = None
+    if request.form.get('face_meta'):
+        try:
+            client_detection = parse_face_meta(request.form['face_meta'])
+        except ValueError as e:
+            return None, ({"message": str(e)}, 400, "bad_request")
+
+    # Baca upload langsung dari stream request, tanpa menyimpan ke disk
+    return {"image_bytes": file.read(), "client_detection": client_detection}, None
+
+def process_recognition(index, ruangan, image_bytes, client_detection=None):
+    """
+    Pipeline pengenalan lengkap untuk satu gambar (decode, deteksi, embedding,
+    matching, simpan absensi). Tidak bergantung pada objek request, sehingga
+    bisa dijalankan di thread request maupun di worker job asinkron.
+    Dengan `client_detection`, gambar adalah crop wajah dan deteksi dilewati.
+    Mengembalikan (payload, status HTTP, outcome untuk metrik)
+    """
+    sesi_aktif = session_registry.get(ruangan)
+    if not sesi_aktif:
+        # Sesi bisa berakhir selama job menunggu di antrean
+        return {"message": "Sesi tidak aktif, absensi ditolak."}, 400, "no_session"
+
     try:
-        file.save(temp_path)
-        print(f"[DEBUG] Gambar disimpan: {temp_path}")
-        
-        # Validasi ukuran file
-        file_size = os.path.getsize(temp_path)
-        if file_size < 1000:  # Kurang dari 1KB
-            print(f"[DEBUG] File terlalu kecil: {file_size} bytes")
-            return jsonify({"message": "Gambar terlalu kecil atau rusak."}), 400
+        with STAGE_DURATION.time(stage="decode", detector="none", outcome="ok") as stage:
+            # Validasi ukuran file
+            file_size = len(image_bytes)
+            if file_size < (MIN_CROP_BYTES if client_detection is not None else MIN_IMAGE_BYTES):
+                image = None
+            else:
+                try:
+                    image = decode_image_bytes(image_bytes, max_side=MAX_DECODE_SIDE)
+                except ValueError as decode_error:
+                    log.debug("%s", decode_error)
+                    image = None
+            if image is None:
+                stage["outcome"] = "bad_image"
+        if image is None:
+            log.debug("Gambar terlalu kecil atau rusak: %s bytes", file_size)
+            return {"message": "Gambar terlalu kecil atau rusak."}, 400, "bad_image"
         
-        print(f"[DEBUG] Ukuran file: {file_size} bytes")
-        print("[DEBUG] Membuat embedding untuk gambar baru...")
+        log.debug("Ukuran file: %s bytes, resolusi decode: %sx%s", file_size, image.shape[1], image.shape[0])
         
         # 1. Buat embedding untuk gambar yang baru datang
-        live_embedding = create_embedding_with_fallback(temp_path)
-        print("[DEBUG] Embedding berhasil dibuat.")
-        
-        # 2. Cari yang paling cocok dari data MASTER EMBEDDING
-        best_match_name = "Tidak Dikenal"
-        highest_similarity = 0.0
-        
-        print(f"[DEBUG] Membandingkan dengan {len(known_embeddings_data)} master embedding...")
+        try:
+            live_embedding, detection_report = create_embedding_with_fallback(image, client_detection)
+        except FaceNotDetectedError as e:
+            log.debug("%s", e)
+            return {
+                "message": "Wajah tidak terdeteksi pada gambar.",
+                "recognized": False,
+                "detection": public_detection_report(e.report)
+            }, 400, "no_face"
+        detector = detector_label(detection_report)
         
-        for i, data in enumerate(known_embeddings_data):
-            try:
-                similarity = cosine_similarity(live_embedding, data["embedding"])
-                print(f"[DEBUG] Similarity dengan {data['name']}: {similarity:.3f}")
-                if similarity > highest_similarity:
-                    highest_similarity = similarity
-                    best_match_name = data["name"]
-            except Exception as e:
-                print(f"[ERROR] Gagal membandingkan dengan {data.get('name', 'Unknown')}: {e}")
-                continue
+        # 2. Cari yang paling cocok dari data MASTER EMBEDDING (satu perkalian matriks-vektor)
+        with STAGE_DURATION.time(stage="matching", detector=detector, outcome="recognized") as stage:
+            match = index.match(live_embedding, top_k=TOP_K)
+            if match["similarity"] < SIMILARITY_THRESHOLD:
+                stage["outcome"] = "unrecognized"
+        best_match_name = match["name"] or "Tidak Dikenal"
+        highest_similarity = match["similarity"]
+        recognition_info = build_recognition_info(match, detection_report)
         
-        print(f"[DEBUG] Best match: {best_match_name} dengan similarity: {highest_similarity:.3f}")
-        print(f"[DEBUG] Threshold: {SIMILARITY_THRESHOLD}")
+        log.debug("Best match: %s dengan similarity %.3f (margin %.3f, threshold %s, dari %s master embedding)",
+                  best_match_name, highest_similarity, match['margin'], SIMILARITY_THRESHOLD, len(index))
         
         # 3. Periksa apakah kemiripan terbaik sudah melewati ambang batas
         if highest_similarity >= SIMILARITY_THRESHOLD:
             name = best_match_name
-            print(f"[DEBUG] Similarity melewati threshold, nama: {name}")
             
-            # Cek apakah sudah absen di sesi ini
-            if name in mahasiswa_sudah_absen_server:
-                print(f"[DEBUG] {name} sudah absen di server cache")
-                return jsonify({"message": f"{name} sudah tercatat absen."})
+            # id mahasiswa sudah dipetakan saat indeks dimuat, tidak perlu lookup ke database
+            mahasiswa_id = match["student_id"]
             
-            # Cari mahasiswa di database dengan case-insensitive
-            print(f"[DEBUG] Mencari mahasiswa dengan nama: {name}")
-            mahasiswa = Mahasiswa.query.filter(db.func.lower(Mahasiswa.nama_mahasiswa) == name.lower()).first()
+            # Cek apakah sudah absen di sesi ini
+            if session_registry.has_attended(sesi_aktif['sesi_db_id'], mahasiswa_id):
+                log.debug("%s sudah absen (cache server)", name)
+                return {"message": f"{name} sudah tercatat absen.", "recognized": True, "name": name, **recognition_info}, 200, "already_attended"
             
-            if mahasiswa:
-                print(f"[DEBUG] Mahasiswa ditemukan: ID={mahasiswa.id}, Nama={mahasiswa.nama_mahasiswa}")
-                
-                # Cek apakah sudah absen di database untuk sesi ini
-                existing_log = LogAbsensi.query.filter_by(
-                    sesi_id=sesi_aktif['sesi_db_id'], 
-                    mahasiswa_id=mahasiswa.id
-                ).first()
-                
-                if existing_log:
-                    print(f"[DEBUG] {name} sudah absen di database")
-                    mahasiswa_sudah_absen_server.add(name)  # Sync cache
-                    return jsonify({"message": f"{name} sudah tercatat absen di database."})
-                
+            if mahasiswa_id is not None:
                 try:
-                    # Catat absensi baru
-                    print(f"[DEBUG] Membuat log absensi baru...")
-                    log_baru = LogAbsensi(
-                        sesi_id=sesi_aktif['sesi_db_id'], 
-                        mahasiswa_id=mahasiswa.id, 
-                        waktu_absen=datetime.now()
-                    )
-                    
-                    print(f"[DEBUG] Log absensi: sesi_id={log_baru.sesi_id}, mahasiswa_id={log_baru.mahasiswa_id}")
-                    
-                    db.session.add(log_baru)
-                    db.session.commit()
-                    
-                    print(f"[DEBUG] Absensi berhasil disimpan ke database")
+                    # Catat absensi baru; duplikat ditolak oleh unique constraint (satu statement)
+                    sesi_id = sesi_aktif['sesi_db_id']
+                    with STAGE_DURATION.time(stage="db_write", detector=detector, outcome="inserted") as stage:
+                        inserted = insert_attendance(sesi_id, [mahasiswa_id])
+                        db.session.commit()
+                        if not inserted:
+                            stage["outcome"] = "duplicate"
+
+                    if not inserted:
+                        log.debug("%s sudah absen di database", name)
+                        session_registry.mark_attended(sesi_id, [mahasiswa_id])  # Sync cache
+                        return {"message": f"{name} sudah tercatat absen di database.", "recognized": True, "name": name, **recognition_info}, 200, "already_attended"
+
+                    log_id = inserted[mahasiswa_id][0]
+                    attendance_feed.publish(sesi_id)
                     
                     # Tambahkan ke cache server
-                    mahasiswa_sudah_absen_server.add(name)
-                    
-                    # Verifikasi apakah data benar-benar tersimpan
-                    verify_log = LogAbsensi.query.filter_by(
-                        sesi_id=sesi_aktif['sesi_db_id'], 
-                        mahasiswa_id=mahasiswa.id
-                    ).first()
-                    
-                    if verify_log:
-                        print(f"[DEBUG] ✅ Verifikasi: Data absensi tersimpan dengan ID {verify_log.id}")
-                    else:
-                        print(f"[DEBUG] ❌ Verifikasi: Data absensi TIDAK tersimpan!")
+                    session_registry.mark_attended(sesi_id, [mahasiswa_id])
                         
-                    print(f"[SUCCESS] Absensi berhasil untuk: {name} (Similarity: {highest_similarity:.3f})")
+                    log.info("Absensi berhasil untuk %s (similarity %.3f, log ID %s)", name, highest_similarity, log_id)
                     
-                    return jsonify({
+                    return {
                         "message": f"Absensi {name} berhasil disimpan! (Similarity: {highest_similarity:.2f})",
                         "recognized": True,
                         "name": name,
                         "similarity": round(highest_similarity, 3),
-                        "saved_to_db": True
-                    })
+                        "saved_to_db": True,
+                        **recognition_info
+                    }, 200, "attended"
                     
                 except Exception as db_error:
-                    print(f"[ERROR] Gagal menyimpan ke database: {db_error}")
+                    log.error("Gagal menyimpan absensi ke database: %s", db_error)
                     db.session.rollback()  # Rollback jika ada error
-                    return jsonify({
+                    return {
                         "message": f"Wajah dikenali sebagai {name}, tapi gagal menyimpan absensi: {str(db_error)}",
                         "recognized": True,
                         "name": name,
                         "similarity": round(highest_similarity, 3),
-                        "saved_to_db": False
-                    }), 500
+                        "saved_to_db": False,
+                        **recognition_info
+                    }, 500, "db_error"
                     
             else:
-                print(f"[DEBUG] Mahasiswa dengan nama '{name}' TIDAK ditemukan di database")
-                # Tampilkan semua mahasiswa untuk debugging
-                all_mahasiswa = Mahasiswa.query.all()
-                print(f"[DEBUG] Daftar mahasiswa di database:")
-                for mhs in all_mahasiswa:
-                    print(f"  - ID: {mhs.id}, Nama: '{mhs.nama_mahasiswa}'")
+                log.warning("Mahasiswa '%s' tidak terdaftar di database (indeks versi %s)", name, index.version)
                 
-                return jsonify({
+                return {
                     "message": f"Wajah dikenali sebagai '{name}', tapi tidak terdaftar di database.",
                     "recognized": True,
                     "name": name,
                     "similarity": round(highest_similarity, 3),
-                    "saved_to_db": False
-                })
+                    "saved_to_db": False,
+                    **recognition_info
+                }, 200, "unregistered"
         else:
-            print(f"[DEBUG] Similarity {highest_similarity:.3f} di bawah threshold {SIMILARITY_THRESHOLD}")
-            return jsonify({
+            log.debug("Similarity %.3f di bawah threshold %s", highest_similarity, SIMILARITY_THRESHOLD)
+            return {
                 "message": f"Wajah terdeteksi, tapi tidak dikenali (Similarity tertinggi: {highest_similarity:.2f}).",
                 "recognized": False,
                 "similarity": round(highest_similarity, 3),
-                "best_match": best_match_name
-            })
+                "best_match": best_match_name,
+                **recognition_info
+            }, 200, "unrecognized"
             
     except Exception as e:
-        print(f"❌ [ERROR] Gagal memproses gambar: {e}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({"message": f"Error memproses gambar: {str(e)}"}), 500
-    finally:
-        # Bersihkan file temporary
-        if os.path.exists(temp_path):
+        log.exception("Gagal memproses gambar: %s", e)
+        return {"message": f"Error memproses gambar: {str(e)}"}, 500, "error"
+
+def run_recognition_job(job):
+    """
+    Dijalankan worker inferensi: proses gambar dari antrean di app context sendiri
+    """
+    payload = job["payload"]
+    with app.app_context():
+        index = embedding_index
+        result, status, outcome = process_recognition(
+            index, payload["ruangan"], payload["image_bytes"], payload.get("client_detection"))
+        result["index_version"] = index.version
+    RECOGNITIONS.inc(endpoint="async", outcome=outcome)
+    return status, result
+
+recognition_jobs = RecognitionJobQueue(
+    run_recognition_job,
+    workers=app.config['INFERENCE_WORKERS'],
+    max_queue=app.config['JOB_QUEUE_SIZE'],
+    result_ttl=JOB_RESULT_TTL,
+    # Status & hasil di database: polling/stream bisa mendarat di worker gunicorn mana saja
+    store=DatabaseJobStore(app),
+    poll_interval=JOB_POLL_INTERVAL
+)
+
+def submit_recognition_job(ruangan, image_bytes, client_detection=None):
+    try:
+        job = recognition_jobs.submit(ruangan=ruangan, image_bytes=image_bytes, client_detection=client_detection)
+    except QueueFullError as e:
+        RECOGNITIONS.inc(endpoint="async", outcome="queue_full")
+        response = jsonify({"message": str(e), "queue_depth": recognition_jobs.depth()})
+        response.headers["Retry-After"] = "1"
+        return response, 503
+    return jsonify({
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": url_for('get_recognition_job', job_id=job["job_id"]),
+        "stream_url": url_for('stream_recognition_job', job_id=job["job_id"]),
+        "queue_depth": recognition_jobs.depth()
+    }), 202, {"Location": url_for('get_recognition_job', job_id=job["job_id"])}
+
+@app.route('/api/jobs/<job_id>')
+def get_recognition_job(job_id):
+    """
+    Status/hasil job pengenalan. ?wait=N menunggu hingga N detik (long-poll)
+    sampai job selesai.
+    """
+    wait = long_poll_wait(JOB_MAX_WAIT)
+    job = recognition_jobs.wait(job_id, wait) if wait > 0 else recognition_jobs.get(job_id)
+    if job is None:
+        return jsonify({"message": "Job tidak ditemukan atau sudah kedaluwarsa."}), 404
+    return jsonify(job), 200
+
+@app.route('/api/jobs/<job_id>/stream')
+def stream_recognition_job(job_id):
+    """
+    Server-Sent Events: event "status" setiap perubahan/keep-alive, lalu
+    event "result" begitu job selesai.
+    """
+    if recognition_jobs.get(job_id) is None:
+        return jsonify({"message": "Job tidak ditemukan atau sudah kedaluwarsa."}), 404
+
+    blocking = worker_is_blocking()
+
+    def generate():
+        while True:
+            job = recognition_jobs.get(job_id) if blocking else recognition_jobs.wait(job_id, LIVE_FEED_HEARTBEAT)
+            if job is None:
+                yield _sse_event("error", {"message": "Job tidak ditemukan atau sudah kedaluwarsa."})
+                return
+            if job["status"] == "done":
+                yield _sse_event("result", job)
+                return
+            yield _sse_event("status", {"job_id": job_id, "status": job["status"], "queue_depth": recognition_jobs.depth()})
+            if blocking:
+                # Worker sync: jangan tahan worker, klien tersambung ulang setelah retry
+                yield f"retry: {BLOCKING_WORKER_SSE_RETRY_MS}\n\n"
+                return
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route('/api/recognize_and_attend_batch', methods=['POST'])
+def recognize_and_attend_batch():
+    """
+    Pengenalan banyak gambar dalam satu permintaan multipart (field 'images').
+    Semua wajah di-embed dalam satu tensor batch, dicocokkan dengan satu
+    perkalian matriks, dan absensinya dicatat dalam satu transaksi.
+    """
+    # Snapshot indeks untuk seluruh batch
+    index = embedding_index
+    sesi_aktif = session_registry.get(request_ruangan())
+
+    if not sesi_aktif:
+        return jsonify({"message": "Sesi tidak aktif, absensi ditolak.", "index_version": index.version}), 400
+
+    if not len(index):
+        return jsonify({"message": "Master embedding belum dimuat. Hubungi administrator.", "index_version": index.version}), 500
+
+    files = [f for f in request.files.getlist('images') if f and f.filename != '']
+    if not files:
+        return jsonify({"message": "Tidak ada file gambar.", "index_version": index.version}), 400
+    if len(files) > MAX_BATCH_IMAGES:
+        return jsonify({"message": f"Maksimal {MAX_BATCH_IMAGES} gambar per permintaan.", "index_version": index.version}), 400
+
+    sesi_id = sesi_aktif['sesi_db_id']
+    # saved_to_db selalu ada di setiap hasil; hanya absensi baru yang menjadi True
+    results = [{"index": i, "filename": f.filename, "saved_to_db": False} for i, f in enumerate(files)]
+
+    # 1. Decode + deteksi per gambar (detector tidak bisa di-batch)
+    faces = []
+    face_owners = []
+    reports = {}
+    for i, file in enumerate(files):
+        with STAGE_DURATION.time(stage="decode", detector="none", outcome="ok") as stage:
+            image_bytes = file.read()
             try:
-                os.remove(temp_path)
-                print(f"[DEBUG] File temporary {temp_path} dihapus")
-            except Exception as e:
-                print(f"[WARNING] Gagal menghapus file temporary: {e}")
+                if len(image_bytes) < MIN_IMAGE_BYTES:
+                    raise ValueError("Gambar terlalu kecil.")
+                image = decode_image_bytes(image_bytes, max_side=MAX_DECODE_SIDE)
+            except ValueError:
+                image = None
+                stage["outcome"] = "bad_image"
+        if image is None:
+            results[i].update({"recognized": False, "message": "Gambar terlalu kecil atau rusak."})
+            RECOGNITIONS.inc(endpoint="batch", outcome="bad_image")
+            continue
+        try:
+            face, reports[i] = face_cascade.detect(image)
+        except FaceNotDetectedError as e:
+            STAGE_DURATION.observe(e.report["elapsed_s"], stage="detection", detector="none", outcome="no_face")
+            results[i].update({"recognized": False, "message": "Wajah tidak terdeteksi pada gambar.", "detection": public_detection_report(e.report)})
+            RECOGNITIONS.inc(endpoint="batch", outcome="no_face")
+            continue
+        STAGE_DURATION.observe(reports[i]["elapsed_s"], stage="detection", detector=detector_label(reports[i]), outcome="ok")
+        faces.append(face)
+        face_owners.append(i)
+
+    if not faces:
+        return jsonify({"sesi_id": sesi_id, "results": results, "index_version": index.version})
+
+    try:
+        # 2. Satu forward pass untuk semua wajah, lalu satu perkalian matriks
+        # Satu forward pass mencakup wajah dari berbagai detector, jadi label detector = "batch"
+        with STAGE_DURATION.time(stage="embedding", detector="batch", outcome="ok"):
+            embeddings = face_cascade.embed_fn(faces, MODEL_NAME)
+        with STAGE_DURATION.time(stage="matching", detector="batch", outcome="ok"):
+            matches = index.match_batch(embeddings, top_k=TOP_K)
+
+        # id mahasiswa sudah dipetakan saat indeks dimuat -> {mahasiswa_id: [indeks hasil]}
+        recognized = {}
+        for i, match in zip(face_owners, matches):
+            is_recognized = match["similarity"] >= SIMILARITY_THRESHOLD
+            results[i].update({
+                "recognized": is_recognized,
+                # Sama seperti endpoint tunggal: kandidat di bawah threshold bukan "name"
+                ("name" if is_recognized else "best_match"): match["name"],
+                "similarity": round(match["similarity"], 3),
+                **build_recognition_info(match, reports[i])
+            })
+            if not is_recognized:
+                results[i]["message"] = f"Wajah terdeteksi, tapi tidak dikenali (Similarity tertinggi: {match['similarity']:.2f})."
+                RECOGNITIONS.inc(endpoint="batch", outcome="unrecognized")
+            elif match["student_id"] is None:
+                results[i]["message"] = f"Wajah dikenali sebagai '{match['name']}', tapi tidak terdaftar di database."
+                RECOGNITIONS.inc(endpoint="batch", outcome="unregistered")
+            else:
+                recognized.setdefault(match["student_id"], []).append(i)
+
+        # 3. Satu INSERT idempoten untuk semua mahasiswa, satu commit
+        with STAGE_DURATION.time(stage="db_write", detector="batch", outcome="inserted") as stage:
+            inserted = insert_attendance(sesi_id, list(recognized))
+            if inserted:
+                db.session.commit()
+            else:
+                stage["outcome"] = "duplicate"
+        if inserted:
+            session_registry.mark_attended(sesi_id, inserted)
+            attendance_feed.publish(sesi_id)
+
+        for mahasiswa_id, indices in recognized.items():
+            for n, i in enumerate(indices):
+                name = results[i]["name"]
+                # Wajah yang sama bisa muncul di beberapa gambar; hanya yang pertama dicatat
+                if mahasiswa_id in inserted and n == 0:
+                    results[i].update({"saved_to_db": True, "message": f"Absensi {name} berhasil disimpan! (Similarity: {results[i]['similarity']:.2f})"})
+                    RECOGNITIONS.inc(endpoint="batch", outcome="attended")
+                else:
+                    results[i]["message"] = f"{name} sudah tercatat absen."
+                    RECOGNITIONS.inc(endpoint="batch", outcome="already_attended")
+
+        log.info("Batch %s gambar: %s wajah, %s absensi baru disimpan.", len(files), len(faces), len(inserted))
+        return jsonify({"sesi_id": sesi_id, "saved": len(inserted), "results": results, "index_version": index.version})
+
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Gagal memproses batch: %s", e)
+        RECOGNITIONS.inc(len(faces), endpoint="batch", outcome="error")
+        return jsonify({"message": f"Error memproses batch: {str(e)}", "index_version": index.version}), 500
+
+def parse_ingest_record(record):
+    """
+    Validasi satu rekaman spool klien. Mengembalikan (client_id, nama, sesi_id, waktu)
+    atau melempar ValueError.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Rekaman harus berupa objek.")
+    nama = str(record.get('nama') or '').strip()
+    if not nama:
+        raise ValueError("nama diperlukan.")
+    try:
+        sesi_id = int(record.get('sesi_id'))
+    except (TypeError, ValueError):
+        raise ValueError("sesi_id tidak valid.")
+    waktu = record.get('waktu')
+    try:
+        waktu = datetime.fromisoformat(waktu) if waktu else datetime.now()
+    except (TypeError, ValueError):
+        raise ValueError("waktu harus format ISO 8601.")
+    if waktu.tzinfo is not None:
+        # Waktu sesi disimpan sebagai waktu lokal tanpa zona
+        waktu = waktu.astimezone().replace(tzinfo=None)
+    return record.get('client_id'), nama, sesi_id, waktu
+
+@app.route('/api/absen_batch', methods=['POST'])
+@device_token_required
+def ingest_absen_batch():
+    """
+    Terima rekaman absensi dari spool klien (JSON {"ruangan", "records": [{"client_id",
+    "nama", "sesi_id", "waktu"}]}) dan tulis semuanya dalam satu transaksi.
+    Ruangan ditentukan oleh token perangkat. Rekaman boleh milik sesi yang sudah
+    berakhir (klien sempat offline), asalkan sesinya milik ruangan tersebut dan
+    `waktu` berada di antara mulai dan selesai sesi (± INGEST_CLOCK_SKEW).
+    Status per rekaman: "tersimpan", "duplikat", atau "ditolak" (permanen,
+    klien tidak perlu mengirim ulang).
+    """
+    ruangan = g.device_ruangan
+    if request_ruangan() not in (ruangan, DEFAULT_RUANGAN):
+        return jsonify({"message": f"Token perangkat tidak berlaku untuk ruangan {request_ruangan()}."}), 403
+    data = request.get_json(silent=True) or {}
+    records = data.get('records')
+    if not isinstance(records, list) or not records:
+        return jsonify({"message": "records diperlukan."}), 400
+    if len(records) > MAX_INGEST_RECORDS:
+        return jsonify({"message": f"Maksimal {MAX_INGEST_RECORDS} rekaman per permintaan."}), 400
+
+    results = []
+    parsed = []
+    for record in records:
+        client_id = record.get('client_id') if isinstance(record, dict) else None
+        results.append({"client_id": client_id})
+        try:
+            parsed.append((len(results) - 1, *parse_ingest_record(record)))
+        except ValueError as e:
+            results[-1].update({"status": "ditolak", "message": str(e)})
+
+    try:
+        # Satu query untuk sesi dan satu query untuk mahasiswa, berapa pun jumlah rekaman
+        sesi_ids = {sesi_id for _, _, _, sesi_id, _ in parsed}
+        sesi_window = {sesi_id: (mulai, selesai) for sesi_id, mulai, selesai in db.session.query(
+            SesiPerkuliahan.id, SesiPerkuliahan.waktu_mulai, SesiPerkuliahan.waktu_selesai).filter(
+            SesiPerkuliahan.id.in_(sesi_ids), SesiPerkuliahan.ruangan == ruangan)} if sesi_ids else {}
+        names = {nama.lower() for _, _, nama, _, _ in parsed}
+        mahasiswa_by_name = {nama.lower(): (m_id, nama) for m_id, nama in db.session.query(
+            Mahasiswa.id, Mahasiswa.nama_mahasiswa).filter(func.lower(Mahasiswa.nama_mahasiswa).in_(names))} if names else {}
+
+        rows = []
+        row_owner = {}
+        for i, _, nama, sesi_id, waktu in sorted(parsed, key=lambda item: item[4]):
+            mahasiswa = mahasiswa_by_name.get(nama.lower())
+            window = sesi_window.get(sesi_id)
+            if window is None:
+                results[i].update({"status": "ditolak", "message": f"Sesi {sesi_id} tidak ditemukan di ruangan {ruangan}."})
+            elif not (window[0] - INGEST_CLOCK_SKEW <= waktu <= (window[1] or datetime.now()) + INGEST_CLOCK_SKEW):
+                results[i].update({"status": "ditolak", "message": f"Waktu {waktu.isoformat()} di luar rentang sesi {sesi_id}."})
+            elif mahasiswa is None:
+                results[i].update({"status": "ditolak", "message": f"'{nama}' tidak terdaftar di database."})
+            else:
+                rows.append({"sesi_id": sesi_id, "mahasiswa_id": mahasiswa[0], "waktu_absen": waktu})
+                row_owner.setdefault((sesi_id, mahasiswa[0]), i)
+                results[i]["nama_mahasiswa"] = mahasiswa[1]
+
+        with STAGE_DURATION.time(stage="db_write", detector="ingest", outcome="inserted") as stage:
+            inserted = insert_attendance_rows(rows)
+            if inserted:
+                db.session.commit()
+            else:
+                stage["outcome"] = "duplicate"
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Gagal menyimpan batch absensi: %s", e)
+        return jsonify({"message": f"Error menyimpan absensi: {str(e)}"}), 500
+
+    for row in rows:
+        key = (row["sesi_id"], row["mahasiswa_id"])
+        i = row_owner[key]
+        if key in inserted and results[i].get("status") is None:
+            results[i].update({"status": "tersimpan", "log_id": inserted[key][0]})
+    for result in results:
+        if result.get("status") is None:
+            result["status"] = "duplikat"
+    for sesi_id in {s_id for s_id, _ in inserted}:
+        session_registry.mark_attended(sesi_id, [m_id for s_id, m_id in inserted if s_id == sesi_id])
+        attendance_feed.publish(sesi_id)
+
+    outcomes = {"tersimpan": "attended", "duplikat": "already_attended", "ditolak": "rejected"}
+    for result in results:
+        RECOGNITIONS.inc(endpoint="ingest", outcome=outcomes[result["status"]])
+    log.info("Ingest %s rekaman dari ruangan %s: %s absensi baru.", len(records), ruangan, len(inserted))
+    return jsonify({"saved": len(inserted), "results": results})
 
 
 # Tambahkan endpoint untuk debugging database
@@ -424,6 +945,7 @@ def debug_database():
     """
     try:
         # Info sesi aktif
+        sesi_aktif = session_registry.get(request_ruangan())
         sesi_info = None
         if sesi_aktif:
             sesi_db = db.session.get(SesiPerkuliahan, sesi_aktif['sesi_db_id'])
@@ -432,6 +954,7 @@ def debug_database():
                     "id": sesi_db.id,
                     "jadwal_id": sesi_db.jadwal_id,
                     "pertemuan_ke": sesi_db.pertemuan_ke,
+                    "ruangan": sesi_db.ruangan,
                     "waktu_mulai": sesi_db.waktu_mulai.strftime('%Y-%m-%d %H:%M:%S') if sesi_db.waktu_mulai else None
                 }
         
@@ -458,11 +981,11 @@ def debug_database():
         
         return jsonify({
             "sesi_aktif": sesi_info,
-            "mahasiswa_cache": list(mahasiswa_sudah_absen_server),
+            "mahasiswa_cache": session_registry.attended_snapshot(sesi_aktif['sesi_db_id']) if sesi_aktif else [],
             "total_mahasiswa_db": len(mahasiswa_list),
             "mahasiswa_list": mahasiswa_list,
             "log_absensi_sesi_ini": log_absensi,
-            "embeddings_loaded": len(known_embeddings_data)
+            "embeddings_loaded": len(embedding_index)
         })
         
     except Exception as e:
@@ -476,6 +999,7 @@ def manual_attend():
     """
     Endpoint untuk absensi manual (untuk testing)
     """
+    sesi_aktif = session_registry.get(request_ruangan())
     if not sesi_aktif:
         return jsonify({"message": "Sesi tidak aktif"}), 400
     
@@ -490,29 +1014,21 @@ def manual_attend():
     if not mahasiswa:
         return jsonify({"message": "Mahasiswa tidak ditemukan"}), 404
     
-    # Cek apakah sudah absen
-    existing_log = LogAbsensi.query.filter_by(
-        sesi_id=sesi_aktif['sesi_db_id'],
-        mahasiswa_id=mahasiswa_id
-    ).first()
-    
-    if existing_log:
-        return jsonify({"message": f"{mahasiswa.nama_mahasiswa} sudah absen"})
-    
     try:
-        # Buat log absensi
-        log_baru = LogAbsensi(
-            sesi_id=sesi_aktif['sesi_db_id'],
-            mahasiswa_id=mahasiswa_id,
-            waktu_absen=datetime.now()
-        )
-        
-        db.session.add(log_baru)
+        # Satu INSERT idempoten; tidak ada baris baru berarti mahasiswa sudah absen
+        sesi_id = sesi_aktif['sesi_db_id']
+        inserted = insert_attendance(sesi_id, [mahasiswa.id])
         db.session.commit()
+        if not inserted:
+            return jsonify({"message": f"{mahasiswa.nama_mahasiswa} sudah absen"})
+
+        log_id = inserted[mahasiswa.id][0]
+        session_registry.mark_attended(sesi_id, [mahasiswa.id])
+        attendance_feed.publish(sesi_id)
         
         return jsonify({
             "message": f"Absensi manual untuk {mahasiswa.nama_mahasiswa} berhasil",
-            "log_id": log_baru.id
+            "log_id": log_id
         })
         
     except Exception as e:
@@ -520,49 +1036,192 @@ def manual_attend():
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
+def status_sesi_response(ruangan, sesi_aktif):
+    state = {
+        "status": "aktif" if sesi_aktif else "tidak_aktif",
+        "sesi_id": sesi_aktif.get('sesi_db_id') if sesi_aktif else None,
+        "ruangan": ruangan
+    }
+    response = jsonify({
+        **state,
+        "embeddings_loaded": len(embedding_index),
+        "index_version": embedding_index.version
+    })
+    # ETag hanya dari status sesi: index_version/embeddings_loaded berbeda antar
+    # worker, sehingga long-poll yang pindah worker akan selalu dianggap berubah
+    response.set_etag(hashlib.sha1(json.dumps(state, sort_keys=True).encode()).hexdigest())
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 @app.route('/api/status_sesi')
 def status_sesi():
-    if sesi_aktif: 
-        return jsonify({
-            "status": "aktif", 
-            "sesi_id": sesi_aktif.get('sesi_db_id'),
-            "embeddings_loaded": len(known_embeddings_data)
-        })
-    else: 
-        return jsonify({
-            "status": "tidak_aktif", 
-            "sesi_id": None,
-            "embeddings_loaded": len(known_embeddings_data)
-        })
+    """
+    Status sesi ruangan, dengan ETag. Klien mengirim If-None-Match dan
+    mendapat 304 jika status tidak berubah. Dengan ?wait=N (long-poll),
+    server menahan jawaban hingga N detik dan langsung menjawab begitu sesi
+    dimulai atau diakhiri; jika tetap tidak berubah, jawabannya 304.
+    """
+    ruangan = request_ruangan()
+    sesi_aktif = session_registry.get(ruangan)
+    response = status_sesi_response(ruangan, sesi_aktif)
+    wait = long_poll_wait(STATUS_SESI_MAX_WAIT)
+    if wait > 0 and request.if_none_match.contains(response.get_etag()[0]):
+        known_sesi_id = sesi_aktif['sesi_db_id'] if sesi_aktif else None
+        sesi_aktif = session_registry.wait_for_change(ruangan, known_sesi_id, wait)
+        response = status_sesi_response(ruangan, sesi_aktif)
+    return response.make_conditional(request)
+
+def query_log_absen(sesi_id, since_id=0):
+    """
+    Ambil log absensi sesi dengan id > since_id, urut berdasarkan id
+    """
+    logs = db.session.query(LogAbsensi.id, Mahasiswa.nama_mahasiswa, LogAbsensi.waktu_absen)\
+        .join(Mahasiswa, Mahasiswa.id == LogAbsensi.mahasiswa_id)\
+        .filter(LogAbsensi.sesi_id == sesi_id, LogAbsensi.id > since_id)\
+        .order_by(LogAbsensi.id.asc()).all()
+    return [feed_entry(l.id, l.nama_mahasiswa, l.waktu_absen) for l in logs]
 
 @app.route('/api/log_absen_terkini')
 def get_log_absen_terkini():
+    """
+    Log absensi sesi aktif. Dengan ?since_id=N hanya log dengan id > N yang
+    dikembalikan (cursor = id log terakhir yang sudah diterima klien).
+    """
+    sesi_aktif = session_registry.get(request_ruangan())
     if not sesi_aktif: return jsonify([])
+    since_id = request.args.get('since_id', 0, type=int)
+    return jsonify(query_log_absen(sesi_aktif['sesi_db_id'], since_id))
+
+def _sse_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.route('/api/log_absen_stream')
+def stream_log_absen():
+    """
+    Server-Sent Events: kirim log absensi baru begitu di-commit.
+    Cursor awal diambil dari header Last-Event-ID (reconnect otomatis
+    EventSource) atau parameter ?since_id=N.
+    """
+    ruangan = request_ruangan()
+    sesi_aktif = session_registry.get(ruangan)
+    if not sesi_aktif:
+        return Response(_sse_event("sesi_selesai", {"sesi_id": None}), mimetype='text/event-stream')
+
     sesi_id = sesi_aktif['sesi_db_id']
-    logs = db.session.query(Mahasiswa.nama_mahasiswa, LogAbsensi.waktu_absen)\
-        .join(Mahasiswa, Mahasiswa.id == LogAbsensi.mahasiswa_id)\
-        .filter(LogAbsensi.sesi_id == sesi_id)\
-        .order_by(LogAbsensi.id.asc()).all()
-    log_list = [{"nama_mahasiswa": l.nama_mahasiswa, "waktu_absen": l.waktu_absen.strftime('%H:%M:%S')} for l in logs]
-    return jsonify(log_list)
+    since_id = request.headers.get('Last-Event-ID', type=int)
+    if since_id is None:
+        since_id = request.args.get('since_id', 0, type=int)
+
+    def session_ended():
+        current = session_registry.get(ruangan)
+        db.session.remove()
+        if current is None or current['sesi_db_id'] != sesi_id:
+            # Sesi bisa diakhiri oleh worker lain; buang juga sinyal lokalnya
+            attendance_feed.close(sesi_id)
+            return True
+        return False
+
+    blocking = worker_is_blocking()
+
+    def generate():
+        cursor = since_id
+        last_sent = time.monotonic()
+        # Ambil versi sebelum membaca database supaya sinyal di antaranya tidak hilang
+        version = attendance_feed.version(sesi_id)
+        # Kirim ulang yang terlewat sejak cursor (satu kali, sebelum mulai menunggu)
+        backlog = query_log_absen(sesi_id, cursor)
+        # Koneksi bisa bertahan lama; jangan tahan koneksi database selama menunggu
+        db.session.remove()
+        for entry in backlog:
+            cursor = entry["id"]
+            yield _sse_event("absen", entry, cursor)
+        if blocking:
+            # Worker sync: jangan tahan worker, EventSource tersambung ulang
+            # dengan Last-Event-ID setelah retry
+            yield f"retry: {BLOCKING_WORKER_SSE_RETRY_MS}\n\n"
+            return
+
+        while True:
+            # Commit di worker ini membangunkan stream segera; commit dari worker
+            # lain hanya terlihat lewat pembacaan database berkala
+            attendance_feed.wait_for(sesi_id, version, timeout=LIVE_FEED_POLL_INTERVAL)
+            version = attendance_feed.version(sesi_id)
+            # Data selalu dibaca dari database dengan cursor; feed hanya membangunkan
+            entries = query_log_absen(sesi_id, cursor)
+            db.session.remove()
+            if not entries:
+                if session_ended():
+                    yield _sse_event("sesi_selesai", {"sesi_id": sesi_id})
+                    return
+                if time.monotonic() - last_sent >= LIVE_FEED_HEARTBEAT:
+                    last_sent = time.monotonic()
+                    yield ": ping\n\n"
+                continue
+            last_sent = time.monotonic()
+            for entry in entries:
+                cursor = entry["id"]
+                yield _sse_event("absen", entry, cursor)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.route('/api/reload_embeddings', methods=['POST'])
 @role_required('dosen')
 def reload_embeddings():
     """
-    Endpoint untuk reload master embeddings tanpa restart server
+    Endpoint untuk reload master embeddings tanpa restart server.
+    Reload berjalan di thread loader; tambahkan ?wait=1 untuk menunggu hasilnya.
     """
-    try:
-        load_master_embeddings()
+    previous_version = embedding_index.version
+    attempt = embedding_reloader.trigger()
+    if not embedding_reloader.status()["watching"]:
+        # Loader background tidak berjalan (mis. dimatikan lewat config), reload langsung
+        embedding_reloader.reload_now()
+    elif request.args.get('wait') == '1':
+        if not embedding_reloader.wait(attempt, timeout=30):
+            return jsonify({
+                "status": "pending",
+                "message": "Reload masih berjalan di background.",
+                "index_version": previous_version
+            }), 202
+    else:
         return jsonify({
-            "status": "success", 
-            "message": f"Master embedding berhasil dimuat ulang. Total: {len(known_embeddings_data)} embeddings."
-        })
-    except Exception as e:
+            "status": "scheduled",
+            "message": "Reload master embedding dijadwalkan.",
+            "index_version": previous_version
+        }), 202
+
+    status = embedding_reloader.status()
+    if status["last_error"]:
         return jsonify({
-            "status": "error", 
-            "message": f"Gagal memuat ulang embeddings: {str(e)}"
+            "status": "error",
+            "message": f"Gagal memuat ulang embeddings: {status['last_error']}",
+            "index_version": embedding_index.version
         }), 500
+    return jsonify({
+        "status": "success",
+        "message": f"Master embedding berhasil dimuat ulang. Total: {len(embedding_index)} embeddings.",
+        "index_version": embedding_index.version
+    })
+
+@app.route('/api/ready')
+def ready():
+    """
+    Readiness probe: 503 sampai preload & warm-up model selesai
+    """
+    payload = {
+        "ready": startup_status["ready"],
+        "error": startup_status["error"],
+        "embeddings_loaded": len(embedding_index)
+    }
+    return jsonify(payload), (200 if startup_status["ready"] else 503)
 
 @app.route('/api/system_info')
 def system_info():
@@ -570,12 +1229,28 @@ def system_info():
     Endpoint untuk info sistem
     """
     return jsonify({
-        "embeddings_loaded": len(known_embeddings_data),
+        "embeddings_loaded": len(embedding_index),
         "similarity_threshold": SIMILARITY_THRESHOLD,
         "model_name": MODEL_NAME,
         "detector_backend": DETECTOR_BACKEND,
-        "sesi_aktif": sesi_aktif is not None
+        "detection_budget": DETECTION_BUDGET,
+        "detector_stats": face_cascade.stats_snapshot(),
+        "sesi_aktif": session_registry.active_sessions(),
+        "ready": startup_status["ready"],
+        "startup_timings_ms": startup_status["timings"],
+        "index_version": embedding_index.version,
+        "embedding_reloader": embedding_reloader.status(),
+        "recognition_jobs": recognition_jobs.stats()
     })
 
+@app.route('/metrics')
+def metrics():
+    """
+    Metrik format teks Prometheus: latensi per tahap (decode, detection,
+    embedding, matching, db_write) per detector & outcome, serta jumlah
+    hasil pengenalan. Nilainya per proses worker.
+    """
+    return Response(metrics_registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
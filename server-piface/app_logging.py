@@ -0,0 +1,46 @@
+# app_logging.py
+import logging
+import os
+import random
+
+# Level log server: DEBUG, INFO, WARNING, ERROR (default INFO)
+LOG_LEVEL = os.environ.get('PIFACE_LOG_LEVEL', 'INFO').upper()
+# Porsi baris DEBUG yang benar-benar ditulis (0.0 - 1.0) saat level DEBUG aktif
+DEBUG_SAMPLE_RATE = float(os.environ.get('PIFACE_DEBUG_SAMPLE_RATE', '1.0'))
+
+
+class DebugSampler(logging.Filter):
+    """
+    Loloskan hanya sebagian baris DEBUG (acak, sesuai rate); level lain selalu lolos.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+def _configure_root():
+    logger = logging.getLogger("piface")
+    if logger.handlers:
+        return logger
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s"))
+    handler.addFilter(DebugSampler(DEBUG_SAMPLE_RATE))
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    return logger
+
+
+def get_logger(name):
+    """
+    Logger berlevel untuk modul server. Pesan DEBUG memakai argumen gaya %
+    (log.debug("x=%s", x)) supaya tidak diformat sama sekali jika level DEBUG mati.
+    """
+    _configure_root()
+    return logging.getLogger(f"piface.{name}")
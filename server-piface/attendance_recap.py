@@ -0,0 +1,71 @@
+# attendance_recap.py
+from models import db, Mahasiswa, Matakuliah, Jadwal, SesiPerkuliahan, LogAbsensi
+
+JUMLAH_PERTEMUAN = 16
+
+STATUS_HADIR = 'Hadir'
+STATUS_TIDAK_HADIR = 'Tidak Hadir'
+STATUS_BELUM_DIADAKAN = 'Belum Diadakan'
+
+
+def _recap_rows(mahasiswa_ids=None, mk_id=None):
+    """
+    Satu query agregat: setiap (mahasiswa, mata kuliah, pertemuan) yang sudah
+    selesai beserta flag hadir. Mata kuliah tanpa sesi selesai tetap muncul
+    dengan pertemuan_ke NULL supaya baris rekapnya tetap ditampilkan.
+    """
+    hadir = db.func.max(db.case((LogAbsensi.id.isnot(None), 1), else_=0))
+    query = (
+        db.session.query(
+            Mahasiswa.id,
+            Mahasiswa.nama_mahasiswa,
+            Matakuliah.nama_mk,
+            SesiPerkuliahan.pertemuan_ke,
+            hadir
+        )
+        .select_from(Mahasiswa)
+        .join(Matakuliah, db.true())
+        .outerjoin(Jadwal, Jadwal.mk_id == Matakuliah.id)
+        .outerjoin(SesiPerkuliahan, db.and_(
+            SesiPerkuliahan.jadwal_id == Jadwal.id,
+            SesiPerkuliahan.waktu_selesai.isnot(None),
+            SesiPerkuliahan.pertemuan_ke.between(1, JUMLAH_PERTEMUAN)
+        ))
+        .outerjoin(LogAbsensi, db.and_(
+            LogAbsensi.sesi_id == SesiPerkuliahan.id,
+            LogAbsensi.mahasiswa_id == Mahasiswa.id
+        ))
+        .group_by(Mahasiswa.id, Mahasiswa.nama_mahasiswa, Matakuliah.id, Matakuliah.nama_mk, SesiPerkuliahan.pertemuan_ke)
+        .order_by(Mahasiswa.nama_mahasiswa, Matakuliah.nama_mk)
+    )
+    if mahasiswa_ids is not None:
+        query = query.filter(Mahasiswa.id.in_(mahasiswa_ids))
+    if mk_id is not None:
+        query = query.filter(Matakuliah.id == mk_id)
+    return query.all()
+
+
+def build_recap(mahasiswa_ids=None, mk_id=None):
+    """
+    Rekap absensi untuk sekelompok mahasiswa (default: semua), opsional
+    dibatasi satu mata kuliah. Hasil query dipivot di memori menjadi grid
+    16 pertemuan per mata kuliah.
+    Mengembalikan dict {mahasiswa_id: {"nama_mahasiswa": ..., "rekap": {nama_mk: [status x 16]}}}.
+    """
+    recap = {}
+    for mhs_id, nama_mahasiswa, nama_mk, pertemuan_ke, hadir in _recap_rows(mahasiswa_ids, mk_id):
+        entry = recap.setdefault(mhs_id, {"nama_mahasiswa": nama_mahasiswa, "rekap": {}})
+        grid = entry["rekap"].setdefault(nama_mk, [STATUS_BELUM_DIADAKAN] * JUMLAH_PERTEMUAN)
+        if pertemuan_ke is None:
+            continue
+        # Satu pertemuan bisa diadakan lewat lebih dari satu jadwal; hadir di salah satunya dihitung hadir
+        if hadir or grid[pertemuan_ke - 1] != STATUS_HADIR:
+            grid[pertemuan_ke - 1] = STATUS_HADIR if hadir else STATUS_TIDAK_HADIR
+    return recap
+
+
+def build_student_recap(mahasiswa_id):
+    """
+    Rekap satu mahasiswa untuk halaman /rekap: {nama_mk: [status x 16]}
+    """
+    return build_recap([mahasiswa_id]).get(mahasiswa_id, {}).get("rekap", {})
@@ -0,0 +1,64 @@
+# attendance_store.py
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from models import db, LogAbsensi
+
+# Dialek yang mendukung INSERT ... ON CONFLICT DO NOTHING RETURNING
+_UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def insert_attendance(sesi_id, mahasiswa_ids, waktu_absen=None):
+    """
+    Catat absensi secara idempoten dengan satu statement:
+    INSERT ... ON CONFLICT (sesi_id, mahasiswa_id) DO NOTHING RETURNING.
+    Duplikat (termasuk dua frame yang datang bersamaan) ditolak oleh unique
+    constraint di database, bukan oleh cek terpisah.
+    Mengembalikan dict {mahasiswa_id: (log_id, waktu_absen)} hanya untuk baris
+    yang benar-benar baru. Commit dilakukan oleh pemanggil.
+    """
+    waktu_absen = waktu_absen or datetime.now()
+    rows = [{"sesi_id": sesi_id, "mahasiswa_id": m_id, "waktu_absen": waktu_absen} for m_id in mahasiswa_ids]
+    inserted = insert_attendance_rows(rows)
+    return {m_id: value for (_, m_id), value in inserted.items()}
+
+
+def insert_attendance_rows(rows):
+    """
+    Seperti insert_attendance, tetapi tiap baris membawa sesi_id dan
+    waktu_absen sendiri (mis. rekaman dari spool klien). Untuk pasangan
+    (sesi_id, mahasiswa_id) yang sama hanya baris pertama yang dipakai.
+    Mengembalikan dict {(sesi_id, mahasiswa_id): (log_id, waktu_absen)} untuk baris baru.
+    """
+    unique = {}
+    for row in rows:
+        unique.setdefault((row["sesi_id"], row["mahasiswa_id"]), row)
+    rows = list(unique.values())
+    if not rows:
+        return {}
+
+    insert = _UPSERT_INSERTS.get(db.session.get_bind().dialect.name)
+    if insert is None:
+        return _insert_attendance_fallback(rows)
+
+    stmt = insert(LogAbsensi).values(rows)\
+        .on_conflict_do_nothing(index_elements=["sesi_id", "mahasiswa_id"])\
+        .returning(LogAbsensi.id, LogAbsensi.sesi_id, LogAbsensi.mahasiswa_id, LogAbsensi.waktu_absen)
+    return {(row.sesi_id, row.mahasiswa_id): (row.id, row.waktu_absen) for row in db.session.execute(stmt)}
+
+
+def _insert_attendance_fallback(rows):
+    # Dialek lain: insert per baris di savepoint, konflik dari unique constraint diabaikan
+    inserted = {}
+    for row in rows:
+        log = LogAbsensi(**row)
+        try:
+            with db.session.begin_nested():
+                db.session.add(log)
+        except IntegrityError:
+            continue
+        inserted[(row["sesi_id"], row["mahasiswa_id"])] = (log.id, log.waktu_absen)
+    return inserted
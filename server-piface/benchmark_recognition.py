@@ -0,0 +1,457 @@
+# benchmark_recognition.py
+#
+# Benchmark jalur /api/recognize_and_attend dengan model pengganti yang
+# deterministik (tanpa TensorFlow) dan galeri sintetis 10 - 100.000 mahasiswa.
+# Mengukur latensi (p50/p95/p99) dan throughput per tahap: decode, detection,
+# embedding, matching, db_write, request (end-to-end), serta tulis/muat ulang
+# store embedding. Hasil disimpan sebagai JSON supaya bisa dibandingkan antar commit.
+#
+#   python benchmark_recognition.py                      # jalankan benchmark
+#   python benchmark_recognition.py compare lama.json baru.json
+#
+# Database default: SQLite sementara. Untuk Postgres lokal isi
+# PIFACE_BENCH_DATABASE_URL (tabel di database itu DIHAPUS dan dibuat ulang).
+import os
+# Harus sebelum impor modul proyek: app_logging membaca level log saat diimpor,
+# dan log INFO per permintaan ikut terukur di latensi "request"
+os.environ.setdefault('PIFACE_LOG_LEVEL', 'WARNING')
+import io
+import sys
+import json
+import time
+import types
+import shutil
+import platform
+import tempfile
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+import cv2
+from embedding_store import save_store
+from models import Dosen, Mahasiswa, Matakuliah, Jadwal
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+# --- PENGATURAN (bisa diganti lewat env) ---
+GALLERY_SIZES = [int(n) for n in os.environ.get('PIFACE_BENCH_SIZES', '10,100,1000,10000,100000').split(',')]
+REQUESTS_PER_SIZE = int(os.environ.get('PIFACE_BENCH_REQUESTS', '300'))
+WARMUP_REQUESTS = 20  # Tidak ikut dihitung
+# VGG-Face = 4096; default lebih kecil supaya galeri 100.000 muat di RAM laptop
+EMBEDDING_DIMENSION = int(os.environ.get('PIFACE_BENCH_DIMENSION', '512'))
+# "crop": crop wajah 160x160 + face_meta (deteksi dilewati), "frame": frame 640x480 lewat cascade
+UPLOAD_MODE = os.environ.get('PIFACE_BENCH_MODE', 'crop')
+UNKNOWN_RATIO = 0.1  # Porsi probe wajah yang tidak ada di galeri
+# Latensi tiruan model (ms), 0 = hanya mengukur overhead server
+DETECT_MS = float(os.environ.get('PIFACE_BENCH_DETECT_MS', '0'))
+EMBED_MS = float(os.environ.get('PIFACE_BENCH_EMBED_MS', '0'))
+RELOAD_REPEATS = 3
+SEED = 1234
+DATABASE_URL = os.environ.get('PIFACE_BENCH_DATABASE_URL')
+# Folder hasil JSON (diabaikan git); arahkan ke folder lain untuk menyimpan hasil acuan
+RESULTS_DIR = os.environ.get('PIFACE_BENCH_RESULTS_DIR') or os.path.join(basedir, "benchmark_results")
+# Perubahan p50/p95 lebih dari ini ditandai sebagai regresi saat compare
+REGRESSION_THRESHOLD = 0.10
+
+# Geometri gambar probe. Identitas ditulis sebagai kode biner di baris blok 8x8
+# teratas crop (blok DCT JPEG, jadi tetap terbaca setelah kompresi).
+CROP_SIZE = 160
+FRAME_SIZE = (640, 480)
+FACE_X, FACE_Y = 240, 160  # Posisi crop di dalam frame (kelipatan 8)
+IDENTITY_BITS = CROP_SIZE // 8
+UNKNOWN_IDENTITY = (1 << IDENTITY_BITS) - 1
+JPEG_QUALITY = 80
+STAGES = ["request", "decode", "detection", "embedding", "matching", "db_write"]
+
+
+def draw_identity(crop, identity):
+    for bit in range(IDENTITY_BITS):
+        crop[0:8, bit * 8:(bit + 1) * 8] = 255 if (identity >> bit) & 1 else 0
+
+
+def read_identity(face):
+    blocks = face[:8, :IDENTITY_BITS * 8].reshape(8, IDENTITY_BITS, 8, -1).mean(axis=(0, 2, 3))
+    return sum(1 << bit for bit, value in enumerate(blocks) if value > 127)
+
+
+class StandInModel:
+    """
+    Pengganti DeepFace yang deterministik. "Deteksi" memotong posisi wajah
+    yang sudah diketahui; embedding = baris galeri milik identitas di gambar
+    ditambah noise tetap per identitas (cosine similarity ~0.89), atau vektor
+    acak untuk wajah yang tidak dikenal.
+    """
+
+    def __init__(self, gallery, detect_ms=0.0, embed_ms=0.0, noise=0.5):
+        self.gallery = gallery
+        self.detect_ms = detect_ms
+        self.embed_ms = embed_ms
+        self.noise = noise
+
+    def detect(self, img, detector_backend, enforce_detection=True, align=True):
+        if self.detect_ms:
+            time.sleep(self.detect_ms / 1000)
+        if detector_backend == "skip":
+            return img
+        return img[FACE_Y:FACE_Y + CROP_SIZE, FACE_X:FACE_X + CROP_SIZE]
+
+    def embed(self, faces, model_name):
+        if self.embed_ms:
+            time.sleep(self.embed_ms / 1000 * len(faces))
+        return np.vstack([self._embedding(read_identity(face)) for face in faces])
+
+    def represent(self, img_path, **kwargs):
+        embedding = self.embed([self.detect(img_path, "skip")], None)[0]
+        return [{"embedding": embedding.tolist()}]
+
+    def _embedding(self, identity):
+        rng = np.random.default_rng((SEED, identity))
+        noise = rng.standard_normal(self.gallery.shape[1], dtype=np.float32)
+        noise /= np.linalg.norm(noise)
+        if identity >= len(self.gallery):
+            return noise
+        vector = self.gallery[identity] + self.noise * noise
+        return vector / np.linalg.norm(vector)
+
+
+def install_deepface_stub(model_holder):
+    """
+    Daftarkan modul `deepface` tiruan sebelum app diimpor, supaya TensorFlow
+    tidak dimuat. DeepFace.represent dialihkan ke StandInModel; fungsi lain
+    tidak boleh terpanggil selama benchmark.
+    """
+    def unavailable(*args, **kwargs):
+        raise RuntimeError("DeepFace asli tidak dimuat di benchmark.")
+
+    deepface = types.ModuleType("deepface")
+    DeepFace = types.ModuleType("deepface.DeepFace")
+    DeepFace.build_model = DeepFace.extract_faces = unavailable
+    DeepFace.represent = lambda *args, **kwargs: model_holder["model"].represent(*args, **kwargs)
+    modules = types.ModuleType("deepface.modules")
+    preprocessing = types.ModuleType("deepface.modules.preprocessing")
+    preprocessing.resize_image = preprocessing.normalize_input = unavailable
+    deepface.DeepFace, deepface.modules, modules.preprocessing = DeepFace, modules, preprocessing
+    sys.modules.update({
+        "deepface": deepface,
+        "deepface.DeepFace": DeepFace,
+        "deepface.modules": modules,
+        "deepface.modules.preprocessing": preprocessing,
+    })
+
+
+def make_gallery(size, dimension):
+    rng = np.random.default_rng(SEED)
+    gallery = rng.standard_normal((size, dimension), dtype=np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def make_probe_images(identities):
+    """JPEG (bytes) untuk setiap identitas, di atas tekstur noise yang di-blur."""
+    rng = np.random.default_rng(SEED)
+    width, height = FRAME_SIZE if UPLOAD_MODE == "frame" else (CROP_SIZE, CROP_SIZE)
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (5, 5), 0)
+    images = []
+    for identity in identities:
+        image = background.copy()
+        crop = image[FACE_Y:FACE_Y + CROP_SIZE, FACE_X:FACE_X + CROP_SIZE] if UPLOAD_MODE == "frame" else image
+        draw_identity(crop, identity)
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        images.append(encoded.tobytes())
+    return images
+
+
+def choose_identities(size, count):
+    """Urutan probe: mahasiswa dari permutasi yang berputar, diselingi wajah tidak dikenal."""
+    rng = np.random.default_rng(SEED + size)
+    order = rng.permutation(size)
+    identities = []
+    position = 0
+    for _ in range(count):
+        if rng.random() < UNKNOWN_RATIO:
+            identities.append(UNKNOWN_IDENTITY)
+        else:
+            identities.append(int(order[position % size]))
+            position += 1
+    return identities
+
+
+def summarize(values):
+    """Ringkasan latensi (ms) dan throughput (operasi/detik) dari list durasi dalam detik."""
+    if not values:
+        return None
+    ms = np.asarray(values) * 1000
+    total = float(np.sum(values))
+    return {
+        "count": len(values),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+        "throughput_per_s": round(len(values) / total, 1) if total > 0 else None,
+    }
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=basedir,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], cwd=basedir,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+class StageRecorder:
+    """
+    Tangkap setiap observasi STAGE_DURATION dan RECOGNITIONS milik server,
+    sehingga tahap yang diukur persis sama dengan yang dilaporkan /metrics.
+    """
+
+    def __init__(self, server):
+        self.samples = defaultdict(list)
+        self.outcomes = defaultdict(int)
+        observe, inc = server.STAGE_DURATION.observe, server.RECOGNITIONS.inc
+
+        def record_stage(value, **labels):
+            self.samples[labels["stage"]].append(value)
+            observe(value, **labels)
+
+        def record_outcome(amount=1, **labels):
+            self.outcomes[labels["outcome"]] += amount
+            inc(amount, **labels)
+
+        server.STAGE_DURATION.observe = record_stage
+        server.RECOGNITIONS.inc = record_outcome
+
+    def reset(self):
+        self.samples.clear()
+        self.outcomes.clear()
+
+
+def load_server(workdir, model_holder):
+    """Impor app dengan database benchmark dan tanpa warm-up/watcher model."""
+    os.environ['DATABASE_URL'] = DATABASE_URL or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['PIFACE_PRELOAD_MODELS'] = '0'
+    os.environ['PIFACE_WATCH_EMBEDDINGS'] = '0'
+    install_deepface_stub(model_holder)
+    # app membaca master_embeddings.json relatif terhadap direktori kerja
+    os.chdir(workdir)
+    import app as server
+    return server
+
+
+def seed_database(server, size):
+    """Buat ulang tabel lalu isi dosen, jadwal, dan `size` mahasiswa. Mengembalikan (jadwal_id, dosen_id, nama)."""
+    db = server.db
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    dosen = Dosen(nama_dosen="Dosen Benchmark", password_hash="-")
+    matakuliah = Matakuliah(kode_mk="BENCH", nama_mk="Benchmark")
+    db.session.add_all([dosen, matakuliah])
+    db.session.flush()
+    jadwal = Jadwal(mk_id=matakuliah.id, dosen_id=dosen.id, hari="Senin", jam_mulai="08:00")
+    db.session.add(jadwal)
+    names = [f"Mahasiswa {i:06d}" for i in range(size)]
+    db.session.execute(Mahasiswa.__table__.insert(), [{"nama_mahasiswa": name, "password_hash": "-"} for name in names])
+    db.session.commit()
+    server.session_registry.invalidate()
+    return jadwal.id, dosen.id, names
+
+
+def start_session(server, jadwal_id, dosen_id, pertemuan_ke):
+    sesi = server.session_registry.start(server.DEFAULT_RUANGAN, jadwal_id, dosen_id, pertemuan_ke)
+    return sesi
+
+
+def finish_session(server):
+    sesi = server.session_registry.finish(server.DEFAULT_RUANGAN)
+    if sesi:
+        server.attendance_feed.close(sesi["sesi_db_id"])
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def run_size(server, recorder, model, gallery, size):
+    print(f"\n=== Galeri {size} mahasiswa ===")
+    stages = {}
+    model.gallery = gallery[:size]
+
+    with server.app.app_context():
+        (jadwal_id, dosen_id, names), elapsed = timed(seed_database, server, size)
+        stages["seed_db"] = summarize([elapsed])
+        _, elapsed = timed(save_store, names, model.gallery, server.MODEL_NAME,
+                           manifest_path=server.MASTER_EMBEDDINGS_MANIFEST)
+        stages["store_write"] = summarize([elapsed])
+
+    # Muat ulang = buka store (mmap) + petakan nama ke id mahasiswa lewat satu query
+    reloads = []
+    for _ in range(RELOAD_REPEATS):
+        index, elapsed = timed(server.build_embedding_index)
+        reloads.append(elapsed)
+    stages["reload"] = summarize(reloads)
+    server.swap_embedding_index(index)
+
+    identities = choose_identities(size, WARMUP_REQUESTS + REQUESTS_PER_SIZE)
+    images = make_probe_images(identities)
+    face_meta = json.dumps({"box": [FACE_X, FACE_Y, CROP_SIZE, CROP_SIZE], "keypoints": [], "frame_size": list(FRAME_SIZE)})
+    client = server.app.test_client()
+    mismatches = 0
+
+    with server.app.app_context():
+        pertemuan_ke = 1
+        start_session(server, jadwal_id, dosen_id, pertemuan_ke)
+        attended = set()
+        t_start = time.perf_counter()
+        for i, (identity, image) in enumerate(zip(identities, images)):
+            if i == WARMUP_REQUESTS:
+                recorder.reset()
+                t_start = time.perf_counter()
+            if identity in attended:
+                # Setiap mahasiswa sudah absen: sesi baru supaya probe berikutnya tetap menulis ke database
+                finish_session(server)
+                pertemuan_ke += 1
+                start_session(server, jadwal_id, dosen_id, pertemuan_ke)
+                attended.clear()
+
+            data = {"image": (io.BytesIO(image), "face.jpg")}
+            if UPLOAD_MODE == "crop":
+                data["face_meta"] = face_meta
+            response, elapsed = timed(client.post, "/api/recognize_and_attend", data=data, content_type="multipart/form-data")
+            payload = response.get_json()
+            if i >= WARMUP_REQUESTS:
+                recorder.samples["request"].append(elapsed)
+
+            expected = names[identity] if identity != UNKNOWN_IDENTITY else None
+            recognized = payload.get("name") if payload.get("recognized") else None
+            if i >= WARMUP_REQUESTS and recognized != expected:
+                mismatches += 1
+            if identity != UNKNOWN_IDENTITY:
+                attended.add(identity)
+        wall = time.perf_counter() - t_start
+        finish_session(server)
+
+    for stage in STAGES:
+        stages[stage] = summarize(recorder.samples.get(stage, []))
+    result = {
+        "gallery_size": size,
+        "requests": REQUESTS_PER_SIZE,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(REQUESTS_PER_SIZE / wall, 1) if wall > 0 else None,
+        "outcomes": dict(recorder.outcomes),
+        "mismatches": mismatches,
+        "stages": stages,
+    }
+    print_result(result)
+    return result
+
+
+def print_result(result):
+    print(f"{result['requests']} permintaan dalam {result['wall_s']} detik "
+          f"({result['throughput_rps']} req/detik), hasil: {result['outcomes']}, salah kenal: {result['mismatches']}")
+    print(f"  {'tahap':<12}{'n':>7}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'ops/detik':>12}")
+    for stage, summary in result["stages"].items():
+        if summary:
+            print(f"  {stage:<12}{summary['count']:>7}{summary['mean_ms']:>10.3f}{summary['p50_ms']:>10.3f}"
+                  f"{summary['p95_ms']:>10.3f}{summary['p99_ms']:>10.3f}{summary['throughput_per_s'] or 0:>12.1f}")
+
+
+def run_benchmark():
+    if max(GALLERY_SIZES) >= UNKNOWN_IDENTITY:
+        raise ValueError(f"Ukuran galeri maksimal {UNKNOWN_IDENTITY - 1} (kode identitas {IDENTITY_BITS} bit).")
+    commit, dirty = git_revision()
+    workdir = tempfile.mkdtemp(prefix="piface-bench-")
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    model_holder = {}
+    try:
+        server = load_server(workdir, model_holder)
+        gallery = make_gallery(max(GALLERY_SIZES), EMBEDDING_DIMENSION)
+        model = model_holder["model"] = StandInModel(gallery, detect_ms=DETECT_MS, embed_ms=EMBED_MS)
+        server.face_cascade.detect_fn = model.detect
+        server.face_cascade.embed_fn = model.embed
+        recorder = StageRecorder(server)
+        with server.app.app_context():
+            database = server.db.engine.url.render_as_string(hide_password=True)
+        if DATABASE_URL:
+            print(f"⚠️ Tabel di {database} akan dihapus dan dibuat ulang untuk setiap ukuran galeri.")
+        print(f"Benchmark pengenalan: galeri {GALLERY_SIZES}, {REQUESTS_PER_SIZE} permintaan/ukuran, "
+              f"mode {UPLOAD_MODE}, dimensi {EMBEDDING_DIMENSION}, database {database}")
+
+        results = [run_size(server, recorder, model, gallery, size) for size in GALLERY_SIZES]
+    finally:
+        os.chdir(basedir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "benchmark": "recognition",
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "git_commit": commit,
+        "git_dirty": dirty,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "database": database.split(":")[0],
+        "settings": {
+            "upload_mode": UPLOAD_MODE,
+            "dimension": EMBEDDING_DIMENSION,
+            "requests_per_size": REQUESTS_PER_SIZE,
+            "unknown_ratio": UNKNOWN_RATIO,
+            "detect_ms": DETECT_MS,
+            "embed_ms": EMBED_MS,
+            "similarity_threshold": server.SIMILARITY_THRESHOLD,
+        },
+        "results": results,
+    }
+    output = os.path.join(RESULTS_DIR, f"recognition-{datetime.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=1)
+    print(f"\n✅ Hasil disimpan di '{output}'.")
+    return report
+
+
+def compare_reports(old_path, new_path):
+    """Bandingkan p50/p95 per ukuran galeri dan tahap; tandai yang melambat melebihi ambang."""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, 'r', encoding='utf-8') as f:
+        new = json.load(f)
+    if old["settings"] != new["settings"]:
+        print(f"⚠️ Pengaturan berbeda, perbandingan mungkin tidak adil:\n  lama: {old['settings']}\n  baru: {new['settings']}")
+
+    print(f"Lama: {old['git_commit']} ({old['created_at']})  Baru: {new['git_commit']} ({new['created_at']})")
+    old_results = {r["gallery_size"]: r for r in old["results"]}
+    regressions = 0
+    for result in new["results"]:
+        previous = old_results.get(result["gallery_size"])
+        if not previous:
+            continue
+        print(f"\nGaleri {result['gallery_size']}: throughput {previous['throughput_rps']} -> {result['throughput_rps']} req/detik")
+        for stage, summary in result["stages"].items():
+            before = previous["stages"].get(stage)
+            if not summary or not before:
+                continue
+            changes = []
+            slower = False
+            for key in ("p50_ms", "p95_ms"):
+                change = (summary[key] - before[key]) / before[key] if before[key] else 0.0
+                slower = slower or change > REGRESSION_THRESHOLD
+                changes.append(f"{key[:3]} {before[key]:.3f} -> {summary[key]:.3f} ms ({change:+.0%})")
+            regressions += slower
+            print(f"  {'⚠️' if slower else '  '} {stage:<12}" + "   ".join(changes))
+    print(f"\n{regressions} tahap melambat lebih dari {REGRESSION_THRESHOLD:.0%}.")
+    return regressions
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 3 and sys.argv[1] == "compare":
+        sys.exit(1 if compare_reports(sys.argv[2], sys.argv[3]) else 0)
+    elif len(sys.argv) > 1:
+        print("Penggunaan: python benchmark_recognition.py | compare lama.json baru.json")
+    else:
+        run_benchmark()
@@ -1,9 +1,17 @@
 # improved_create_master_embeddings.py
-from app import app
-from models import Mahasiswa
 import os
+# Skrip ini hanya butuh app untuk akses database, tidak perlu warm-up model server
+os.environ.setdefault('PIFACE_PRELOAD_MODELS', '0')
+os.environ.setdefault('PIFACE_WATCH_EMBEDDINGS', '0')
+import hashlib
+import multiprocessing
 import pickle
-from deepface import DeepFace
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from models import Mahasiswa
+from embedding_store import save_store
+from face_engine import DetectorCascade, FaceNotDetectedError, build_detector, detect_face, get_model
 import numpy as np
 from PIL import Image
 import cv2
@@ -12,7 +20,18 @@ import cv2
 MODEL_NAME = "VGG-Face"
 DETECTOR_BACKEND = "opencv"
 DATASET_PATH = "dataset"
-EMBEDDINGS_FILE = "master_embeddings.pkl"
+EMBEDDINGS_MANIFEST = "master_embeddings.json"  # + master_embeddings.npy
+# Cache embedding per gambar, dikunci dengan hash isi file + model + detector
+EMBEDDING_CACHE_FILE = "embedding_cache.pkl"
+CACHE_VERSION = 1
+# Jumlah proses worker; tiap worker memuat model sendiri (~0.5 GB RAM untuk VGG-Face)
+BUILD_WORKERS = int(os.environ.get('PIFACE_BUILD_WORKERS', min(4, os.cpu_count() or 1)))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+FALLBACK_DETECTORS = ["retinaface", "mtcnn", "ssd"]
+# Budget per gambar lebih longgar dibanding server karena berjalan offline
+DETECTION_BUDGET = 10.0
+
+face_cascade = DetectorCascade(MODEL_NAME, [DETECTOR_BACKEND] + FALLBACK_DETECTORS, budget=DETECTION_BUDGET)
 
 def preprocess_image(image_path):
     """
@@ -38,49 +57,111 @@ def preprocess_image(image_path):
         print(f"    [ERROR] Gagal preprocessing {image_path}: {e}")
         return None
 
-def try_multiple_detectors(image_path):
+def create_embedding(image_path):
     """
-    Coba beberapa detector backend jika opencv gagal
+    Buat embedding dengan cascade detector adaptif (engine yang sama dengan server).
+    Detector yang sering berhasil untuk dataset ini otomatis dicoba lebih dulu.
+    Mengembalikan (embedding, nama detector, error). Jika wajah tidak terdeteksi
+    embedding bernilai None; `error` hanya diisi untuk kegagalan lain (file rusak,
+    error model, budget deteksi habis) yang tidak boleh disimpan ke cache.
     """
-    detectors = ["opencv", "retinaface", "mtcnn", "ssd"]
-    
-    for detector in detectors:
+    try:
+        embedding, report = face_cascade.represent(image_path)
+        if report["detector"] != DETECTOR_BACKEND:
+            print(f"    [SUCCESS] {image_path}: berhasil dengan detector {report['detector']} ({report['elapsed_ms']} ms)")
+        return np.asarray(embedding, dtype=np.float32), report["detector"], None
+    except FaceNotDetectedError as e:
+        if e.report.get("budget_exhausted"):
+            # Tidak semua detector sempat dicoba: jangan cache, coba lagi di run berikutnya
+            print(f"    [FINAL ERROR] {image_path}: budget deteksi habis setelah {e.report['elapsed_ms']} ms")
+            return None, None, "budget deteksi habis"
+        print(f"    [FINAL ERROR] {image_path}: semua metode gagal dalam {e.report['elapsed_ms']} ms")
+        return None, None, None
+    except Exception as e:
+        print(f"    [FINAL ERROR] {image_path}: {e}")
+        return None, None, str(e)
+
+def build_models():
+    """
+    Bangun model embedding dan semua detector di luar budget deteksi, supaya
+    pembuatan detector yang lambat (mis. retinaface) tidak menghabiskan
+    budget gambar pertama.
+    """
+    get_model(MODEL_NAME)
+    for detector in face_cascade.detectors:
         try:
-            # Coba dengan enforce_detection=True dulu
-            embedding = DeepFace.represent(
-                img_path=image_path, 
-                model_name=MODEL_NAME,
-                detector_backend=detector,
-                enforce_detection=True,
-                align=True
-            )[0]["embedding"]
-            print(f"    [SUCCESS] Berhasil dengan detector: {detector}")
-            return embedding
-        except:
-            continue
-    
-    # Jika semua gagal, coba dengan enforce_detection=False
+            build_detector(detector)
+        except Exception as e:
+            print(f"    [WARNING] Gagal membangun detector {detector}: {e}")
+
+def _init_worker(intra_op_threads):
+    """
+    Initializer proses worker: batasi thread TensorFlow agar worker tidak
+    saling berebut core, lalu bangun model dan detector sekali per proses.
+    """
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except Exception:
+        pass
+    build_models()
+
+def cache_key(image_path):
+    """
+    Kunci cache: hash isi file + nama model + konfigurasi detector.
+    Gambar yang dipindah/di-rename tetap kena cache selama isinya sama.
+    """
+    with open(image_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()
+    return f"{digest}:{MODEL_NAME}:{'+'.join(face_cascade.detectors)}"
+
+def load_embedding_cache():
+    if not os.path.exists(EMBEDDING_CACHE_FILE):
+        return {}
     try:
-        embedding = DeepFace.represent(
-            img_path=image_path, 
-            model_name=MODEL_NAME,
-            detector_backend="opencv",
-            enforce_detection=False,  # Lebih permisif
-            align=True
-        )[0]["embedding"]
-        print(f"    [SUCCESS] Berhasil dengan enforce_detection=False")
-        return embedding
+        with open(EMBEDDING_CACHE_FILE, 'rb') as f:
+            data = pickle.load(f)
+        if data.get("version") != CACHE_VERSION:
+            print("[INFO] Versi cache embedding berbeda, cache diabaikan.")
+            return {}
+        return data["entries"]
     except Exception as e:
-        print(f"    [FINAL ERROR] Semua metode gagal: {e}")
-        return None
+        print(f"[WARNING] Gagal membaca cache embedding, cache diabaikan: {e}")
+        return {}
 
-def generate_master_embeddings_improved():
+def save_embedding_cache(entries):
+    # Tulis ke file sementara lalu rename supaya cache tidak pernah setengah jadi
+    tmp_path = f"{EMBEDDING_CACHE_FILE}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({"version": CACHE_VERSION, "entries": entries}, f)
+    os.replace(tmp_path, EMBEDDING_CACHE_FILE)
+
+def collect_images(mahasiswa_list):
+    """
+    Kumpulkan (nama mahasiswa, path gambar) untuk semua mahasiswa, urut per folder.
+    Mengembalikan (jobs, jumlah mahasiswa yang foldernya tidak ada).
+    """
+    jobs = []
+    skipped = 0
+    for mahasiswa in mahasiswa_list:
+        person_name = mahasiswa.nama_mahasiswa
+        person_path = os.path.join(DATASET_PATH, person_name)
+        
+        if not os.path.isdir(person_path):
+            print(f"[WARNING] Folder untuk '{person_name}' tidak ditemukan di dataset. Dilewati.")
+            skipped += 1
+            continue
+
+        for filename in sorted(os.listdir(person_path)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                jobs.append((person_name, os.path.join(person_path, filename)))
+    return jobs, skipped
+
+def generate_master_embeddings_improved(workers=BUILD_WORKERS):
+    from app import app
     print(f"[INFO] Memulai pembuatan master embeddings dari '{DATASET_PATH}'...")
     
-    master_data = []
-    total_processed = 0
-    total_failed = 0
-    
     # Ambil semua nama mahasiswa dari database agar konsisten
     with app.app_context():
         mahasiswa_list = Mahasiswa.query.all()
@@ -89,51 +170,82 @@ def generate_master_embeddings_improved():
         print("[ERROR] Tabel mahasiswa kosong. Jalankan seeder terlebih dahulu.")
         return
 
-    for mahasiswa in mahasiswa_list:
-        person_name = mahasiswa.nama_mahasiswa
-        person_path = os.path.join(DATASET_PATH, person_name)
-        
-        if not os.path.isdir(person_path):
-            print(f"[WARNING] Folder untuk '{person_name}' tidak ditemukan di dataset. Dilewati.")
-            continue
+    jobs, skipped_people = collect_images(mahasiswa_list)
+    student_ids = {m.nama_mahasiswa: m.id for m in mahasiswa_list}
+    if not jobs:
+        print("[ERROR] Tidak ada gambar di dataset.")
+        return
 
-        person_embeddings = []
-        image_files = [f for f in os.listdir(person_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-        print(f"[INFO] Memproses {len(image_files)} gambar untuk: {person_name}")
-        
-        successful_images = 0
-        failed_images = 0
-        
-        for filename in image_files:
-            image_path = os.path.join(person_path, filename)
-            total_processed += 1
-            
-            try:
-                # Coba metode standar dulu
-                embedding = DeepFace.represent(
-                    img_path=image_path, 
-                    model_name=MODEL_NAME,
-                    detector_backend=DETECTOR_BACKEND,
-                    enforce_detection=True,
-                    align=True
-                )[0]["embedding"]
-                
-                person_embeddings.append(embedding)
-                successful_images += 1
-                
-            except Exception as e:
-                print(f"  [RETRY] {filename} gagal dengan metode standar, mencoba alternatif...")
-                
-                # Coba dengan multiple detectors
-                embedding = try_multiple_detectors(image_path)
-                
-                if embedding is not None:
-                    person_embeddings.append(embedding)
-                    successful_images += 1
-                else:
-                    print(f"  [FAILED] {filename}: Tidak dapat mendeteksi wajah dengan semua metode")
-                    failed_images += 1
-                    total_failed += 1
+    # 1. Pisahkan gambar yang sudah ada di cache dan yang perlu di-embed
+    cache = load_embedding_cache()
+    new_cache = {}
+    results = {}
+    pending = []
+    for person_name, image_path in jobs:
+        key = cache_key(image_path)
+        if key in cache:
+            # None di cache = gambar yang sebelumnya gagal; tidak dicoba ulang selama isinya sama
+            results[image_path] = cache[key]
+            new_cache[key] = cache[key]
+        else:
+            pending.append((person_name, image_path, key))
+
+    total_cached = len(jobs) - len(pending)
+    print(f"[INFO] {len(jobs)} gambar ditemukan: {total_cached} dari cache, {len(pending)} perlu di-embed.")
+
+    # 2. Embed gambar baru/berubah, tersebar ke beberapa proses
+    detector_counts = {}
+    start = time.perf_counter()
+    if pending:
+        paths = [image_path for _, image_path, _ in pending]
+        workers = max(1, min(workers, len(pending)))
+        if workers > 1:
+            print(f"[INFO] Menggunakan {workers} proses worker.")
+            intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+            pool = ProcessPoolExecutor(
+                max_workers=workers,
+                # spawn: TensorFlow tidak aman di-fork setelah diinisialisasi
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(intra_op_threads,)
+            )
+            outputs = pool.map(create_embedding, paths, chunksize=max(1, min(8, len(paths) // (workers * 4))))
+        else:
+            pool = None
+            build_models()
+            outputs = map(create_embedding, paths)
+
+        report_every = max(1, len(pending) // 20)
+        try:
+            for done, ((person_name, image_path, key), (embedding, detector, error)) in enumerate(zip(pending, outputs), start=1):
+                results[image_path] = embedding
+                if error is None:
+                    new_cache[key] = embedding
+                if detector:
+                    detector_counts[detector] = detector_counts.get(detector, 0) + 1
+                if done % report_every == 0 or done == len(pending):
+                    elapsed = time.perf_counter() - start
+                    print(f"[PROGRESS] {done}/{len(pending)} ({done / len(pending) * 100:.1f}%) - {done / elapsed:.2f} gambar/detik")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            # Simpan cache walaupun proses terhenti di tengah jalan
+            save_embedding_cache(new_cache)
+    else:
+        save_embedding_cache(new_cache)
+    elapsed = time.perf_counter() - start
+
+    # 3. Hitung rata-rata embedding per mahasiswa (urutan tetap sesuai daftar mahasiswa)
+    master_data = []
+    per_person = {}
+    for person_name, image_path in jobs:
+        per_person.setdefault(person_name, []).append(results[image_path])
+
+    total_failed = 0
+    for person_name, embeddings in per_person.items():
+        person_embeddings = [e for e in embeddings if e is not None]
+        failed_images = len(embeddings) - len(person_embeddings)
+        total_failed += failed_images
         
         if not person_embeddings:
             print(f"  [ERROR] Tidak ada embedding yang bisa dibuat untuk {person_name}.")
@@ -141,23 +253,36 @@ def generate_master_embeddings_improved():
         
         # Hitung rata-rata dari semua embedding untuk orang ini
         master_embedding = np.mean(person_embeddings, axis=0)
+        master_data.append({"name": person_name, "embedding": master_embedding, "student_id": student_ids[person_name]})
         
-        face_data = {"name": person_name, "embedding": master_embedding}
-        master_data.append(face_data)
-        
-        success_rate = (successful_images / len(image_files)) * 100
-        print(f"  -> Master embedding untuk '{person_name}' berhasil dibuat.")
-        print(f"     Tingkat keberhasilan: {successful_images}/{len(image_files)} ({success_rate:.1f}%)")
+        if failed_images:
+            success_rate = (len(person_embeddings) / len(embeddings)) * 100
+            print(f"  -> {person_name}: {len(person_embeddings)}/{len(embeddings)} gambar berhasil ({success_rate:.1f}%)")
 
+    total_processed = len(jobs)
     print(f"\n[SUMMARY]")
-    print(f"Total gambar diproses: {total_processed}")
+    print(f"Total gambar: {total_processed} (dari cache: {total_cached}, di-embed: {len(pending)})")
     print(f"Total gambar gagal: {total_failed}")
+    print(f"Mahasiswa dilewati (folder tidak ada): {skipped_people}")
     print(f"Tingkat keberhasilan keseluruhan: {((total_processed - total_failed) / total_processed * 100):.1f}%")
+    if pending:
+        print(f"Waktu embedding: {elapsed:.1f} detik ({len(pending) / elapsed:.2f} gambar/detik)")
+        print(f"Detector yang berhasil: {detector_counts}")
     print(f"Total master embeddings dibuat: {len(master_data)}")
     
-    print(f"\n[INFO] Menyimpan {len(master_data)} master embedding ke file '{EMBEDDINGS_FILE}'...")
-    with open(EMBEDDINGS_FILE, "wb") as f:
-        pickle.dump(master_data, f)
+    if not master_data:
+        print("[ERROR] Tidak ada master embedding yang bisa disimpan.")
+        return
+
+    print(f"\n[INFO] Menyimpan {len(master_data)} master embedding ke '{EMBEDDINGS_MANIFEST}'...")
+    manifest = save_store(
+        names=[d["name"] for d in master_data],
+        embeddings=np.vstack([d["embedding"] for d in master_data]),
+        model_name=MODEL_NAME,
+        student_ids=[d["student_id"] for d in master_data],
+        manifest_path=EMBEDDINGS_MANIFEST
+    )
+    print(f"[INFO] Matriks {manifest['count']}x{manifest['dimension']} float32 disimpan ke '{manifest['matrix_file']}' ({manifest['checksum'][:19]}...)")
     
     print("✅ Proses selesai!")
 
@@ -165,6 +290,7 @@ def analyze_failed_images():
     """
     Fungsi untuk menganalisis gambar yang gagal
     """
+    from app import app
     print("\n[INFO] Menganalisis gambar yang gagal...")
     
     with app.app_context():
@@ -191,13 +317,7 @@ def analyze_failed_images():
                 
                 # Coba deteksi wajah
                 try:
-                    DeepFace.represent(
-                        img_path=image_path, 
-                        model_name=MODEL_NAME,
-                        detector_backend=DETECTOR_BACKEND,
-                        enforce_detection=True,
-                        align=True
-                    )
+                    detect_face(image_path, DETECTOR_BACKEND)
                     status = "✅ OK"
                 except:
                     status = "❌ FAILED"
@@ -209,9 +329,9 @@ def analyze_failed_images():
                 print(f"❌ {person_name}/{filename} - Error: {e}")
 
 if __name__ == '__main__':
-    import sys
-    
     if len(sys.argv) > 1 and sys.argv[1] == "analyze":
         analyze_failed_images()
+    elif len(sys.argv) > 2 and sys.argv[1] == "--workers":
+        generate_master_embeddings_improved(workers=int(sys.argv[2]))
     else:
         generate_master_embeddings_improved()
\ No newline at end of file
@@ -0,0 +1,156 @@
+# embedding_index.py
+import numpy as np
+from app_logging import get_logger
+
+log = get_logger("embedding_index")
+
+
+def l2_normalize_rows(matrix):
+    """
+    Normalisasi setiap baris matriks ke panjang 1 (baris nol dibiarkan nol)
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingIndex:
+    """
+    Indeks master embedding berbentuk matriks float32 yang kontigu dan sudah
+    dinormalisasi, ditambah array nama yang sejajar dengan baris matriks.
+    Dengan begitu cosine similarity ke semua mahasiswa cukup dihitung dengan
+    satu perkalian matriks-vektor.
+    """
+
+    def __init__(self, matrix, names, student_ids=None, version=None):
+        # matrix boleh berupa np.memmap read-only (lihat embedding_store.py)
+        self.matrix = matrix
+        self.names = names
+        self.student_ids = list(student_ids) if student_ids is not None else [None] * len(names)
+        # Indeks diperlakukan immutable; versi diisi loader dan ikut di setiap respons
+        self.version = version
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 0), dtype=np.float32), np.array([], dtype=object))
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Bangun indeks dari format lama master_embeddings.pkl (list of dict
+        {'name': ..., 'embedding': ...}). Data yang tidak valid dilewati.
+        """
+        names = []
+        vectors = []
+        dimension = None
+
+        for i, data in enumerate(records):
+            if not isinstance(data, dict) or 'name' not in data or 'embedding' not in data:
+                log.warning("Data embedding ke-%s tidak valid, dilewati.", i)
+                continue
+            if not isinstance(data['embedding'], (list, np.ndarray)):
+                log.warning("Embedding untuk %s tidak valid, dilewati.", data['name'])
+                continue
+
+            vector = np.asarray(data['embedding'], dtype=np.float32).ravel()
+            if dimension is None:
+                dimension = vector.shape[0]
+            elif vector.shape[0] != dimension:
+                log.warning("Dimensi embedding %s (%s) berbeda dari %s, dilewati.", data['name'], vector.shape[0], dimension)
+                continue
+
+            names.append(data['name'])
+            vectors.append(vector)
+
+        if not vectors:
+            return cls.empty()
+
+        matrix = np.ascontiguousarray(l2_normalize_rows(np.vstack(vectors)), dtype=np.float32)
+        return cls(matrix, np.array(names, dtype=object))
+
+    def resolve_student_ids(self, id_by_name):
+        """
+        Isi student_ids dari mapping {nama lowercase: id mahasiswa}.
+        Nama yang tidak terdaftar di database bernilai None.
+        Mengembalikan jumlah nama yang berhasil dipetakan.
+        """
+        self.student_ids = [id_by_name.get(str(name).lower()) for name in self.names]
+        return sum(student_id is not None for student_id in self.student_ids)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1] if len(self) else 0
+
+    def similarities(self, embedding):
+        """
+        Cosine similarity embedding terhadap seluruh master embedding
+        """
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        if query.shape[0] != self.dimension:
+            raise ValueError(f"Dimensi embedding {query.shape[0]} tidak cocok dengan indeks ({self.dimension})")
+
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(len(self), dtype=np.float32)
+        return self.matrix @ (query / norm)
+
+    def match(self, embedding, top_k=3):
+        """
+        Cari top-k mahasiswa yang paling mirip.
+        Mengembalikan dict berisi nama & similarity terbaik, margin antara
+        peringkat pertama dan kedua, serta daftar top-k.
+        """
+        if not len(self):
+            return self._empty_match()
+        return self._rank(self.similarities(embedding), top_k)
+
+    def match_batch(self, embeddings, top_k=3):
+        """
+        Versi batch dari match(): semua embedding dicocokkan dengan satu
+        perkalian matriks-matriks. Mengembalikan list hasil match per baris.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32)
+        if queries.ndim != 2 or not len(queries):
+            return []
+        if not len(self):
+            return [self._empty_match() for _ in range(len(queries))]
+        if queries.shape[1] != self.dimension:
+            raise ValueError(f"Dimensi embedding {queries.shape[1]} tidak cocok dengan indeks ({self.dimension})")
+
+        scores = l2_normalize_rows(queries) @ self.matrix.T
+        return [self._rank(row, top_k) for row in scores]
+
+    @staticmethod
+    def _empty_match():
+        return {"name": None, "student_id": None, "similarity": 0.0, "margin": 0.0, "top_k": []}
+
+    def _rank(self, scores, top_k):
+        k = max(1, min(top_k, len(self)))
+
+        # argpartition cukup O(N); hanya k kandidat yang diurutkan penuh
+        if k < len(self):
+            candidates = np.argpartition(scores, -k)[-k:]
+        else:
+            candidates = np.arange(len(self))
+        ranked = candidates[np.argsort(scores[candidates])[::-1]]
+
+        top = [{"name": self.names[i], "similarity": float(scores[i])} for i in ranked]
+        best = top[0]
+        best_id = self.student_ids[ranked[0]]
+        if len(self) > 1:
+            # margin selalu dihitung terhadap peringkat kedua, walaupun top_k=1
+            second = top[1]["similarity"] if len(top) > 1 else float(np.partition(scores, -2)[-2])
+            margin = best["similarity"] - second
+        else:
+            margin = best["similarity"]
+
+        return {
+            "name": best["name"],
+            "student_id": best_id,
+            "similarity": best["similarity"],
+            "margin": margin,
+            "top_k": top,
+        }
@@ -0,0 +1,110 @@
+# embedding_reloader.py
+import os
+import threading
+import time
+from app_logging import get_logger
+
+log = get_logger("embedding_reloader")
+
+
+class EmbeddingReloader:
+    """
+    Loader master embedding di background.
+
+    Thread ini memantau file embedding (mtime + ukuran) dan juga bisa dipicu
+    manual lewat trigger(). Indeks baru dibangun di thread ini, di luar jalur
+    request, lalu dipasang lewat swap_fn dengan satu assignment referensi.
+    Request yang sedang berjalan tetap memakai snapshot indeks lama.
+    """
+
+    def __init__(self, load_fn, swap_fn, watch_paths, interval=5.0):
+        self.load_fn = load_fn
+        self.swap_fn = swap_fn
+        self.watch_paths = list(watch_paths)
+        self.interval = interval
+        # Permintaan reload manual dihitung (bukan Event) di bawah _done, jadi
+        # trigger yang datang saat thread sedang bangun tidak pernah terhapus
+        self._done = threading.Condition()
+        self._requested = 0
+        self._handled = 0
+        self._attempts = 0
+        self._thread = None
+        self._signature = self._current_signature()
+        self.last_error = None
+        self.last_reload_at = None
+        self.last_reload_ms = None
+
+    def _current_signature(self):
+        signature = []
+        for path in self.watch_paths:
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="embedding-reloader", daemon=True)
+            self._thread.start()
+
+    def trigger(self):
+        """
+        Minta reload secepatnya. Mengembalikan nomor percobaan saat ini,
+        yang bisa dipakai untuk wait().
+        """
+        with self._done:
+            self._requested += 1
+            self._done.notify_all()
+            return self._attempts
+
+    def wait(self, since_attempt, timeout):
+        """
+        Tunggu sampai ada percobaan reload setelah `since_attempt`.
+        Mengembalikan True jika reload sudah dicoba dalam batas waktu.
+        """
+        with self._done:
+            return self._done.wait_for(lambda: self._attempts > since_attempt, timeout=timeout)
+
+    def reload_now(self):
+        """
+        Bangun indeks baru lalu pasang. Jika gagal, indeks lama tetap dipakai.
+        """
+        signature = self._current_signature()
+        t0 = time.perf_counter()
+        try:
+            new_index = self.load_fn()
+            self.swap_fn(new_index)
+            self.last_error = None
+            self.last_reload_at = time.time()
+            self.last_reload_ms = round((time.perf_counter() - t0) * 1000, 1)
+        except Exception as e:
+            self.last_error = str(e)
+            log.error("Reload master embedding gagal, indeks lama tetap dipakai: %s", e)
+        finally:
+            self._signature = signature
+            with self._done:
+                self._attempts += 1
+                self._done.notify_all()
+
+    def _run(self):
+        while True:
+            with self._done:
+                triggered = self._done.wait_for(lambda: self._requested > self._handled, timeout=self.interval)
+                # Semua permintaan sampai titik ini dilayani oleh satu reload
+                self._handled = self._requested
+            if triggered or self._current_signature() != self._signature:
+                if not triggered:
+                    log.info("Perubahan file master embedding terdeteksi, memuat ulang...")
+                self.reload_now()
+
+    def status(self):
+        return {
+            "watching": self._thread is not None,
+            "interval_s": self.interval,
+            "reload_attempts": self._attempts,
+            "last_reload_at": self.last_reload_at,
+            "last_reload_ms": self.last_reload_ms,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,143 @@
+# embedding_store.py
+import hashlib
+import json
+import os
+import pickle
+import sys
+from datetime import datetime
+import numpy as np
+from embedding_index import EmbeddingIndex, l2_normalize_rows
+
+# Format penyimpanan master embedding:
+#   master_embeddings.npy  -> matriks float32 (N, D), sudah dinormalisasi L2,
+#                             dibuka dengan mmap sehingga dibagi read-only antar worker
+#   master_embeddings.json -> manifest kecil: versi format, model, dimensi, checksum,
+#                             serta nama & id mahasiswa yang sejajar dengan baris matriks
+STORE_FORMAT_VERSION = 1
+DEFAULT_MANIFEST_FILE = "master_embeddings.json"
+
+
+class EmbeddingStoreError(ValueError):
+    """Store embedding tidak valid atau tidak cocok dengan konfigurasi server."""
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return f"sha256:{sha.hexdigest()}"
+
+
+def _write_atomic(path, write_fn):
+    # Tulis ke file sementara lalu os.replace: pembaca (termasuk worker yang masih
+    # memegang mmap file lama) tidak pernah melihat file setengah jadi
+    tmp_path = f"{path}.tmp"
+    write_fn(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def save_store(names, embeddings, model_name, student_ids=None,
+               manifest_path=DEFAULT_MANIFEST_FILE, matrix_path=None):
+    """
+    Simpan master embedding ke format store. Embedding dinormalisasi dan
+    dikonversi ke float32 sekali di sini supaya server tidak perlu menyalin lagi.
+    Mengembalikan manifest yang ditulis.
+    """
+    if matrix_path is None:
+        # master_embeddings.json -> master_embeddings.npy di folder yang sama
+        matrix_path = os.path.splitext(manifest_path)[0] + ".npy"
+
+    matrix = np.ascontiguousarray(l2_normalize_rows(np.asarray(embeddings, dtype=np.float32)), dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(names):
+        raise EmbeddingStoreError(f"Jumlah embedding ({matrix.shape[0]}) tidak sama dengan jumlah nama ({len(names)}).")
+    if student_ids is None:
+        student_ids = [None] * len(names)
+
+    # np.save ke file handle supaya nama file sementara tidak diberi akhiran .npy
+    def write_matrix(path):
+        with open(path, 'wb') as f:
+            np.save(f, matrix)
+    _write_atomic(matrix_path, write_matrix)
+
+    manifest = {
+        "format_version": STORE_FORMAT_VERSION,
+        "model_name": model_name,
+        "dimension": int(matrix.shape[1]),
+        "count": int(matrix.shape[0]),
+        "dtype": "float32",
+        "normalized": True,
+        "matrix_file": os.path.basename(matrix_path),
+        "checksum": file_checksum(matrix_path),
+        "created_at": datetime.now().isoformat(timespec='seconds'),
+        "names": [str(name) for name in names],
+        "student_ids": [int(i) if i is not None else None for i in student_ids],
+    }
+
+    def write_manifest(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+    # Manifest ditulis terakhir: manifest baru selalu merujuk matriks yang sudah lengkap
+    _write_atomic(manifest_path, write_manifest)
+    return manifest
+
+
+def read_manifest(manifest_path=DEFAULT_MANIFEST_FILE):
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != STORE_FORMAT_VERSION:
+        raise EmbeddingStoreError(f"Versi format store {manifest.get('format_version')} tidak didukung.")
+    return manifest
+
+
+def load_store(manifest_path=DEFAULT_MANIFEST_FILE, model_name=None, verify_checksum=False):
+    """
+    Buka store sebagai EmbeddingIndex. Matriks dibuka dengan mmap read-only,
+    jadi pemuatan hampir instan dan tidak ada salinan di heap worker.
+    Mengembalikan (index, manifest).
+    """
+    manifest = read_manifest(manifest_path)
+    if model_name and manifest["model_name"] != model_name:
+        raise EmbeddingStoreError(f"Store dibuat dengan model {manifest['model_name']}, server memakai {model_name}.")
+
+    matrix_path = os.path.join(os.path.dirname(manifest_path), manifest["matrix_file"])
+    if verify_checksum and file_checksum(matrix_path) != manifest["checksum"]:
+        raise EmbeddingStoreError(f"Checksum '{matrix_path}' tidak cocok dengan manifest.")
+
+    matrix = np.load(matrix_path, mmap_mode='r')
+    expected_shape = (manifest["count"], manifest["dimension"])
+    if matrix.shape != expected_shape or matrix.dtype != np.float32:
+        raise EmbeddingStoreError(f"Matriks {matrix.shape}/{matrix.dtype} tidak cocok dengan manifest {expected_shape}/float32.")
+    if len(manifest["names"]) != manifest["count"]:
+        raise EmbeddingStoreError("Jumlah nama di manifest tidak sama dengan jumlah baris matriks.")
+
+    index = EmbeddingIndex(matrix, np.array(manifest["names"], dtype=object), student_ids=manifest.get("student_ids"))
+    return index, manifest
+
+
+def convert_pickle(pickle_path, model_name, manifest_path=DEFAULT_MANIFEST_FILE):
+    """
+    Konversi master_embeddings.pkl format lama (list of dict) ke format store
+    """
+    with open(pickle_path, 'rb') as f:
+        records = pickle.load(f)
+    index = EmbeddingIndex.from_records(records)
+    if not len(index):
+        raise EmbeddingStoreError(f"Tidak ada embedding valid di '{pickle_path}'.")
+    return save_store(list(index.names), index.matrix, model_name, manifest_path=manifest_path)
+
+
+if __name__ == '__main__':
+    # python embedding_store.py convert [master_embeddings.pkl] [VGG-Face]
+    # python embedding_store.py verify [master_embeddings.json]
+    if len(sys.argv) > 1 and sys.argv[1] == "convert":
+        source = sys.argv[2] if len(sys.argv) > 2 else "master_embeddings.pkl"
+        model = sys.argv[3] if len(sys.argv) > 3 else "VGG-Face"
+        result = convert_pickle(source, model)
+        print(f"✅ {result['count']} embedding (dimensi {result['dimension']}) dikonversi ke '{DEFAULT_MANIFEST_FILE}' + '{result['matrix_file']}'.")
+    elif len(sys.argv) > 1 and sys.argv[1] == "verify":
+        path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_MANIFEST_FILE
+        index, manifest = load_store(path, verify_checksum=True)
+        print(f"✅ Store valid: {len(index)} embedding, model {manifest['model_name']}, {manifest['checksum']}")
+    else:
+        print("Penggunaan: python embedding_store.py convert [file.pkl] [model] | verify [manifest.json]")
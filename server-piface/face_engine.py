@@ -0,0 +1,280 @@
+# face_engine.py
+import threading
+import time
+import numpy as np
+from deepface import DeepFace
+from deepface.modules import preprocessing
+from embedding_index import l2_normalize_rows
+from app_logging import get_logger
+from metrics import DETECTOR_ATTEMPTS
+
+log = get_logger("face_engine")
+
+_models = {}
+_models_lock = threading.Lock()
+
+
+class FaceNotDetectedError(ValueError):
+    """Tidak ada detector yang menemukan wajah sebelum budget habis."""
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+def get_model(model_name):
+    """
+    Ambil model pengenalan wajah (dibangun sekali per proses)
+    """
+    with _models_lock:
+        if model_name not in _models:
+            _models[model_name] = DeepFace.build_model(model_name)
+        return _models[model_name]
+
+
+def detect_face(img, detector_backend, enforce_detection=True, align=True):
+    """
+    Jalankan HANYA tahap deteksi + alignment. Mengembalikan crop wajah
+    (RGB, float 0-1) dari wajah pertama yang ditemukan.
+    """
+    faces = DeepFace.extract_faces(
+        img_path=img,
+        detector_backend=detector_backend,
+        enforce_detection=enforce_detection,
+        align=align
+    )
+    return faces[0]["face"]
+
+
+def embed_faces(faces, model_name):
+    """
+    Buat embedding untuk satu atau lebih crop wajah dalam satu forward pass.
+    Preprocessing mengikuti DeepFace.represent; hasilnya dinormalisasi L2.
+    """
+    model = get_model(model_name)
+    target_size = model.input_shape
+    batch = np.concatenate([
+        # Sama seperti DeepFace.represent: balik urutan channel lalu resize + padding
+        preprocessing.resize_image(img=face[:, :, ::-1], target_size=(target_size[1], target_size[0]))
+        for face in faces
+    ])
+    batch = preprocessing.normalize_input(img=batch, normalization="base")
+
+    if hasattr(model, "model") and callable(model.model):
+        embeddings = np.asarray(model.model(batch, training=False), dtype=np.float32)
+    else:
+        embeddings = np.asarray([model.forward(batch[i:i + 1]) for i in range(len(batch))], dtype=np.float32)
+    return l2_normalize_rows(embeddings)
+
+
+class DetectorCascade:
+    """
+    Cascade detector wajah yang adaptif.
+
+    Setiap detector dicatat jumlah percobaan, keberhasilan, dan rata-rata
+    latensinya (EWMA). Urutan percobaan disusun ulang berdasarkan perkiraan
+    biaya sampai berhasil (latensi / tingkat keberhasilan), dan cascade
+    berhenti begitu budget waktu per permintaan habis. Model embedding
+    hanya dijalankan sekali, setelah salah satu detector menemukan wajah.
+    """
+
+    def __init__(self, model_name, detectors, budget=2.0, allow_unenforced=True,
+                 ewma_alpha=0.2, detect_fn=detect_face, embed_fn=embed_faces):
+        self.model_name = model_name
+        self.detectors = list(detectors)
+        self.budget = budget
+        self.allow_unenforced = allow_unenforced
+        self.ewma_alpha = ewma_alpha
+        self.detect_fn = detect_fn
+        self.embed_fn = embed_fn
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {"attempts": 0, "successes": 0, "latency": None}
+            for name in self.detectors
+        }
+
+    def _expected_cost(self, name, position):
+        stats = self._stats[name]
+        # Detector yang belum pernah dicoba memakai latensi prior sesuai urutan konfigurasi
+        latency = stats["latency"] if stats["latency"] is not None else 0.1 * (position + 1)
+        # Laplace smoothing supaya satu kegagalan tidak langsung membuang detector
+        success_rate = (stats["successes"] + 1) / (stats["attempts"] + 2)
+        return latency / success_rate
+
+    def ordered_detectors(self):
+        with self._lock:
+            ranked = sorted(
+                enumerate(self.detectors),
+                key=lambda item: (self._expected_cost(item[1], item[0]), item[0])
+            )
+            return [name for _, name in ranked]
+
+    def _record(self, name, success, elapsed):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"attempts": 0, "successes": 0, "latency": None})
+            stats["attempts"] += 1
+            if success:
+                stats["successes"] += 1
+            if stats["latency"] is None:
+                stats["latency"] = elapsed
+            else:
+                stats["latency"] += self.ewma_alpha * (elapsed - stats["latency"])
+
+    def stats_snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for name, stats in self._stats.items():
+                snapshot[name] = {
+                    "attempts": stats["attempts"],
+                    "successes": stats["successes"],
+                    "success_rate": round(stats["successes"] / stats["attempts"], 3) if stats["attempts"] else None,
+                    "latency_ms": round(stats["latency"] * 1000, 1) if stats["latency"] is not None else None,
+                }
+        snapshot["order"] = self.ordered_detectors()
+        return snapshot
+
+    def detect(self, img, budget=None):
+        """
+        Jalankan cascade deteksi. Mengembalikan (face, report) dimana report
+        berisi detector yang berhasil, waktu yang terpakai, dan daftar percobaan.
+        """
+        budget = self.budget if budget is None else budget
+        start = time.perf_counter()
+        deadline = start + budget if budget else None
+        attempts = []
+        face = None
+        detector_used = None
+        backend = None
+        budget_exhausted = False
+
+        for name in self.ordered_detectors():
+            now = time.perf_counter()
+            if deadline is not None:
+                remaining = deadline - now
+                if remaining <= 0:
+                    budget_exhausted = True
+                    break
+                expected = self._stats[name]["latency"]
+                # Lewati detector yang rata-rata latensinya melebihi sisa budget,
+                # kecuali belum ada percobaan sama sekali pada permintaan ini
+                if attempts and expected is not None and expected > remaining:
+                    budget_exhausted = True
+                    attempts.append({"detector": name, "status": "skipped"})
+                    DETECTOR_ATTEMPTS.inc(detector=name, outcome="skipped")
+                    continue
+
+            t0 = time.perf_counter()
+            try:
+                face = self.detect_fn(img, name, enforce_detection=True)
+                success = True
+            except Exception as e:
+                log.debug("Detector %s gagal: %s", name, e)
+                success = False
+            elapsed = time.perf_counter() - t0
+            self._record(name, success, elapsed)
+            DETECTOR_ATTEMPTS.inc(detector=name, outcome="ok" if success else "failed")
+            attempts.append({"detector": name, "status": "ok" if success else "failed", "elapsed_ms": round(elapsed * 1000, 1)})
+
+            if success:
+                detector_used = backend = name
+                break
+
+        # Terakhir, deteksi tanpa enforce (lebih permisif) selama budget masih ada
+        if face is None and self.allow_unenforced and deadline is not None and time.perf_counter() >= deadline:
+            budget_exhausted = True
+        elif face is None and self.allow_unenforced:
+            name = self.detectors[0]
+            t0 = time.perf_counter()
+            try:
+                face = self.detect_fn(img, name, enforce_detection=False)
+                detector_used = f"{name} (enforce_detection=False)"
+                backend = name
+                status = "ok"
+            except Exception as e:
+                log.debug("Detector %s tanpa enforce_detection gagal: %s", name, e)
+                status = "failed"
+            DETECTOR_ATTEMPTS.inc(detector=name, outcome=f"unenforced_{status}")
+            attempts.append({"detector": name, "enforce_detection": False, "status": status,
+                             "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)})
+
+        elapsed = time.perf_counter() - start
+        report = {
+            "detector": detector_used,
+            "backend": backend,
+            "elapsed_s": elapsed,  # Durasi mentah untuk metrik; respons JSON memakai elapsed_ms
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "budget_ms": round(budget * 1000, 1) if budget else None,
+            "budget_used": round(elapsed / budget, 3) if budget else None,
+            # True jika ada detector yang dilewati/tidak sempat dicoba karena budget habis
+            "budget_exhausted": budget_exhausted,
+            "attempts": attempts,
+        }
+
+        if face is None:
+            raise FaceNotDetectedError("Wajah tidak terdeteksi oleh semua detector dalam budget waktu.", report)
+        return face, report
+
+    def skip(self, img, client_detection=None):
+        """
+        Gambar sudah berupa crop wajah yang disejajarkan klien: lewati seluruh
+        cascade (detector_backend="skip"). Mengembalikan (face, report) dengan
+        bentuk report yang sama seperti detect().
+        """
+        t0 = time.perf_counter()
+        face = self.detect_fn(img, "skip", enforce_detection=False, align=False)
+        DETECTOR_ATTEMPTS.inc(detector="skip", outcome="ok")
+        elapsed = time.perf_counter() - t0
+        return face, {
+            "detector": "skip",
+            "backend": "skip",
+            "elapsed_s": elapsed,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "budget_ms": None,
+            "budget_used": None,
+            "budget_exhausted": False,
+            "attempts": [],
+            "client_detection": client_detection,
+        }
+
+    def represent(self, img, budget=None):
+        """
+        Deteksi wajah dengan cascade lalu buat embedding-nya.
+        Mengembalikan (embedding, report).
+        """
+        face, report = self.detect(img, budget=budget)
+        embedding = self.embed_fn([face], self.model_name)[0]
+        return embedding, report
+
+
+def build_detector(detector_backend):
+    """
+    Bangun (dan cache di dalam DeepFace) model detector wajah
+    """
+    return DeepFace.build_model(model_name=detector_backend, task="face_detector")
+
+
+def warm_up(model_name, detectors, timings):
+    """
+    Bangun model pengenalan dan semua detector, lalu jalankan satu inferensi
+    dummy supaya graph TensorFlow sudah siap sebelum permintaan pertama.
+    Durasi tiap tahap (ms) dicatat ke dict `timings`.
+    Mengembalikan dimensi embedding model.
+    """
+    def timed(stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        timings[stage] = round((time.perf_counter() - t0) * 1000, 1)
+        return result
+
+    timed(f"build_model:{model_name}", get_model, model_name)
+    for detector in detectors:
+        timed(f"build_detector:{detector}", build_detector, detector)
+
+    dummy = np.zeros((224, 224, 3), dtype=np.uint8)
+    for detector in detectors:
+        # enforce_detection=False supaya gambar kosong tetap melewati seluruh graph detector
+        timed(f"warmup_detector:{detector}", detect_face, dummy, detector, enforce_detection=False)
+
+    face = np.zeros((224, 224, 3), dtype=np.float32)
+    embedding = timed("warmup_inference", embed_faces, [face], model_name)
+    return embedding.shape[1]
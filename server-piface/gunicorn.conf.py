@@ -0,0 +1,25 @@
+# gunicorn.conf.py
+#
+# Dibaca otomatis oleh `gunicorn app:app` dari folder server-piface.
+# Long-poll (/api/status_sesi?wait=N, /api/jobs/<id>?wait=N) dan SSE
+# (/api/log_absen_stream, /api/jobs/<id>/stream) menahan satu thread per
+# perangkat/browser selama menunggu. Dengan worker "sync" setiap klien itu
+# memakan satu proses penuh dan permintaan pengenalan bisa kehabisan worker,
+# jadi server memakai worker gthread: tiap proses punya banyak thread.
+import os
+
+bind = os.environ.get('PIFACE_BIND', '0.0.0.0:5000')
+worker_class = 'gthread'
+# Setiap proses memuat model sendiri (~0.5 GB untuk VGG-Face); tambah thread, bukan proses
+workers = int(os.environ.get('PIFACE_GUNICORN_WORKERS', '2'))
+# Cukup untuk semua perangkat yang long-poll + browser dashboard SSE + permintaan pengenalan
+threads = int(os.environ.get('PIFACE_GUNICORN_THREADS', '32'))
+# Melebihi batas long-poll terlama (STATUS_SESI_MAX_WAIT = 55 detik)
+timeout = 90
+graceful_timeout = 30
+keepalive = 75
+
+
+def post_worker_init(worker):
+    # app.py membaca ini untuk menonaktifkan long-poll jika dijalankan dengan `-k sync`
+    os.environ['PIFACE_WORKER_CLASS'] = type(worker).__name__
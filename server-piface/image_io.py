@@ -0,0 +1,55 @@
+# image_io.py
+import io
+import cv2
+import numpy as np
+from PIL import Image
+
+# Faktor reduksi yang didukung langsung oleh decoder OpenCV.
+# Untuk JPEG, reduksi dilakukan saat decode (skala DCT) sehingga jauh lebih murah
+# dibanding decode penuh lalu resize.
+_REDUCED_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+def read_image_size(data):
+    """
+    Baca dimensi (lebar, tinggi) dari header gambar tanpa decode piksel
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+def choose_decode_flag(width, height, max_side):
+    """
+    Pilih flag decode tereduksi terbesar yang sisi terpanjangnya masih >= max_side
+    """
+    longest = max(width, height)
+    for factor, flag in _REDUCED_FLAGS:
+        if longest // factor >= max_side:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def decode_image_bytes(data, max_side=None):
+    """
+    Decode bytes gambar menjadi array BGR (format yang sama dengan cv2.imread).
+    Jika max_side diisi dan gambar jauh lebih besar, decode dilakukan pada
+    resolusi tereduksi (1/2, 1/4, atau 1/8).
+    """
+    flag = cv2.IMREAD_COLOR
+    if max_side:
+        try:
+            width, height = read_image_size(data)
+            flag = choose_decode_flag(width, height, max_side)
+        except Exception:
+            # Header tidak terbaca oleh PIL, biarkan OpenCV yang mencoba decode penuh
+            pass
+
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if img is None:
+        raise ValueError("Gambar tidak dapat didecode.")
+    return img
+
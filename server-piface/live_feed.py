@@ -0,0 +1,64 @@
+# live_feed.py
+import threading
+import time
+
+
+def feed_entry(log_id, nama_mahasiswa, waktu_absen):
+    """
+    Bentuk satu baris log absensi untuk dashboard (sama dengan /api/log_absen_terkini)
+    """
+    return {
+        "id": log_id,
+        "nama_mahasiswa": nama_mahasiswa,
+        "waktu_absen": waktu_absen.strftime('%H:%M:%S')
+    }
+
+
+class AttendanceFeed:
+    """
+    Sinyal "ada log baru" per sesi untuk feed dashboard.
+
+    Feed ini tidak menyimpan isi log: setiap commit LogAbsensi hanya menaikkan
+    nomor versi sesi, sehingga stream SSE yang sedang menunggu langsung
+    membaca ulang database dengan cursor (id > since_id). Data selalu diambil
+    dari database supaya urutan commit antar thread tidak bisa membuat log
+    dengan id lebih kecil terlewat oleh cursor klien.
+
+    Sinyal ini hanya berlaku di dalam satu proses. Log yang di-commit oleh
+    worker lain tidak membangunkan penunggu di sini, jadi pemanggil tetap
+    harus membaca database secara berkala (wait_for dengan timeout pendek).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._versions = {}
+
+    def close(self, sesi_id):
+        with self._cond:
+            self._versions.pop(sesi_id, None)
+            self._cond.notify_all()
+
+    def publish(self, sesi_id):
+        with self._cond:
+            self._versions[sesi_id] = self._versions.get(sesi_id, 0) + 1
+            self._cond.notify_all()
+
+    def version(self, sesi_id):
+        with self._cond:
+            return self._versions.get(sesi_id, 0)
+
+    def wait_for(self, sesi_id, version, timeout):
+        """
+        Tunggu sampai versi sesi berubah dari `version`, sesi ditutup, atau
+        timeout. Mengembalikan versi terakhir.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                current = self._versions.get(sesi_id, 0)
+                if current != version:
+                    return current
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return current
+                self._cond.wait(remaining)
@@ -0,0 +1,31 @@
+"""Unique absensi per sesi dan mahasiswa
+
+Revision ID: 4c1d2e7a9b10
+Revises: bef9ef838bf7
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1d2e7a9b10'
+down_revision = 'bef9ef838bf7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Hapus log ganda dari race check-then-insert lama, simpan yang pertama tercatat
+    op.execute(
+        "DELETE FROM log_absensi WHERE id NOT IN ("
+        "SELECT MIN(id) FROM log_absensi GROUP BY sesi_id, mahasiswa_id)"
+    )
+    with op.batch_alter_table('log_absensi', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_log_absensi_sesi_mahasiswa', ['sesi_id', 'mahasiswa_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('log_absensi', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_log_absensi_sesi_mahasiswa', type_='unique')
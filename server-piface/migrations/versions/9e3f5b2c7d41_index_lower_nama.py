@@ -0,0 +1,27 @@
+"""Index lower(nama) untuk dosen dan mahasiswa
+
+Revision ID: 9e3f5b2c7d41
+Revises: 4c1d2e7a9b10
+Create Date: 2026-10-18 10:05:12.530871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3f5b2c7d41'
+down_revision = '4c1d2e7a9b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Index fungsional: filter lower(nama) = ? tidak bisa memakai unique index pada kolom nama
+    op.create_index('ix_dosen_nama_dosen_lower', 'dosen', [sa.text('lower(nama_dosen)')])
+    op.create_index('ix_mahasiswa_nama_mahasiswa_lower', 'mahasiswa', [sa.text('lower(nama_mahasiswa)')])
+
+
+def downgrade():
+    op.drop_index('ix_mahasiswa_nama_mahasiswa_lower', table_name='mahasiswa')
+    op.drop_index('ix_dosen_nama_dosen_lower', table_name='dosen')
@@ -0,0 +1,42 @@
+"""Ruangan untuk sesi perkuliahan, satu sesi aktif per ruangan
+
+Revision ID: b7a4c0d91e26
+Revises: 9e3f5b2c7d41
+Create Date: 2026-10-18 11:20:47.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7a4c0d91e26'
+down_revision = '9e3f5b2c7d41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sesi_perkuliahan', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ruangan', sa.String(length=50), nullable=False, server_default='default'))
+
+    # Sebelumnya sesi aktif hanya disimpan di memori server, jadi baris dengan
+    # waktu_selesai NULL adalah sisa sesi yang tidak pernah diakhiri (atau server
+    # crash). Tutup semuanya supaya perangkat tidak mencatat absensi ke sesi lama;
+    # dosen memulai sesi baru setelah deploy.
+    op.execute(
+        "UPDATE sesi_perkuliahan SET waktu_selesai = waktu_mulai "
+        "WHERE waktu_selesai IS NULL"
+    )
+
+    op.create_index(
+        'uq_sesi_aktif_per_ruangan', 'sesi_perkuliahan', ['ruangan'], unique=True,
+        postgresql_where=sa.text('waktu_selesai IS NULL'),
+        sqlite_where=sa.text('waktu_selesai IS NULL')
+    )
+
+
+def downgrade():
+    op.drop_index('uq_sesi_aktif_per_ruangan', table_name='sesi_perkuliahan')
+    with op.batch_alter_table('sesi_perkuliahan', schema=None) as batch_op:
+        batch_op.drop_column('ruangan')
@@ -0,0 +1,42 @@
+"""Tabel status dan hasil job pengenalan asinkron
+
+Revision ID: d3e8a1f5c602
+Revises: b7a4c0d91e26
+Create Date: 2026-10-18 14:05:12.384920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3e8a1f5c602'
+down_revision = 'b7a4c0d91e26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'recognition_job',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('status', sa.String(length=16), nullable=False),
+        sa.Column('submitted_at', sa.Float(), nullable=False),
+        sa.Column('started_at', sa.Float(), nullable=True),
+        sa.Column('finished_at', sa.Float(), nullable=True),
+        sa.Column('queue_wait_ms', sa.Float(), nullable=True),
+        sa.Column('status_code', sa.Integer(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('recognition_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_recognition_job_submitted_at'), ['submitted_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_recognition_job_finished_at'), ['finished_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('recognition_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_recognition_job_finished_at'))
+        batch_op.drop_index(batch_op.f('ix_recognition_job_submitted_at'))
+
+    op.drop_table('recognition_job')
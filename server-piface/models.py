@@ -38,16 +38,46 @@ class Jadwal(db.Model):
 
 class SesiPerkuliahan(db.Model):
     __tablename__ = 'sesi_perkuliahan'
+    # Sesi aktif = waktu_selesai NULL; hanya boleh ada satu sesi aktif per ruangan
+    __table_args__ = (
+        db.Index(
+            'uq_sesi_aktif_per_ruangan', 'ruangan', unique=True,
+            postgresql_where=db.text('waktu_selesai IS NULL'),
+            sqlite_where=db.text('waktu_selesai IS NULL')
+        ),
+    )
     id = db.Column(db.Integer, primary_key=True)
     jadwal_id = db.Column(db.Integer, db.ForeignKey('jadwal.id'), nullable=False)
     dosen_pengajar_id = db.Column(db.Integer, db.ForeignKey('dosen.id'), nullable=False)
     pertemuan_ke = db.Column(db.Integer, nullable=True)  # Dibuat nullable untuk fleksibilitas
     waktu_mulai = db.Column(db.DateTime, default=datetime.utcnow)
     waktu_selesai = db.Column(db.DateTime, nullable=True)
+    ruangan = db.Column(db.String(50), nullable=False, default='default', server_default='default')
 
 class LogAbsensi(db.Model):
     __tablename__ = 'log_absensi'
+    # Satu mahasiswa hanya bisa tercatat sekali per sesi (dijaga oleh database)
+    __table_args__ = (
+        db.UniqueConstraint('sesi_id', 'mahasiswa_id', name='uq_log_absensi_sesi_mahasiswa'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     sesi_id = db.Column(db.Integer, db.ForeignKey('sesi_perkuliahan.id'), nullable=False)
     mahasiswa_id = db.Column(db.Integer, db.ForeignKey('mahasiswa.id'), nullable=False)
     waktu_absen = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RecognitionJob(db.Model):
+    __tablename__ = 'recognition_job'
+    # Status & hasil job pengenalan asinkron; dibaca semua worker saat polling.
+    # Waktu disimpan sebagai epoch detik, sama dengan yang dikirim ke klien.
+    id = db.Column(db.String(32), primary_key=True)  # job_id (uuid4 hex)
+    status = db.Column(db.String(16), nullable=False)
+    submitted_at = db.Column(db.Float, nullable=False, index=True)
+    started_at = db.Column(db.Float, nullable=True)
+    finished_at = db.Column(db.Float, nullable=True, index=True)
+    queue_wait_ms = db.Column(db.Float, nullable=True)
+    status_code = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON
+
+# Index fungsional untuk pencarian nama case-insensitive (login: lower(nama) = ?)
+db.Index('ix_dosen_nama_dosen_lower', db.func.lower(Dosen.nama_dosen))
+db.Index('ix_mahasiswa_nama_mahasiswa_lower', db.func.lower(Mahasiswa.nama_mahasiswa))
@@ -0,0 +1,278 @@
+# recognition_jobs.py
+import json
+import queue
+import threading
+import time
+import uuid
+from sqlalchemy import and_, or_
+from app_logging import get_logger
+from metrics import registry as metrics_registry
+from models import db, RecognitionJob
+
+log = get_logger("recognition_jobs")
+
+JOB_QUEUE_DEPTH = metrics_registry.gauge(
+    "piface_job_queue_depth",
+    "Jumlah job pengenalan yang sedang menunggu di antrean."
+)
+JOB_QUEUE_WAIT = metrics_registry.histogram(
+    "piface_job_queue_wait_seconds",
+    "Waktu tunggu job di antrean sebelum diproses worker inferensi."
+)
+JOBS = metrics_registry.counter(
+    "piface_jobs_total",
+    "Jumlah job pengenalan asinkron per hasil (accepted, rejected, done, failed).",
+    ("outcome",)
+)
+
+
+class QueueFullError(RuntimeError):
+    """Antrean job penuh; klien sebaiknya mencoba lagi nanti."""
+
+
+class DatabaseJobStore:
+    """
+    Status dan hasil job di tabel recognition_job.
+
+    Job diproses oleh worker gunicorn yang menerimanya, tetapi polling dan
+    stream bisa mendarat di worker lain; lewat tabel ini semua worker bisa
+    menjawab. Dipanggil dari thread worker inferensi, jadi setiap operasi
+    berjalan di app context sendiri.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def save(self, job):
+        with self.app.app_context():
+            db.session.merge(RecognitionJob(
+                id=job["job_id"],
+                status=job["status"],
+                submitted_at=job["submitted_at"],
+                started_at=job["started_at"],
+                finished_at=job["finished_at"],
+                queue_wait_ms=job["queue_wait_ms"],
+                status_code=job["status_code"],
+                result=json.dumps(job["result"]) if job["result"] is not None else None,
+            ))
+            db.session.commit()
+
+    def get(self, job_id):
+        with self.app.app_context():
+            row = db.session.get(RecognitionJob, job_id)
+            if row is None:
+                return None
+            return {
+                "job_id": row.id,
+                "status": row.status,
+                "submitted_at": row.submitted_at,
+                "started_at": row.started_at,
+                "finished_at": row.finished_at,
+                "queue_wait_ms": row.queue_wait_ms,
+                "status_code": row.status_code,
+                "result": json.loads(row.result) if row.result is not None else None,
+            }
+
+    def delete(self, job_id):
+        with self.app.app_context():
+            RecognitionJob.query.filter_by(id=job_id).delete()
+            db.session.commit()
+
+    def prune(self, cutoff):
+        """
+        Hapus job yang selesai sebelum `cutoff`, juga job yang belum selesai
+        sejak sebelum `cutoff` (worker yang memegangnya mati/restart).
+        """
+        with self.app.app_context():
+            RecognitionJob.query.filter(or_(
+                RecognitionJob.finished_at < cutoff,
+                and_(RecognitionJob.finished_at.is_(None), RecognitionJob.submitted_at < cutoff)
+            )).delete(synchronize_session=False)
+            db.session.commit()
+
+
+class RecognitionJobQueue:
+    """
+    Antrean job pengenalan wajah dengan pool worker inferensi yang terbatas.
+
+    Endpoint hanya memvalidasi dan memasukkan gambar ke antrean (bounded),
+    sehingga thread request langsung bebas lagi. Worker menjalankan
+    `process_fn(job)` dan menyimpan hasilnya selama `result_ttl` detik untuk
+    diambil lewat polling atau stream.
+
+    Dengan `store` (mis. DatabaseJobStore) setiap perubahan status juga
+    disimpan di luar proses, sehingga job yang diterima worker lain tetap bisa
+    dibaca; penunggunya membaca store setiap `poll_interval` detik. Job milik
+    proses ini tetap dilayani dari memori dan membangunkan penunggu seketika.
+    """
+
+    def __init__(self, process_fn, workers=2, max_queue=64, result_ttl=300, store=None, poll_interval=0.5):
+        self.process_fn = process_fn
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.store = store
+        self.poll_interval = poll_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self._threads = []
+        self._started = False
+
+    def start(self):
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"recognition-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def submit(self, **payload):
+        """
+        Masukkan job ke antrean. Melempar QueueFullError jika antrean penuh.
+        Mengembalikan salinan info job (tanpa payload).
+        """
+        self.start()
+        self._prune()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "queue_wait_ms": None,
+            "status_code": None,
+            "result": None,
+            "payload": payload,
+        }
+        with self._cond:
+            self._jobs[job["job_id"]] = job
+            snapshot = self._public(job)
+        # Simpan sebelum masuk antrean supaya status dari worker tidak tertimpa
+        self._persist(snapshot)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._cond:
+                self._jobs.pop(job["job_id"], None)
+            if self.store is not None:
+                self.store.delete(job["job_id"])
+            JOBS.inc(outcome="rejected")
+            raise QueueFullError(f"Antrean pengenalan penuh ({self.max_queue} job).")
+        JOBS.inc(outcome="accepted")
+        JOB_QUEUE_DEPTH.set(self.depth())
+        return self._public(job)
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job:
+                return self._public(job)
+        # Job bukan milik proses ini: mungkin diterima worker lain
+        return self.store.get(job_id) if self.store is not None else None
+
+    def wait(self, job_id, timeout):
+        """
+        Tunggu sampai job selesai atau timeout. Mengembalikan info job terakhir
+        (None jika job tidak dikenal).
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if job_id in self._jobs:
+                while True:
+                    job = self._jobs.get(job_id)
+                    if job is None or job["status"] == "done":
+                        return self._public(job) if job else None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return self._public(job)
+                    self._cond.wait(remaining)
+
+        if self.store is None:
+            return None
+        # Job milik worker lain: tidak ada notifikasi lintas proses, baca store berkala
+        while True:
+            job = self.store.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job["status"] == "done" or remaining <= 0:
+                return job
+            time.sleep(min(self.poll_interval, remaining))
+
+    def stats(self):
+        with self._cond:
+            running = sum(1 for job in self._jobs.values() if job["status"] == "running")
+            stored = len(self._jobs)
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queue_depth": self.depth(),
+            "running": running,
+            "stored_jobs": stored,
+        }
+
+    @staticmethod
+    def _public(job):
+        return {key: value for key, value in job.items() if key != "payload"}
+
+    def _persist(self, snapshot):
+        if self.store is None:
+            return
+        try:
+            self.store.save(snapshot)
+        except Exception as e:
+            # Job tetap berjalan; hanya polling dari worker lain yang tidak melihatnya
+            log.exception("Gagal menyimpan status job %s: %s", snapshot["job_id"], e)
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        with self._cond:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] is not None and job["finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store is not None:
+            try:
+                self.store.prune(cutoff)
+            except Exception as e:
+                log.warning("Gagal membersihkan job kedaluwarsa: %s", e)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            JOB_QUEUE_DEPTH.set(self.depth())
+            started = time.time()
+            wait = started - job["submitted_at"]
+            JOB_QUEUE_WAIT.observe(wait)
+            with self._cond:
+                job["status"] = "running"
+                job["started_at"] = started
+                job["queue_wait_ms"] = round(wait * 1000, 1)
+                snapshot = self._public(job)
+            self._persist(snapshot)
+            try:
+                status_code, result = self.process_fn(job)
+                outcome = "done"
+            except Exception as e:
+                log.exception("Job %s gagal: %s", job["job_id"], e)
+                status_code, result = 500, {"message": f"Error memproses gambar: {e}"}
+                outcome = "failed"
+            JOBS.inc(outcome=outcome)
+            with self._cond:
+                job.update({
+                    "status": "done",
+                    "finished_at": time.time(),
+                    "status_code": status_code,
+                    "result": result,
+                    "payload": None,  # bytes gambar tidak perlu disimpan setelah selesai
+                })
+                snapshot = self._public(job)
+            # Simpan dulu sebelum membangunkan penunggu lokal
+            self._persist(snapshot)
+            with self._cond:
+                self._cond.notify_all()
+            self._queue.task_done()
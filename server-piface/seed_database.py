@@ -1,4 +1,7 @@
 import os
+# Seeder hanya butuh akses database, tidak perlu warm-up model server
+os.environ.setdefault('PIFACE_PRELOAD_MODELS', '0')
+os.environ.setdefault('PIFACE_WATCH_EMBEDDINGS', '0')
 from app import app, db
 from models import Dosen, Mahasiswa, Matakuliah, Jadwal, SesiPerkuliahan, LogAbsensi
 from werkzeug.security import generate_password_hash
@@ -0,0 +1,167 @@
+# session_registry.py
+import threading
+import time
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from models import db, SesiPerkuliahan
+
+DEFAULT_RUANGAN = "default"
+
+
+class SessionConflictError(ValueError):
+    """Ruangan sudah punya sesi aktif."""
+
+
+def _session_info(sesi):
+    return {
+        "sesi_db_id": sesi.id,
+        "jadwal_id": sesi.jadwal_id,
+        "dosen_id": sesi.dosen_pengajar_id,
+        "pertemuan_ke": sesi.pertemuan_ke,
+        "ruangan": sesi.ruangan,
+    }
+
+
+class SessionRegistry:
+    """
+    Registry sesi aktif per ruangan/perangkat.
+
+    Sumber kebenarannya tabel sesi_perkuliahan: sesi aktif adalah baris dengan
+    waktu_selesai NULL, dan partial unique index menjamin satu sesi aktif per
+    ruangan walaupun server berjalan dengan beberapa worker. Setiap worker
+    menyimpan cache read-through dengan TTL pendek; perubahan dari worker ini
+    langsung meng-invalidate cache, perubahan dari worker lain terlihat paling
+    lambat setelah TTL habis.
+
+    Registry juga menyimpan cache id mahasiswa yang sudah absen per sesi. Cache
+    ini hanya optimasi; unique constraint di log_absensi tetap penentunya.
+
+    wait_for_change() dipakai long-poll klien: mulai/selesai sesi di worker ini
+    langsung membangunkan penunggu, perubahan dari worker lain terdeteksi saat
+    cache kedaluwarsa (paling lambat TTL).
+    """
+
+    def __init__(self, ttl=2.0):
+        self.ttl = ttl
+        self._lock = threading.Condition()
+        self._generation = 0
+        self._cache = {}
+        self._attended = {}
+
+    def _load(self, ruangan):
+        sesi = SesiPerkuliahan.query.filter_by(ruangan=ruangan, waktu_selesai=None).first()
+        return _session_info(sesi) if sesi else None
+
+    def get(self, ruangan=DEFAULT_RUANGAN):
+        """
+        Sesi aktif di ruangan (dict) atau None
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._cache.get(ruangan)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        info = self._load(ruangan)
+        with self._lock:
+            previous = self._cache.get(ruangan)
+            if previous and previous[1] and (not info or previous[1]["sesi_db_id"] != info["sesi_db_id"]):
+                # Sesi lama di ruangan ini sudah berakhir (mungkin di worker lain)
+                self._attended.pop(previous[1]["sesi_db_id"], None)
+            self._cache[ruangan] = (time.monotonic() + self.ttl, info)
+        return info
+
+    def invalidate(self, ruangan=None):
+        with self._lock:
+            if ruangan is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(ruangan, None)
+
+    def start(self, ruangan, jadwal_id, dosen_id, pertemuan_ke):
+        """
+        Mulai sesi baru di ruangan. Melempar SessionConflictError jika
+        ruangan masih punya sesi aktif.
+        """
+        sesi = SesiPerkuliahan(
+            jadwal_id=jadwal_id,
+            dosen_pengajar_id=dosen_id,
+            pertemuan_ke=pertemuan_ke,
+            ruangan=ruangan,
+            waktu_mulai=datetime.now()
+        )
+        db.session.add(sesi)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            self.invalidate(ruangan)
+            raise SessionConflictError(f"Ruangan '{ruangan}' masih memiliki sesi aktif.")
+        info = _session_info(sesi)
+        with self._lock:
+            self._cache[ruangan] = (time.monotonic() + self.ttl, info)
+            self._attended[info["sesi_db_id"]] = set()
+            self._changed()
+        return info
+
+    def finish(self, ruangan):
+        """
+        Akhiri sesi aktif di ruangan. Mengembalikan info sesi yang diakhiri atau None.
+        """
+        sesi = SesiPerkuliahan.query.filter_by(ruangan=ruangan, waktu_selesai=None).first()
+        if not sesi:
+            self.invalidate(ruangan)
+            return None
+        sesi.waktu_selesai = datetime.now()
+        db.session.commit()
+        info = _session_info(sesi)
+        with self._lock:
+            self._cache[ruangan] = (time.monotonic() + self.ttl, None)
+            self._attended.pop(info["sesi_db_id"], None)
+            self._changed()
+        return info
+
+    def _changed(self):
+        # Dipanggil dengan lock dipegang
+        self._generation += 1
+        self._lock.notify_all()
+
+    def wait_for_change(self, ruangan, sesi_id, timeout):
+        """
+        Tunggu sampai sesi aktif di ruangan bukan lagi `sesi_id` (None = tidak
+        ada sesi) atau timeout. Mengembalikan info sesi aktif terakhir.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                generation = self._generation
+            info = self.get(ruangan)
+            current = info["sesi_db_id"] if info else None
+            remaining = deadline - time.monotonic()
+            if current != sesi_id or remaining <= 0:
+                return info
+            # Jangan tahan koneksi database selama menunggu
+            db.session.remove()
+            with self._lock:
+                self._lock.wait_for(lambda: self._generation != generation, min(remaining, self.ttl))
+
+    def active_sessions(self, dosen_id=None):
+        """
+        Semua sesi aktif (langsung dari database), opsional milik satu dosen
+        """
+        query = SesiPerkuliahan.query.filter_by(waktu_selesai=None)
+        if dosen_id is not None:
+            query = query.filter_by(dosen_pengajar_id=dosen_id)
+        return [_session_info(sesi) for sesi in query.order_by(SesiPerkuliahan.id).all()]
+
+    def has_attended(self, sesi_id, mahasiswa_id):
+        with self._lock:
+            return mahasiswa_id in self._attended.get(sesi_id, ())
+
+    def mark_attended(self, sesi_id, mahasiswa_ids):
+        with self._lock:
+            self._attended.setdefault(sesi_id, set()).update(mahasiswa_ids)
+
+    def attended_snapshot(self, sesi_id):
+        with self._lock:
+            return sorted(self._attended.get(sesi_id, ()))